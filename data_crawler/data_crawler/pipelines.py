@@ -5,9 +5,54 @@
 
 
 # useful for handling different item types with a single interface
+import sys
+from pathlib import Path
+
 from itemadapter import ItemAdapter
+from scrapy.exceptions import DropItem
+
+# Shared near-duplicate detection from src/
+SRC_DIR = Path(__file__).resolve().parents[2] / "src"
+sys.path.insert(0, str(SRC_DIR))
+from dedup import NearDuplicateDetector
 
 
 class DataCrawlerPipeline:
     def process_item(self, item, spider):
         return item
+
+
+class NearDuplicatePipeline:
+    """
+    Drops items whose text is a near-duplicate of an earlier item's, e.g.
+    wiki copies ("Page+Copy") and pages that differ only in navigation
+
+    Compares the untruncated "body" field when the spider provides one, since
+    "text" may be cut to a preview that many distinct pages share.
+
+    Settings: DEDUP_THRESHOLD (estimated Jaccard, default 0.8)
+    """
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.detector = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings.getfloat("DEDUP_THRESHOLD", 0.8))
+
+    def open_spider(self, spider):
+        self.detector = NearDuplicateDetector(threshold=self.threshold)
+
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+        match = self.detector.check(adapter.get("url", ""), adapter.get("body") or adapter.get("text") or "")
+        if match is not None:
+            spider.crawler.stats.inc_value("dedup/dropped")
+            raise DropItem(f"near-duplicate of {match[0]} (similarity {match[1]:.2f})")
+        return item
+
+    def close_spider(self, spider):
+        report = self.detector.report
+        spider.crawler.stats.set_value("dedup/skipped_tokens", report.skipped_tokens)
+        spider.logger.info(report.summary())
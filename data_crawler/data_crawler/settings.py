@@ -58,9 +58,11 @@ DOWNLOAD_DELAY = 1
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
-#ITEM_PIPELINES = {
+ITEM_PIPELINES = {
 #    "data_crawler.pipelines.DataCrawlerPipeline": 300,
-#}
+    "data_crawler.pipelines.NearDuplicatePipeline": 100,
+}
+DEDUP_THRESHOLD = 0.8
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
@@ -22,7 +22,9 @@ class WikiSpider(scrapy.Spider):
         yield {
             "url": response.url,
             "title": title,
-            "text": text[:500]
+            "text": text[:500],
+            # Untruncated page text, for NearDuplicatePipeline
+            "body": text,
         }
 
         # Follow internal links
@@ -0,0 +1,248 @@
+"""
+Batched LLM-as-judge for the correctness metric.
+
+Instead of one judge call per row, BatchJudge grades up to batch_size
+(response, grading notes) pairs in a single structured-output call whose
+JSON schema forces one pass/fail verdict per item id. If a batch call fails
+or its output does not cover every item exactly once, the affected batch is
+graded row by row, so a bad batch never loses or misattributes verdicts.
+Single rows are graded with a one-verdict schema of the same kind, so a
+free-text reply ("**Pass**", "Result: pass") cannot be misread.
+
+Inside an async experiment, ascore() collects the rows that are waiting for
+a verdict and flushes them as one batch once batch_size rows are queued or
+max_wait_ms has passed since the first one.
+"""
+
+import asyncio
+import json
+import logging
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from cost_ledger import BudgetExceeded
+
+logger = logging.getLogger(__name__)
+
+VERDICTS = ("pass", "fail")
+DEFAULT_BATCH_SIZE = 10
+DEFAULT_MAX_WAIT_MS = 200.0
+
+JUDGE_INSTRUCTIONS = (
+    "Check if the response contains points mentioned from the grading notes and "
+    "return 'pass' or 'fail'."
+)
+
+BATCH_SYSTEM_PROMPT = (
+    "You grade several items independently. For every item: "
+    + JUDGE_INSTRUCTIONS
+    + " Return exactly one verdict per item id."
+)
+
+# (response, grading_notes) -> "pass" / "fail"
+ScoreFn = Callable[[str, str], str]
+
+_VERDICT_WORD = re.compile(r"\b(pass|fail)", re.IGNORECASE)
+
+
+def _batch_schema() -> Dict[str, Any]:
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "verdicts",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "verdicts": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "id": {"type": "integer"},
+                                "verdict": {"type": "string", "enum": list(VERDICTS)},
+                            },
+                            "required": ["id", "verdict"],
+                            "additionalProperties": False,
+                        },
+                    }
+                },
+                "required": ["verdicts"],
+                "additionalProperties": False,
+            },
+        },
+    }
+
+
+def _single_schema() -> Dict[str, Any]:
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "verdict",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {"verdict": {"type": "string", "enum": list(VERDICTS)}},
+                "required": ["verdict"],
+                "additionalProperties": False,
+            },
+        },
+    }
+
+
+def parse_verdict(content: str) -> str:
+    """
+    Verdict of a single-row reply: the schema's {"verdict": ...}, or, from a
+    model that ignored the schema, the first pass/fail word ("**Pass**",
+    "The response passes"); "fail" if there is none
+    """
+    try:
+        verdict = json.loads(content)["verdict"]
+    except (ValueError, TypeError, KeyError):
+        match = _VERDICT_WORD.search(content or "")
+        if match is None:
+            logger.warning(f"No verdict in judge reply {content[:80]!r}; counting it as fail")
+            return "fail"
+        return match.group(1).lower()
+    return verdict if verdict in VERDICTS else "fail"
+
+
+def parse_verdicts(content: str, num_items: int) -> List[str]:
+    """
+    Map a batch response back to item order
+
+    Raises:
+        ValueError: if the output is not valid JSON or does not hold exactly
+            one known verdict for each id 0..num_items-1
+    """
+    verdicts = json.loads(content)["verdicts"]
+    by_id: Dict[int, str] = {}
+    for entry in verdicts:
+        item_id, verdict = entry["id"], entry["verdict"]
+        if verdict not in VERDICTS:
+            raise ValueError(f"Unknown verdict {verdict!r} for item {item_id}")
+        if item_id in by_id:
+            raise ValueError(f"Duplicate verdict for item {item_id}")
+        by_id[item_id] = verdict
+    if sorted(by_id) != list(range(num_items)):
+        raise ValueError(f"Verdicts cover items {sorted(by_id)}, expected 0..{num_items - 1}")
+    return [by_id[i] for i in range(num_items)]
+
+
+class BatchJudge:
+    """Grades (response, grading notes) pairs in batches, with per-row fallback"""
+
+    def __init__(
+        self,
+        client,
+        model: str = "gpt-4o",
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+        fallback: Optional[ScoreFn] = None,
+    ):
+        """
+        Args:
+            client: OpenAI-style client (chat.completions.create)
+            model: Judge model
+            batch_size: Maximum pairs graded per call
+            max_wait_ms: How long ascore() waits for a batch to fill
+            fallback: Per-row scorer used when a batch cannot be parsed
+                (defaults to a single-item call of the same prompt)
+        """
+        self.client = client
+        self.model = model
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.fallback = fallback or self.score_one
+        self.calls = 0
+        self.fallback_rows = 0
+        self._stats_lock = threading.Lock()
+        self._pending: List[Tuple[str, str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    def _count(self, calls: int = 0, fallback_rows: int = 0) -> None:
+        with self._stats_lock:
+            self.calls += calls
+            self.fallback_rows += fallback_rows
+
+    def score_one(self, response: str, grading_notes: str) -> str:
+        """Grade a single pair (one call)"""
+        self._count(calls=1)
+        completion = self.client.chat.completions.create(
+            model=self.model,
+            response_format=_single_schema(),
+            messages=[
+                {
+                    "role": "user",
+                    "content": f"{JUDGE_INSTRUCTIONS}\nResponse: {response} Grading Notes: {grading_notes}",
+                }
+            ],
+        )
+        return parse_verdict(completion.choices[0].message.content)
+
+    def _grade_batch(self, pairs: Sequence[Tuple[str, str]]) -> List[str]:
+        items = [
+            {"id": i, "response": response, "grading_notes": notes}
+            for i, (response, notes) in enumerate(pairs)
+        ]
+        try:
+            self._count(calls=1)
+            completion = self.client.chat.completions.create(
+                model=self.model,
+                response_format=_batch_schema(),
+                messages=[
+                    {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+                    {"role": "user", "content": json.dumps({"items": items}, ensure_ascii=False)},
+                ],
+            )
+            return parse_verdicts(completion.choices[0].message.content, len(pairs))
+        except BudgetExceeded:
+            # Grading row by row would only spend more
+            raise
+        except Exception as e:
+            logger.warning(f"Batch judge failed for {len(pairs)} rows ({e}); scoring per row")
+            self._count(fallback_rows=len(pairs))
+            return [self.fallback(response, notes) for response, notes in pairs]
+
+    def grade(self, pairs: Sequence[Tuple[str, str]]) -> List[str]:
+        """Verdicts for all pairs, in order, batch_size pairs per call"""
+        verdicts: List[str] = []
+        for start in range(0, len(pairs), self.batch_size):
+            verdicts.extend(self._grade_batch(pairs[start : start + self.batch_size]))
+        return verdicts
+
+    async def ascore(self, response: str, grading_notes: str) -> str:
+        """Queue one pair for the next batch and wait for its verdict"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((response, grading_notes, future))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending[: self.batch_size], self._pending[self.batch_size :]
+        if self._pending:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        if batch:
+            asyncio.get_running_loop().create_task(self._resolve(batch))
+
+    async def _resolve(self, batch: List[Tuple[str, str, asyncio.Future]]) -> None:
+        try:
+            verdicts = await asyncio.to_thread(
+                self._grade_batch, [(response, notes) for response, notes, _ in batch]
+            )
+        except Exception as e:  # the fallback itself failed
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), verdict in zip(batch, verdicts):
+            if not future.done():
+                future.set_result(verdict)
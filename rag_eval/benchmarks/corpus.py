@@ -0,0 +1,72 @@
+"""
+Synthetic corpora for benchmarks.
+
+Documents are drawn from a Zipf-distributed vocabulary so term statistics
+look like natural text; queries are sampled from a document's own words, so
+each query has a known source document.
+"""
+
+import random
+from typing import List, Tuple
+
+CORPUS_SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000}
+
+
+def _vocabulary(size: int, rng: random.Random) -> List[str]:
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(letters) for _ in range(rng.randint(3, 10))))
+    return sorted(words)
+
+
+def make_corpus(
+    num_documents: int,
+    mean_words: int = 120,
+    vocabulary_size: int = 20_000,
+    seed: int = 0,
+) -> List[str]:
+    """Generate num_documents deterministic pseudo-text documents"""
+    rng = random.Random(seed)
+    vocabulary = _vocabulary(vocabulary_size, rng)
+    weights = [1.0 / rank for rank in range(1, vocabulary_size + 1)]
+    cumulative = []
+    total = 0.0
+    for w in weights:
+        total += w
+        cumulative.append(total)
+
+    documents = []
+    for _ in range(num_documents):
+        length = max(10, int(rng.gauss(mean_words, mean_words / 3)))
+        words = rng.choices(vocabulary, cum_weights=cumulative, k=length)
+        # Sentence breaks so passage splitting has something to work with
+        for i in range(12, len(words), 15):
+            words[i] += "."
+        documents.append(" ".join(words))
+    return documents
+
+
+def make_queries(
+    documents: List[str], num_queries: int, words_per_query: int = 5, seed: int = 1
+) -> List[Tuple[str, int]]:
+    """Sample (query, source_document_id) pairs from the corpus"""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(num_queries):
+        doc_id = rng.randrange(len(documents))
+        words = documents[doc_id].replace(".", "").split()
+        queries.append((" ".join(rng.sample(words, min(words_per_query, len(words)))), doc_id))
+    return queries
+
+
+def make_resume(sections: int = 5, seed: int = 0) -> str:
+    """A resume-shaped document for the chunking and graph extraction benchmarks"""
+    rng = random.Random(seed)
+    headings = ["Summary", "Experience", "Education", "Skills", "Projects"]
+    body = make_corpus(sections, mean_words=80, vocabulary_size=2_000, seed=seed)
+    parts = []
+    for i in range(sections):
+        parts.append(f"{headings[i % len(headings)]}\n{body[i]}")
+    rng.shuffle(parts)
+    return "\n\n".join(parts)
@@ -0,0 +1,174 @@
+"""
+Deterministic stand-ins for the OpenAI/AzureOpenAI clients.
+
+They implement the subset of the client surface the pipeline uses
+(chat.completions.create and embeddings.create), return objects shaped like
+the SDK's responses (including usage), and simulate network latency, so
+throughput can be measured without spending money or touching the network.
+"""
+
+import hashlib
+import math
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+_WORDS = (
+    "the model retrieves documents and answers questions about processors memory "
+    "graphs evaluation latency tokens context intel ragas pipeline index chunk"
+).split()
+
+
+class FakeUsage:
+    """Mimics openai.types.CompletionUsage / embedding usage"""
+
+    def __init__(self, prompt_tokens: int, completion_tokens: int = 0, cached_tokens: int = 0):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.total_tokens = prompt_tokens + completion_tokens
+        self.prompt_tokens_details = SimpleNamespace(cached_tokens=cached_tokens)
+
+    def model_dump(self) -> Dict[str, Any]:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+            "prompt_tokens_details": {"cached_tokens": self.prompt_tokens_details.cached_tokens},
+        }
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _seed_for(payload: str, seed: int) -> int:
+    digest = hashlib.blake2b(f"{seed}:{payload}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class _Latency:
+    """Sleeps for a normally distributed latency, floored at zero"""
+
+    def __init__(self, mean_ms: float, jitter_ms: float):
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+
+    def wait(self, rng: random.Random) -> None:
+        if self.mean_ms <= 0:
+            return
+        delay = max(0.0, rng.gauss(self.mean_ms, self.jitter_ms))
+        time.sleep(delay / 1000)
+
+
+class _FakeCompletions:
+    def __init__(self, owner: "FakeLLMClient"):
+        self._owner = owner
+
+    def create(self, model: str, messages: List[Dict[str, str]], **kwargs: Any):
+        return self._owner._complete(model, messages, kwargs)
+
+
+class FakeLLMClient:
+    """
+    Fake chat-completions client.
+
+    Response length (in words) is drawn from a log-normal distribution with
+    the given median; a responder callable can replace the generated text
+    (e.g. to return graph JSON for extraction benchmarks).
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        median_response_words: int = 60,
+        response_sigma: float = 0.5,
+        responder: Optional[Callable[[List[Dict[str, str]], Dict[str, Any]], str]] = None,
+        seed: int = 0,
+    ):
+        self.latency = _Latency(latency_ms, jitter_ms)
+        self.median_response_words = median_response_words
+        self.response_sigma = response_sigma
+        self.responder = responder
+        self.seed = seed
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=_FakeCompletions(self))
+
+    def _complete(self, model: str, messages: List[Dict[str, str]], kwargs: Dict[str, Any]):
+        prompt = "".join(m["content"] for m in messages)
+        rng = random.Random(_seed_for(prompt, self.seed))
+        with self._lock:
+            self.calls += 1
+
+        self.latency.wait(rng)
+
+        if self.responder is not None:
+            content = self.responder(messages, kwargs)
+        else:
+            words = max(1, int(rng.lognormvariate(math.log(self.median_response_words), self.response_sigma)))
+            content = " ".join(rng.choice(_WORDS) for _ in range(words))
+
+        return SimpleNamespace(
+            id=f"fake-{self.calls}",
+            model=model,
+            choices=[
+                SimpleNamespace(
+                    index=0,
+                    finish_reason="stop",
+                    message=SimpleNamespace(role="assistant", content=content),
+                )
+            ],
+            usage=FakeUsage(_estimate_tokens(prompt), _estimate_tokens(content)),
+        )
+
+
+class _FakeEmbeddings:
+    def __init__(self, owner: "FakeEmbeddingsClient"):
+        self._owner = owner
+
+    def create(self, model: str, input: Any, **kwargs: Any):
+        return self._owner._embed(model, input)
+
+
+class FakeEmbeddingsClient:
+    """
+    Fake embeddings client returning deterministic unit vectors.
+
+    Vectors are a hashed bag of words, so texts sharing words get similar
+    vectors and retrieval quality stays meaningful in benchmarks.
+    """
+
+    def __init__(self, dimensions: int = 1536, latency_ms: float = 0.0, jitter_ms: float = 0.0, seed: int = 0):
+        self.dimensions = dimensions
+        self.latency = _Latency(latency_ms, jitter_ms)
+        self.seed = seed
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.embeddings = _FakeEmbeddings(self)
+
+    def vector(self, text: str) -> List[float]:
+        values = [0.0] * self.dimensions
+        for word in text.lower().split():
+            h = _seed_for(word, self.seed)
+            values[h % self.dimensions] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in values)) or 1.0
+        return [v / norm for v in values]
+
+    def _embed(self, model: str, inputs: Any):
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        with self._lock:
+            self.calls += 1
+        self.latency.wait(random.Random(self.seed + self.calls))
+
+        return SimpleNamespace(
+            model=model,
+            data=[
+                SimpleNamespace(index=i, embedding=self.vector(text), object="embedding")
+                for i, text in enumerate(inputs)
+            ],
+            usage=FakeUsage(sum(_estimate_tokens(text) for text in inputs)),
+        )
@@ -0,0 +1,156 @@
+"""
+Import-time benchmark with a regression budget.
+
+Each module is imported in a fresh interpreter under `python -X importtime`;
+the cumulative time of the module itself is taken as its import cost (median
+of several runs), together with the slowest imports it pulled in. Modules
+whose median exceeds their budget in import_budget.json fail the run (exit
+code 1), so this can gate CI.
+
+Usage:
+    python benchmarks/import_time.py [--runs 5] [--budget benchmarks/import_budget.json]
+                                     [--update-budget] [--modules rag,evals]
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+RAG_EVAL_DIR = Path(__file__).resolve().parent.parent
+SRC_DIR = RAG_EVAL_DIR.parent / "src"
+DEFAULT_BUDGET = Path(__file__).resolve().parent / "import_budget.json"
+
+# Module name -> directory it is imported from
+MODULES = {
+    "rag": RAG_EVAL_DIR,
+    "evals": RAG_EVAL_DIR,
+    "service": RAG_EVAL_DIR,
+    "tracing": RAG_EVAL_DIR,
+    "trace_store": RAG_EVAL_DIR,
+    "context_budget": RAG_EVAL_DIR,
+    "graph_parse": SRC_DIR,
+    "test_resume": SRC_DIR,
+    "backend": SRC_DIR,
+    "kyaatestpage": SRC_DIR,
+}
+
+# Headroom applied when writing a budget from measurements
+BUDGET_HEADROOM = 1.5
+BUDGET_FLOOR_MS = 50.0
+
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """(module, self_us, cumulative_us, depth) for each line of -X importtime output"""
+    rows = []
+    for line in stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return rows
+
+
+def measure_once(module: str, directory: Path) -> Dict[str, Any]:
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([str(directory), str(RAG_EVAL_DIR)])}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=directory,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    rows = parse_importtime(proc.stderr)
+    if proc.returncode != 0:
+        error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed"
+        return {"error": error}
+
+    # Children are printed before their parent: the module's own imports are
+    # the rows between the previous top-level row and the module's row
+    end = max(i for i, row in enumerate(rows) if row[0] == module and row[3] == 0)
+    start = end
+    while start > 0 and rows[start - 1][3] > 0:
+        start -= 1
+    direct = sorted(
+        (row for row in rows[start:end] if row[3] == 1), key=lambda row: row[2], reverse=True
+    )
+    return {
+        "total_ms": rows[end][2] / 1000,
+        "slowest": [{"module": name, "cumulative_ms": cum / 1000} for name, _, cum, _ in direct[:5]],
+    }
+
+
+def measure(module: str, directory: Path, runs: int) -> Dict[str, Any]:
+    samples = [measure_once(module, directory) for _ in range(runs)]
+    errors = [s["error"] for s in samples if "error" in s]
+    if errors:
+        return {"module": module, "error": errors[0]}
+    totals = [s["total_ms"] for s in samples]
+    return {
+        "module": module,
+        "median_ms": round(statistics.median(totals), 1),
+        "min_ms": round(min(totals), 1),
+        "slowest_imports": samples[totals.index(min(totals))]["slowest"],
+    }
+
+
+def check(results: List[Dict[str, Any]], budget: Dict[str, float]) -> List[str]:
+    """Budget violations as messages"""
+    failures = []
+    for result in results:
+        limit = budget.get(result["module"])
+        if limit is None or "error" in result:
+            continue
+        if result["median_ms"] > limit:
+            failures.append(
+                f"{result['module']}: {result['median_ms']} ms exceeds budget of {limit} ms"
+            )
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=Path, default=DEFAULT_BUDGET)
+    parser.add_argument("--modules", help="Comma-separated subset of modules")
+    parser.add_argument(
+        "--update-budget",
+        action="store_true",
+        help=f"Write measured medians x{BUDGET_HEADROOM} as the new budget",
+    )
+    args = parser.parse_args()
+
+    names = args.modules.split(",") if args.modules else list(MODULES)
+    results = [measure(name, MODULES[name], args.runs) for name in names]
+
+    budget: Dict[str, float] = {}
+    if args.budget.exists():
+        budget = json.loads(args.budget.read_text())
+
+    if args.update_budget:
+        for result in results:
+            if "error" not in result:
+                budget[result["module"]] = round(
+                    max(result["median_ms"] * BUDGET_HEADROOM, BUDGET_FLOOR_MS), 1
+                )
+        args.budget.write_text(json.dumps(dict(sorted(budget.items())), indent=2) + "\n")
+
+    failures = check(results, budget)
+    print(json.dumps({"results": results, "budget": budget, "failures": failures}, indent=2))
+    for result in results:
+        if "error" in result:
+            print(f"Skipped {result['module']}: {result['error']}", file=sys.stderr)
+    if failures:
+        print("\n".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
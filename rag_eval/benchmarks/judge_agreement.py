@@ -0,0 +1,132 @@
+"""
+Agreement check: batched judge vs per-row judge on saved experiments.
+
+Every row of experiments/*.csv already carries the per-row correctness
+verdict ("score"). This re-grades the same (response, grading_notes) pairs
+with BatchJudge and reports how often the verdicts agree (raw agreement and
+Cohen's kappa), the confusion matrix and the number of judge calls. With
+--min-agreement it exits with code 1 below that rate, so it can gate a change
+to the batch prompt or size.
+
+--fake uses a deterministic keyword-overlap judge instead of the API, which
+checks the batching and verdict mapping offline (agreement is then with the
+fake judge, not gpt-4o).
+
+Usage:
+    python benchmarks/judge_agreement.py [--experiments experiments] [--batch-size 10]
+                                         [--limit 200] [--min-agreement 0.9] [--fake]
+"""
+
+import argparse
+import csv
+import json
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+RAG_EVAL_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAG_EVAL_DIR))
+
+from batch_judge import VERDICTS, BatchJudge
+from benchmarks.fakes import FakeLLMClient
+
+_WORD = re.compile(r"\w+")
+
+
+def load_rows(directory: Path, limit: int = 0) -> List[Dict[str, str]]:
+    """Graded rows (response, grading_notes, score) of all experiment CSVs"""
+    rows = []
+    for path in sorted(directory.glob("*.csv")):
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                if row.get("score") in VERDICTS and row.get("response"):
+                    rows.append({**row, "experiment": path.stem})
+    return rows[:limit] if limit else rows
+
+
+def _overlap_verdict(response: str, grading_notes: str) -> str:
+    notes = {w.lower() for w in _WORD.findall(grading_notes)}
+    words = {w.lower() for w in _WORD.findall(response)}
+    return "pass" if notes and len(notes & words) / len(notes) >= 0.5 else "fail"
+
+
+def _fake_judge_response(messages, kwargs) -> str:
+    if kwargs["response_format"]["json_schema"]["name"] == "verdicts":
+        items = json.loads(messages[-1]["content"])["items"]
+        verdicts = [
+            {"id": item["id"], "verdict": _overlap_verdict(item["response"], item["grading_notes"])}
+            for item in items
+        ]
+        return json.dumps({"verdicts": verdicts})
+    content = messages[-1]["content"]
+    response, _, notes = content.partition("Response: ")[2].partition(" Grading Notes: ")
+    return json.dumps({"verdict": _overlap_verdict(response, notes)})
+
+
+def agreement(expected: List[str], actual: List[str]) -> Dict[str, Any]:
+    """Raw agreement, Cohen's kappa and confusion counts for pass/fail labels"""
+    n = len(expected)
+    confusion = {f"{e}->{a}": 0 for e in VERDICTS for a in VERDICTS}
+    for e, a in zip(expected, actual):
+        confusion[f"{e}->{a}"] += 1
+    observed = sum(e == a for e, a in zip(expected, actual)) / n if n else 0.0
+    chance = sum(
+        (expected.count(v) / n) * (actual.count(v) / n) for v in VERDICTS
+    ) if n else 0.0
+    kappa = (observed - chance) / (1 - chance) if chance < 1 else 1.0
+    return {"rows": n, "agreement": round(observed, 4), "kappa": round(kappa, 4), "confusion": confusion}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched vs per-row judge agreement")
+    parser.add_argument("--experiments", type=Path, default=RAG_EVAL_DIR / "experiments")
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=0, help="Grade at most this many rows")
+    parser.add_argument("--min-agreement", type=float, default=0.0)
+    parser.add_argument("--fake", action="store_true", help="Offline keyword-overlap judge")
+    args = parser.parse_args()
+
+    rows = load_rows(args.experiments, args.limit)
+    if not rows:
+        sys.exit(f"No graded rows in {args.experiments}/*.csv")
+
+    if args.fake:
+        client = FakeLLMClient(responder=_fake_judge_response)
+    else:
+        from evals import get_openai_client
+
+        client = get_openai_client("judge")
+    judge = BatchJudge(client, batch_size=args.batch_size)
+
+    pairs: List[Tuple[str, str]] = [(row["response"], row["grading_notes"]) for row in rows]
+    t0 = time.perf_counter()
+    verdicts = judge.grade(pairs)
+    elapsed = time.perf_counter() - t0
+
+    report = agreement([row["score"] for row in rows], verdicts)
+    report.update(
+        {
+            "batch_size": args.batch_size,
+            "judge_calls": judge.calls,
+            "per_row_calls": len(rows),
+            "fallback_rows": judge.fallback_rows,
+            "seconds": round(elapsed, 2),
+            "disagreements": [
+                {"experiment": row["experiment"], "question": row["question"], "per_row": row["score"], "batch": v}
+                for row, v in zip(rows, verdicts)
+                if row["score"] != v
+            ][:20],
+        }
+    )
+    print(json.dumps(report, indent=2))
+    if report["agreement"] < args.min_agreement:
+        print(
+            f"Agreement {report['agreement']} is below {args.min_agreement}", file=sys.stderr
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Prompt layout benchmark: prompt tokens per query before and after the
+cacheable-prefix message layout.
+
+"Before" replays the original layout (the raw template as the system message
+and the formatted template again as the user message). "After" uses
+ExampleRAG.build_messages. For both, the shared prefix between consecutive
+requests is measured in tokens, since that is what the provider's prompt
+cache can reuse (OpenAI only caches prompts of 1024+ tokens).
+
+Usage:
+    python benchmarks/prompt_layout.py [--dataset CSV] [--documents DIR] [--top-k 3]
+"""
+
+import argparse
+import csv
+import json
+import os
+import statistics
+import tempfile
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from context_budget import count_tokens
+from rag import ExampleRAG
+
+LEGACY_SYSTEM_PROMPT = """Answer the following question based on the provided documents:
+                                Question: {query}
+                                Documents:
+                                {context}
+                                Answer:
+                            """
+
+# Per-message framing overhead of the chat format (role + separators)
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+PROVIDER_CACHE_MINIMUM = 1024
+
+
+def legacy_messages(query: str, context: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": LEGACY_SYSTEM_PROMPT},
+        {"role": "user", "content": LEGACY_SYSTEM_PROMPT.format(query=query, context=context)},
+    ]
+
+
+def render(messages: List[Dict[str, str]]) -> str:
+    """Messages serialized the way the chat format lays them out"""
+    return "".join(f"<|{m['role']}|>{m['content']}<|end|>" for m in messages)
+
+
+def prompt_tokens(messages: List[Dict[str, str]]) -> int:
+    return (
+        sum(count_tokens(m["content"]) + TOKENS_PER_MESSAGE for m in messages)
+        + TOKENS_PER_REPLY
+    )
+
+
+def shared_prefix_tokens(a: str, b: str) -> int:
+    return count_tokens(os.path.commonprefix([a, b]))
+
+
+def load_questions(dataset: Path) -> List[Dict[str, str]]:
+    with open(dataset, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def load_documents(folder: Path) -> List[str]:
+    return [p.read_text(encoding="utf-8") for p in sorted(folder.glob("*.txt"))]
+
+
+def run(rows: List[Dict[str, str]], documents: List[str], top_k: int) -> Dict:
+    rag = ExampleRAG(llm_client=None, logdir=tempfile.mkdtemp(prefix="rag_bench_"))
+    rag.set_documents(documents)
+
+    results = {}
+    for name, build in (("before", legacy_messages), ("after", rag.build_messages)):
+        totals, shared = [], []
+        previous = None
+        for row in rows:
+            query = row["question"]
+            retrieved = rag.retrieve_documents(query, top_k)
+            context = rag.context_assembler.assemble(query, retrieved).context
+            messages = build(query, context)
+
+            totals.append(prompt_tokens(messages))
+            rendered = render(messages)
+            if previous is not None:
+                shared.append(shared_prefix_tokens(previous, rendered))
+            previous = rendered
+
+        results[name] = {
+            "queries": len(totals),
+            "mean_prompt_tokens": round(statistics.mean(totals), 1),
+            "total_prompt_tokens": sum(totals),
+            "mean_shared_prefix_tokens": round(statistics.mean(shared), 1) if shared else 0,
+        }
+
+    before, after = results["before"], results["after"]
+    results["prompt_tokens_saved_per_query"] = round(
+        before["mean_prompt_tokens"] - after["mean_prompt_tokens"], 1
+    )
+    results["prefix_meets_cache_minimum"] = (
+        after["mean_shared_prefix_tokens"] >= PROVIDER_CACHE_MINIMUM
+    )
+    return results
+
+
+def main():
+    here = Path(__file__).resolve().parent.parent
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--dataset", type=Path, default=here / "datasets" / "generated_qa_dataset.csv")
+    parser.add_argument(
+        "--documents",
+        type=Path,
+        help="Folder of .txt documents (defaults to the dataset's grading notes as the corpus)",
+    )
+    parser.add_argument("--top-k", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = load_questions(args.dataset)
+    if args.documents:
+        documents = load_documents(args.documents)
+    else:
+        documents = [row["grading_notes"] for row in rows]
+
+    print(json.dumps(run(rows, documents, args.top_k), indent=2))
+
+
+if __name__ == "__main__":
+    main()
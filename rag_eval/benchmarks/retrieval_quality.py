@@ -0,0 +1,256 @@
+"""
+Offline retrieval-quality benchmark: no LLM for answering or grading.
+
+Ranks a set of questions with known relevant documents through every
+retriever implementation and reports recall@k, MRR and nDCG@k together with
+index build time, query latency and memory. Metrics are computed on the
+whole (queries x k) ranking matrix at once with numpy.
+
+Questions come from either
+  - a Q/A dataset CSV (datasets/generated_qa_dataset.csv) plus the directory
+    of its source documents (TXT/PDF/DOCX, read with the upload page's
+    extractor): relevant documents are those named in the row's
+    document_name column, or, for datasets saved before that column
+    existed, the document sharing the most words with the grading notes.
+    Rows whose document is missing are skipped and counted.
+  - a synthetic corpus (default), where each query is sampled from one
+    known document
+
+Embeddings come from FakeEmbeddingsClient (hashed bag of words), so the
+dense retriever is measured offline too. Each retriever runs in a fresh
+process so its peak RSS is its own.
+
+Usage:
+    python benchmarks/retrieval_quality.py [--size 1k] [--queries 200] [--k 1,3,5,10]
+    python benchmarks/retrieval_quality.py --dataset datasets/generated_qa_dataset.csv \\
+                                           --documents ../data [--output quality.json]
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+RAG_EVAL_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAG_EVAL_DIR))
+# src holds the upload page's text extractor
+sys.path.insert(0, str(RAG_EVAL_DIR.parent / "src"))
+
+from benchmarks.corpus import CORPUS_SIZES, make_corpus, make_queries
+from benchmarks.fakes import FakeEmbeddingsClient
+from benchmarks.run import peak_rss_mb, percentile
+from document_text import DOCUMENT_SUFFIXES, extract_text
+
+_WORD = re.compile(r"\w+")
+
+# "keyword.index" queries a saved and memory-mapped reloaded keyword index
+RETRIEVERS = ("keyword", "keyword.index", "embedding")
+
+
+def _make_retriever(name: str):
+    from rag import EmbeddingRetriever, SimpleKeywordRetriever
+
+    if name.startswith("keyword"):
+        return SimpleKeywordRetriever()
+    return EmbeddingRetriever(embedding_client=FakeEmbeddingsClient(dimensions=512))
+
+
+# --------------------------------------------------------------------------
+# Datasets: (documents, questions, relevant document ids per question,
+# number of dataset rows skipped)
+
+def synthetic_dataset(size: int, num_queries: int) -> Tuple[List[str], List[str], List[List[int]], int]:
+    documents = make_corpus(size)
+    queries = make_queries(documents, num_queries)
+    return documents, [q for q, _ in queries], [[doc_id] for _, doc_id in queries], 0
+
+
+def _words(text: str) -> set:
+    return {w.lower() for w in _WORD.findall(text)}
+
+
+def csv_dataset(
+    dataset_path: Path, documents_dir: Path, num_queries: int = 0
+) -> Tuple[List[str], List[str], List[List[int]], int]:
+    names, documents = [], []
+    for path in sorted(documents_dir.iterdir()):
+        text = extract_text(str(path)) if path.suffix in DOCUMENT_SUFFIXES else ""
+        # Like the upload page, documents without text are left out
+        if text.strip():
+            names.append(path.name)
+            documents.append(text)
+    if not names:
+        raise SystemExit(f"No {'/'.join(DOCUMENT_SUFFIXES)} documents with text in {documents_dir}")
+    doc_words = [_words(doc) for doc in documents]
+
+    questions, relevant, skipped = [], [], 0
+    with open(dataset_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if row.get("document_name"):
+                ids = [i for i, name in enumerate(names) if name == row["document_name"]]
+            else:
+                notes = _words(row["grading_notes"])
+                overlaps = [len(notes & words) for words in doc_words]
+                ids = [int(np.argmax(overlaps))] if max(overlaps) else []
+            if ids:
+                questions.append(row["question"])
+                relevant.append(ids)
+            else:
+                skipped += 1
+    if num_queries:
+        questions, relevant = questions[:num_queries], relevant[:num_queries]
+    return documents, questions, relevant, skipped
+
+
+# --------------------------------------------------------------------------
+# Metrics
+
+def ranking_metrics(
+    rankings: np.ndarray, relevant: Sequence[Sequence[int]], ks: Sequence[int]
+) -> Dict[str, float]:
+    """
+    recall@k, MRR and nDCG@k (binary relevance), averaged over queries
+
+    Args:
+        rankings: int [Q, K] document ids, best first, padded with -1
+        relevant: Relevant document ids per query
+        ks: Cutoffs (each <= K)
+    """
+    max_relevant = max(len(r) for r in relevant)
+    targets = np.full((len(relevant), max_relevant), -2, dtype=np.int64)
+    for i, ids in enumerate(relevant):
+        targets[i, : len(ids)] = ids
+    num_relevant = np.array([len(r) for r in relevant], dtype=np.float64)
+
+    # hits[q, r]: the document at rank r is relevant to query q
+    hits = (rankings[:, :, None] == targets[:, None, :]).any(axis=2)
+    discounts = 1.0 / np.log2(np.arange(rankings.shape[1]) + 2)
+
+    reciprocal_rank = np.zeros(len(relevant))
+    found = hits.any(axis=1)
+    reciprocal_rank[found] = 1.0 / (hits[found].argmax(axis=1) + 1)
+    metrics = {"mrr": float(reciprocal_rank.mean())}
+    for k in ks:
+        dcg = (hits[:, :k] * discounts[:k]).sum(axis=1)
+        ideal = np.cumsum(discounts[:k])[np.minimum(num_relevant, k).astype(int) - 1]
+        metrics[f"recall@{k}"] = float((hits[:, :k].sum(axis=1) / num_relevant).mean())
+        metrics[f"ndcg@{k}"] = float((dcg / ideal).mean())
+    return {name: round(value, 4) for name, value in metrics.items()}
+
+
+# --------------------------------------------------------------------------
+# Runner
+
+def _build(name: str, documents: List[str], index_dir: str) -> Tuple[Any, float, int]:
+    """Fit the retriever (and for ".index", save and map it back); returns build time and peak"""
+    retriever = _make_retriever(name)
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    retriever.fit(documents)
+    build_seconds = time.perf_counter() - t0
+    if name.endswith(".index"):
+        from rag import BaseRetriever
+
+        t0 = time.perf_counter()
+        path = retriever.save(os.path.join(index_dir, "index"))
+        retriever = BaseRetriever.load(path, mmap=True)
+        build_seconds += time.perf_counter() - t0
+    _, build_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return retriever, build_seconds, build_peak
+
+
+def run_retriever(name: str, dataset: Dict[str, Any], ks: List[int]) -> Dict[str, Any]:
+    """Worker entry point: build, query and score one retriever"""
+    if dataset["path"]:
+        documents, questions, relevant, skipped = csv_dataset(
+            Path(dataset["path"]), Path(dataset["documents"]), dataset["queries"]
+        )
+    else:
+        documents, questions, relevant, skipped = synthetic_dataset(dataset["size"], dataset["queries"])
+
+    max_k = max(ks)
+    rankings = np.full((len(questions), max_k), -1, dtype=np.int64)
+    latencies = []
+    with tempfile.TemporaryDirectory(prefix="rag_quality_") as index_dir:
+        retriever, build_seconds, build_peak = _build(name, documents, index_dir)
+        for i, question in enumerate(questions):
+            t0 = time.perf_counter()
+            top = retriever.get_top_k(question, k=max_k)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            rankings[i, : len(top)] = [doc_id for doc_id, _ in top]
+        index_bytes = retriever.memory_footprint()["index_bytes"]
+        del retriever  # release the mapped index before its directory is removed
+    latencies.sort()
+
+    return {
+        "retriever": name,
+        "documents": len(documents),
+        "queries": len(questions),
+        "skipped_rows": skipped,
+        **ranking_metrics(rankings, relevant, ks),
+        "build_seconds": round(build_seconds, 3),
+        "build_peak_mb": round(build_peak / 2**20, 1),
+        "index_mb": round(index_bytes / 2**20, 2),
+        "query_p50_ms": round(percentile(latencies, 50), 3),
+        "query_p95_ms": round(percentile(latencies, 95), 3),
+        "qps": round(len(latencies) / (sum(latencies) / 1000), 1) if latencies else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline retrieval-quality benchmark")
+    parser.add_argument("--size", default="1k", help="Synthetic corpus size: 1k, 10k or 100k")
+    parser.add_argument("--queries", type=int, default=200, help="Questions to evaluate (0 = all)")
+    parser.add_argument("--dataset", type=Path, help="Q/A dataset CSV instead of a synthetic corpus")
+    parser.add_argument("--documents", type=Path, help="Directory of the dataset's source documents")
+    parser.add_argument("--k", default="1,3,5,10", help="Comma-separated cutoffs")
+    parser.add_argument("--only", help="Comma-separated subset of: " + ",".join(RETRIEVERS))
+    parser.add_argument("--output", type=Path, help="Write results JSON here")
+    args = parser.parse_args()
+
+    if args.dataset and not args.documents:
+        parser.error("--dataset needs --documents")
+    dataset: Dict[str, Optional[Any]] = {
+        "path": str(args.dataset) if args.dataset else None,
+        "documents": str(args.documents) if args.documents else None,
+        "size": CORPUS_SIZES[args.size],
+        "queries": args.queries,
+    }
+    ks = sorted(int(k) for k in args.k.split(","))
+    names = args.only.split(",") if args.only else list(RETRIEVERS)
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for name in names:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            result = pool.submit(run_retriever, name, dataset, ks).result()
+        print(json.dumps(result), file=sys.stderr)
+        results.append(result)
+    if results and results[0]["skipped_rows"]:
+        print(
+            f"Skipped {results[0]['skipped_rows']} dataset rows whose document is not in "
+            f"{args.documents} (or has no text)",
+            file=sys.stderr,
+        )
+
+    output = json.dumps({"dataset": dataset, "k": ks, "results": results}, indent=2)
+    if args.output:
+        args.output.write_text(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+"""
+Offline benchmark suite for the RAG pipeline.
+
+Uses FakeLLMClient/FakeEmbeddingsClient and synthetic corpora, so it needs no
+API keys or network. Each benchmark runs in a fresh process so its peak RSS
+is its own. Results are JSON (tagged with the git commit) and can be compared
+against a previous run.
+
+Usage:
+    python benchmarks/run.py [--sizes 1k,10k,100k] [--only rag.query,retriever]
+                             [--llm-latency-ms 0] [--max-seconds 10]
+                             [--output results.json] [--compare baseline.json]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+RAG_EVAL_DIR = Path(__file__).resolve().parent.parent
+PROJECT_ROOT = RAG_EVAL_DIR.parent
+sys.path.insert(0, str(RAG_EVAL_DIR))
+
+from benchmarks.corpus import CORPUS_SIZES, make_corpus, make_queries, make_resume
+from benchmarks.fakes import FakeLLMClient
+
+JUDGE_PROMPT = (
+    "Check if the response contains points mentioned from the grading notes and "
+    "return 'pass' or 'fail'.\nResponse: {response} Grading Notes: {grading_notes}"
+)
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process"""
+    try:
+        import resource
+    except ImportError:  # Windows
+        try:
+            import psutil
+
+            return round(psutil.Process().memory_info().peak_wset / 2**20, 1)
+        except (ImportError, AttributeError):
+            return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    rank = (len(sorted_values) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def measure(op: Callable[[int], Any], max_iterations: int, max_seconds: float) -> Dict[str, Any]:
+    """Run op repeatedly and summarize per-call latency"""
+    latencies = []
+    started = time.perf_counter()
+    for i in range(max_iterations):
+        t0 = time.perf_counter_ns()
+        op(i)
+        latencies.append((time.perf_counter_ns() - t0) / 1e6)
+        if time.perf_counter() - started >= max_seconds and i >= 2:
+            break
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "iterations": len(latencies),
+        "qps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+    }
+
+
+# --------------------------------------------------------------------------
+# Benchmarks: each returns (setup_info, op) for one corpus size
+
+def _fake_llm(args: Dict[str, Any], **kwargs: Any) -> FakeLLMClient:
+    return FakeLLMClient(
+        latency_ms=args["llm_latency_ms"], jitter_ms=args["llm_latency_ms"] / 5, **kwargs
+    )
+
+
+def _rag(documents: List[str], llm_client) -> Any:
+    from rag import ExampleRAG
+    from tracing import NullSink
+
+    rag = ExampleRAG(
+        llm_client=llm_client,
+        logdir=tempfile.mkdtemp(prefix="rag_bench_"),
+        trace_sink=NullSink(),
+    )
+    rag.set_documents(documents)
+    return rag
+
+
+def bench_retriever(size: int, args: Dict[str, Any]) -> Tuple[Dict[str, Any], Callable]:
+    from rag import SimpleKeywordRetriever
+
+    documents = make_corpus(size)
+    queries = make_queries(documents, 200)
+    retriever = SimpleKeywordRetriever()
+    t0 = time.perf_counter()
+    retriever.fit(documents)
+    setup = {"build_seconds": round(time.perf_counter() - t0, 3)}
+    footprint = retriever.memory_footprint()
+    setup["index_mb"] = round(footprint["index_bytes"] / 2**20, 2)
+    setup["postings_mb"] = round(footprint["postings_bytes"] / 2**20, 2)
+    return setup, lambda i: retriever.get_top_k(queries[i % len(queries)][0], k=3)
+
+
+def bench_index_load(size: int, args: Dict[str, Any]) -> Tuple[Dict[str, Any], Callable]:
+    """Startup from a saved index: load (mmap) plus a first query"""
+    from rag import BaseRetriever, SimpleKeywordRetriever
+
+    documents = make_corpus(size)
+    queries = make_queries(documents, 200)
+    retriever = SimpleKeywordRetriever()
+    t0 = time.perf_counter()
+    retriever.fit(documents)
+    t1 = time.perf_counter()
+    path = retriever.save(os.path.join(tempfile.mkdtemp(prefix="rag_index_"), "index"))
+    setup = {
+        "fit_seconds": round(t1 - t0, 3),
+        "save_seconds": round(time.perf_counter() - t1, 3),
+    }
+
+    def load_and_query(i: int):
+        loaded = BaseRetriever.load(path, mmap=True)
+        return loaded.get_top_k(queries[i % len(queries)][0], k=3)
+
+    return setup, load_and_query
+
+
+def bench_retriever_batch(size: int, args: Dict[str, Any]) -> Tuple[Dict[str, Any], Callable]:
+    """One op is get_top_k_batch over 32 queries on a loaded keyword index"""
+    from rag import BaseRetriever, SimpleKeywordRetriever
+
+    documents = make_corpus(size)
+    queries = [q for q, _ in make_queries(documents, 320)]
+    retriever = SimpleKeywordRetriever()
+    retriever.fit(documents)
+    retriever = BaseRetriever.load(retriever.save(os.path.join(tempfile.mkdtemp(prefix="rag_index_"), "index")))
+
+    def batch(i: int):
+        start = (i * 32) % len(queries)
+        return retriever.get_top_k_batch(queries[start : start + 32], k=3)
+
+    return {}, batch
+
+
+def bench_sharded(size: int, args: Dict[str, Any]) -> Tuple[Dict[str, Any], Callable]:
+    """One op is a batch of 32 queries fanned out to one worker process per core"""
+    from sharded_retriever import ShardedRetriever
+
+    documents = make_corpus(size)
+    queries = [q for q, _ in make_queries(documents, 320)]
+    retriever = ShardedRetriever(num_shards=os.cpu_count())
+    t0 = time.perf_counter()
+    retriever.fit(documents)
+    setup = {"build_seconds": round(time.perf_counter() - t0, 3), "shards": retriever.num_shards}
+    retriever.get_top_k_batch(queries[:1], k=3)  # shard workers load lazily
+
+    def batch(i: int):
+        start = (i * 32) % len(queries)
+        return retriever.get_top_k_batch(queries[start : start + 32], k=3)
+
+    return setup, batch
+
+
+def bench_rag_query(size: int, args: Dict[str, Any]) -> Tuple[Dict[str, Any], Callable]:
+    documents = make_corpus(size)
+    queries = make_queries(documents, 200)
+    rag = _rag(documents, _fake_llm(args))
+    return {}, lambda i: rag.query(queries[i % len(queries)][0])
+
+
+def bench_eval_loop(size: int, args: Dict[str, Any]) -> Tuple[Dict[str, Any], Callable]:
+    """Mirrors one row of evals.create_run_experiment: answer, then LLM judge"""
+    documents = make_corpus(size)
+    queries = make_queries(documents, 200)
+    rag = _rag(documents, _fake_llm(args))
+    judge = _fake_llm(args, responder=lambda messages, kwargs: "pass")
+
+    def row(i: int) -> str:
+        question, doc_id = queries[i % len(queries)]
+        response = rag.query(question)
+        prompt = JUDGE_PROMPT.format(response=response["answer"], grading_notes=documents[doc_id])
+        verdict = judge.chat.completions.create(
+            model="gpt-4o", messages=[{"role": "user", "content": prompt}]
+        )
+        return verdict.choices[0].message.content
+
+    return {}, row
+
+
+def _import_src():
+    sys.path.insert(0, str(PROJECT_ROOT / "src"))
+    import graph_parse
+    import test_resume
+
+    return graph_parse, test_resume
+
+
+def bench_chunking(size: int, args: Dict[str, Any]) -> Tuple[Dict[str, Any], Callable]:
+    _, test_resume = _import_src()
+    resumes = [make_resume(sections=max(5, size // 200), seed=s) for s in range(20)]
+    return {}, lambda i: test_resume.chunk_resume_text(resumes[i % len(resumes)], f"bench-{i}")
+
+
+def _graph_extraction(mode: str, size: int, args: Dict[str, Any]) -> Tuple[Dict[str, Any], Callable]:
+    graph_parse, test_resume = _import_src()
+
+    def graph(text: str) -> List[Dict[str, str]]:
+        words = text.split()[-6:]
+        return [
+            {"node": words[i], "target_node": words[i + 1], "relationship": "RELATED_TO"}
+            for i in range(0, len(words) - 1, 2)
+        ]
+
+    def graph_json(messages, kwargs) -> str:
+        content = messages[-1]["content"]
+        if "response_format" in kwargs and kwargs["response_format"]["type"] == "json_schema":
+            blocks = content.split("CHUNK_ID: ")[1:]
+            return json.dumps(
+                {"chunks": [{"chunk_id": b.split("\n", 1)[0], "graph": graph(b)} for b in blocks]}
+            )
+        return json.dumps({"graph": graph(content)})
+
+    fake = _fake_llm(args, responder=graph_json)
+    graph_parse.get_client = lambda: fake
+    resumes = [make_resume(sections=max(5, size // 200), seed=s) for s in range(20)]
+
+    def extract(i: int):
+        return test_resume.extract_graph_from_resume(resumes[i % len(resumes)], f"bench-{i}", mode=mode)
+
+    extract(0)
+    return {"llm_calls_per_document": fake.calls}, extract
+
+
+def bench_graph_extraction(size: int, args: Dict[str, Any]) -> Tuple[Dict[str, Any], Callable]:
+    """Packed structured-output extraction (several sections per call)"""
+    return _graph_extraction("packed", size, args)
+
+
+def bench_graph_extraction_per_chunk(size: int, args: Dict[str, Any]) -> Tuple[Dict[str, Any], Callable]:
+    """One free-form JSON call per resume section"""
+    return _graph_extraction("per_chunk", size, args)
+
+
+BENCHMARKS: Dict[str, Callable[[int, Dict[str, Any]], Tuple[Dict[str, Any], Callable]]] = {
+    "retriever.keyword": bench_retriever,
+    "index.load": bench_index_load,
+    "retriever.batch": bench_retriever_batch,
+    "retriever.sharded": bench_sharded,
+    "rag.query": bench_rag_query,
+    "eval.loop": bench_eval_loop,
+    "chunking": bench_chunking,
+    "graph.extraction": bench_graph_extraction,
+    "graph.extraction.per_chunk": bench_graph_extraction_per_chunk,
+}
+
+
+def run_one(name: str, size_label: str, args: Dict[str, Any]) -> Dict[str, Any]:
+    """Worker entry point: set up and measure one benchmark"""
+    t0 = time.perf_counter()
+    setup, op = BENCHMARKS[name](CORPUS_SIZES[size_label], args)
+    setup_seconds = round(time.perf_counter() - t0, 3)
+
+    result = {"benchmark": name, "corpus": size_label, "setup_seconds": setup_seconds, **setup}
+    result.update(measure(op, args["max_iterations"], args["max_seconds"]))
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=PROJECT_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Relative change of qps and p95 per benchmark against a baseline run"""
+    previous = {(r["benchmark"], r["corpus"]): r for r in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        base = previous.get((result["benchmark"], result["corpus"]))
+        if base is None:
+            continue
+        rows.append(
+            {
+                "benchmark": result["benchmark"],
+                "corpus": result["corpus"],
+                "qps_change": round(result["qps"] / base["qps"] - 1, 3) if base["qps"] else None,
+                "p95_change": round(result["p95_ms"] / base["p95_ms"] - 1, 3) if base["p95_ms"] else None,
+            }
+        )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline RAG benchmarks")
+    parser.add_argument("--sizes", default="1k,10k", help="Comma-separated corpus sizes: 1k,10k,100k")
+    parser.add_argument("--only", help="Comma-separated benchmark name prefixes")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0)
+    parser.add_argument("--max-iterations", type=int, default=200)
+    parser.add_argument("--max-seconds", type=float, default=10.0)
+    parser.add_argument("--output", type=Path, help="Write results JSON here")
+    parser.add_argument("--compare", type=Path, help="Baseline results JSON to diff against")
+    args = parser.parse_args()
+
+    options = {
+        "llm_latency_ms": args.llm_latency_ms,
+        "max_iterations": args.max_iterations,
+        "max_seconds": args.max_seconds,
+    }
+    names = [
+        name
+        for name in BENCHMARKS
+        if not args.only or any(name.startswith(p) for p in args.only.split(","))
+    ]
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for size_label in args.sizes.split(","):
+        for name in names:
+            # A fresh process per benchmark keeps peak RSS attributable
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                result = pool.submit(run_one, name, size_label, options).result()
+            print(json.dumps(result), file=sys.stderr)
+            results.append(result)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": options,
+        "results": results,
+    }
+    if args.compare:
+        report["comparison"] = compare(report, json.loads(args.compare.read_text()))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""
+Token-budgeted context assembly for the RAG prompt.
+
+Retrieved documents can be arbitrarily large (an uploaded PDF becomes a single
+"document"), so instead of concatenating them verbatim the assembler:
+1. splits every document into sentence-aligned passages (a sentence longer
+   than a passage, e.g. a table or an unpunctuated PDF extract, is cut on
+   token boundaries)
+2. ranks passages by keyword overlap with the query
+3. drops passages whose content was already selected (near-duplicates)
+4. greedily packs the best passages into a fixed token budget
+"""
+
+import logging
+import re
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gpt-4o"
+FALLBACK_ENCODING = "o200k_base"
+DEFAULT_CONTEXT_TOKEN_BUDGET = 6000
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+_WORD = re.compile(r"\w+")
+
+_encoders: Dict[str, Any] = {}
+_encoders_lock = threading.Lock()
+
+
+def get_encoder(model: str = DEFAULT_MODEL):
+    """Return a cached tiktoken encoder for the model, or None if unavailable."""
+    if model in _encoders:
+        return _encoders[model]
+
+    with _encoders_lock:
+        if model not in _encoders:
+            _encoders[model] = _load_encoder(model)
+    return _encoders[model]
+
+
+def _load_encoder(model: str):
+    encoder = None
+    try:
+        import tiktoken
+
+        try:
+            encoder = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoder = tiktoken.get_encoding(FALLBACK_ENCODING)
+    except Exception as e:  # tiktoken missing or encoding files not downloadable
+        logger.warning(
+            f"tiktoken unavailable for {model} ({e}); estimating 4 characters per token"
+        )
+    return encoder
+
+
+def count_tokens(text: str, model: str = DEFAULT_MODEL) -> int:
+    """Count tokens in text the way the model's tokenizer does"""
+    if not text:
+        return 0
+    encoder = get_encoder(model)
+    if encoder is None:
+        return max(1, len(text) // 4)
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+@dataclass
+class Passage:
+    """Contiguous, sentence-aligned span of a retrieved document"""
+
+    doc_rank: int
+    start: int
+    end: int
+    text: str
+    tokens: int
+    score: int = 0
+
+
+@dataclass
+class AssembledContext:
+    """Result of packing retrieved documents into the token budget"""
+
+    context: str
+    documents: List[Dict[str, Any]]
+    tokens_before: int
+    tokens_after: int
+    passages_total: int = 0
+    passages_kept: int = 0
+    duplicates_dropped: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.tokens_before - self.tokens_after)
+
+    def trace_data(self) -> Dict[str, Any]:
+        """Summary suitable for a TraceEvent payload"""
+        return {
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "tokens_saved": self.tokens_saved,
+            "passages_total": self.passages_total,
+            "passages_kept": self.passages_kept,
+            "duplicates_dropped": self.duplicates_dropped,
+            "num_context_docs": len(self.documents),
+        }
+
+
+class ContextAssembler:
+    """
+    Builds the prompt context from retrieved documents under a token budget.
+
+    Passages are ranked globally, so a highly relevant passage from the third
+    document wins over boilerplate from the first one. Kept passages are put
+    back in their original order and adjacent ones are merged, so the text the
+    LLM sees is always a verbatim excerpt of the source document.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = DEFAULT_CONTEXT_TOKEN_BUDGET,
+        passage_tokens: int = 150,
+        dedup_threshold: float = 0.8,
+        shingle_size: int = 5,
+        model: str = DEFAULT_MODEL,
+    ):
+        """
+        Args:
+            max_tokens: Token budget for the document text in the context
+            passage_tokens: Target size of a passage before it is cut
+            dedup_threshold: Fraction of a passage's shingles already selected
+                above which the passage is treated as a duplicate
+            shingle_size: Number of words per shingle used for deduplication
+            model: Model whose tokenizer is used for counting
+        """
+        self.max_tokens = max_tokens
+        self.passage_tokens = passage_tokens
+        self.dedup_threshold = dedup_threshold
+        self.shingle_size = shingle_size
+        self.model = model
+
+    def _split_passages(self, doc_rank: int, document: str) -> List[Passage]:
+        """Split a document into sentence-aligned passages of ~passage_tokens"""
+        # A passage must fit the budget on its own, or it could never be kept
+        limit = max(1, min(self.passage_tokens, self.max_tokens))
+        boundaries = [m.end() for m in _SENTENCE_END.finditer(document)]
+        boundaries.append(len(document))
+
+        passages = []
+        start = 0
+        sentence_start = 0
+        tokens = 0
+        for end in boundaries:
+            sentence_tokens = count_tokens(document[sentence_start:end], self.model)
+            if tokens and tokens + sentence_tokens > limit:
+                passages.append(self._make_passage(doc_rank, document, start, sentence_start, tokens))
+                start = sentence_start
+                tokens = 0
+            if sentence_tokens > limit:
+                for piece_start, piece_end, piece_tokens in self._hard_split(
+                    document, sentence_start, end, limit
+                ):
+                    passages.append(
+                        self._make_passage(doc_rank, document, piece_start, piece_end, piece_tokens)
+                    )
+                start = end
+            else:
+                tokens += sentence_tokens
+            sentence_start = end
+        if start < len(document):
+            passages.append(self._make_passage(doc_rank, document, start, len(document), tokens))
+
+        return [p for p in passages if p.text.strip()]
+
+    def _hard_split(self, document: str, start: int, end: int, limit: int) -> List[Tuple[int, int, int]]:
+        """(start, end, tokens) pieces of at most limit tokens covering document[start:end]"""
+        text = document[start:end]
+        encoder = get_encoder(self.model)
+        if encoder is None:
+            # Same 4-characters-per-token estimate as count_tokens
+            step = limit * 4
+            return [
+                (start + i, start + min(i + step, len(text)), count_tokens(text[i : i + step], self.model))
+                for i in range(0, len(text), step)
+            ]
+        token_ids = encoder.encode(text, disallowed_special=())
+        _, offsets = encoder.decode_with_offsets(token_ids)
+        pieces = []
+        for i in range(0, len(token_ids), limit):
+            piece_end = offsets[i + limit] if i + limit < len(token_ids) else len(text)
+            pieces.append((start + offsets[i], start + piece_end, min(limit, len(token_ids) - i)))
+        return pieces
+
+    @staticmethod
+    def _make_passage(
+        doc_rank: int, document: str, start: int, end: int, tokens: int
+    ) -> Passage:
+        return Passage(
+            doc_rank=doc_rank, start=start, end=end, text=document[start:end], tokens=tokens
+        )
+
+    def _shingles(self, text: str) -> set:
+        words = [w.lower() for w in _WORD.findall(text)]
+        if len(words) <= self.shingle_size:
+            return {tuple(words)} if words else set()
+        return {
+            tuple(words[i : i + self.shingle_size])
+            for i in range(len(words) - self.shingle_size + 1)
+        }
+
+    @staticmethod
+    def _score(query_words: List[str], passage: Passage) -> int:
+        """Keyword-match count, consistent with SimpleKeywordRetriever"""
+        passage_words = set(passage.text.lower().split())
+        return sum(1 for word in query_words if word in passage_words)
+
+    def assemble(self, query: str, documents: List[Dict[str, Any]]) -> AssembledContext:
+        """
+        Pack retrieved documents into the context budget
+
+        Args:
+            query: User query used to rank passages
+            documents: Retrieved documents (dicts with a "content" key), best first
+
+        Returns:
+            AssembledContext with the formatted context and token accounting
+        """
+        query_words = query.lower().split()
+
+        passages: List[Passage] = []
+        for rank, doc in enumerate(documents):
+            passages.extend(self._split_passages(rank, doc["content"]))
+        tokens_before = sum(p.tokens for p in passages)
+        for passage in passages:
+            passage.score = self._score(query_words, passage)
+
+        ranked = sorted(passages, key=lambda p: (-p.score, p.doc_rank, p.start))
+
+        selected: List[Passage] = []
+        seen_shingles: set = set()
+        duplicates = 0
+        budget = self.max_tokens
+        for passage in ranked:
+            shingles = self._shingles(passage.text)
+            if shingles:
+                overlap = len(shingles & seen_shingles) / len(shingles)
+                if overlap >= self.dedup_threshold:
+                    duplicates += 1
+                    continue
+            if passage.tokens > budget:
+                continue
+            selected.append(passage)
+            seen_shingles |= shingles
+            budget -= passage.tokens
+
+        trimmed_docs = self._rebuild_documents(documents, selected)
+
+        context_parts = []
+        for i, doc in enumerate(trimmed_docs, 1):
+            context_parts.append(f"Document {i}:\n{doc['content']}")
+
+        return AssembledContext(
+            context="\n\n".join(context_parts),
+            documents=trimmed_docs,
+            tokens_before=tokens_before,
+            tokens_after=self.max_tokens - budget,
+            passages_total=len(passages),
+            passages_kept=len(selected),
+            duplicates_dropped=duplicates,
+        )
+
+    @staticmethod
+    def _rebuild_documents(
+        documents: List[Dict[str, Any]], selected: List[Passage]
+    ) -> List[Dict[str, Any]]:
+        """Reassemble kept passages per document in original order"""
+        spans_by_doc: Dict[int, List[Tuple[int, int]]] = {}
+        for passage in selected:
+            spans_by_doc.setdefault(passage.doc_rank, []).append((passage.start, passage.end))
+
+        trimmed = []
+        for rank, doc in enumerate(documents):
+            spans = sorted(spans_by_doc.get(rank, []))
+            if not spans:
+                continue
+
+            # Merge adjacent spans so contiguous text stays verbatim
+            merged = [list(spans[0])]
+            for start, end in spans[1:]:
+                if start <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+
+            content = " ... ".join(doc["content"][s:e].strip() for s, e in merged)
+            trimmed.append({**doc, "content": content})
+
+        return trimmed
@@ -0,0 +1,301 @@
+"""
+Token and cost accounting for every LLM and embeddings call.
+
+The LLM gateway records each successful call in the process-wide CostLedger:
+prompt, cached prompt and completion tokens for chat calls, input tokens for
+embeddings calls, and the call's USD cost from PRICES_PER_1M. Calls are
+aggregated per (run, document, operation, model), where operation is the
+gateway caller ("answer", "judge", "qa_generation", "graph_extraction",
+"embedding").
+
+Run and document come from the enclosing cost_scope(), a context manager
+backed by a context variable, so they follow the code into asyncio tasks
+and asyncio.to_thread (thread pools need contextvars.copy_context()):
+
+    with cost_scope(run="eval_20250101", max_cost_usd=5.0) as run_cost:
+        with cost_scope(document="handbook.pdf") as doc_cost:
+            ...
+    print(run_cost.cost_usd, get_ledger().summary("eval_20250101"))
+
+A scope with max_tokens or max_cost_usd is a hard budget: once the tokens or
+cost recorded inside it, plus the estimates of the calls still in flight and
+of the next call, would go over the limit, the gateway raises BudgetExceeded
+instead of sending the call. check() reserves the estimate under the ledger
+lock, so concurrent calls cannot all pass against the same recorded total;
+record() replaces the reservation with the actual usage and release() drops
+it for a call that failed.
+"""
+
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RUN = "default"
+
+# USD per 1M tokens: (input, cached input, output); matched by longest model prefix
+PRICES_PER_1M: Dict[str, Tuple[float, float, float]] = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "text-embedding-3-small": (0.02, 0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.13, 0.0),
+    "text-embedding-ada-002": (0.10, 0.10, 0.0),
+}
+
+_warned_models = set()
+
+
+class BudgetExceeded(RuntimeError):
+    """A call would take a cost_scope over its token or USD budget"""
+
+
+def prices_for(model: Optional[str]) -> Tuple[float, float, float]:
+    """(input, cached input, output) USD per 1M tokens; zeros for an unknown model"""
+    model = model or ""
+    matches = [prefix for prefix in PRICES_PER_1M if model.startswith(prefix)]
+    if not matches:
+        if model not in _warned_models:
+            _warned_models.add(model)
+            logger.warning(f"No price for model {model!r}; its calls are counted at $0")
+        return (0.0, 0.0, 0.0)
+    return PRICES_PER_1M[max(matches, key=len)]
+
+
+@dataclass
+class Totals:
+    requests: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+    embedding_tokens: int = 0
+    cost_usd: float = 0.0
+
+    @property
+    def tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens + self.embedding_tokens
+
+    def add(self, other: "Totals") -> None:
+        for name, value in asdict(other).items():
+            setattr(self, name, getattr(self, name) + value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["tokens"] = self.tokens
+        data["cost_usd"] = round(self.cost_usd, 6)
+        return data
+
+
+def usage_cost(
+    model: Optional[str],
+    prompt_tokens: int = 0,
+    completion_tokens: int = 0,
+    cached_tokens: int = 0,
+    embedding_tokens: int = 0,
+) -> Totals:
+    """Totals of one call, with its cost"""
+    input_price, cached_price, output_price = prices_for(model)
+    cost = (
+        (prompt_tokens - cached_tokens + embedding_tokens) * input_price
+        + cached_tokens * cached_price
+        + completion_tokens * output_price
+    ) / 1e6
+    return Totals(1, prompt_tokens, cached_tokens, completion_tokens, embedding_tokens, cost)
+
+
+@dataclass
+class _Frame:
+    labels: Dict[str, str]
+    tally: Totals
+    max_tokens: Optional[int] = None
+    max_cost_usd: Optional[float] = None
+    # estimates of checked calls that are not recorded or released yet
+    reserved_tokens: int = 0
+    reserved_cost_usd: float = 0.0
+
+
+@dataclass
+class Reservation:
+    """Estimated usage of one call, held against the budgets of the scopes it was checked in"""
+
+    frames: Tuple[_Frame, ...]
+    tokens: int
+    cost_usd: float
+    settled: bool = False
+
+
+_frames: ContextVar[Tuple[_Frame, ...]] = ContextVar("cost_scope", default=())
+
+
+def _env_number(name: str, cast):
+    value = os.getenv(name)
+    return cast(value) if value else None
+
+
+@contextmanager
+def cost_scope(
+    run: Optional[str] = None,
+    document: Optional[str] = None,
+    max_tokens: Optional[int] = None,
+    max_cost_usd: Optional[float] = None,
+) -> Iterator[Totals]:
+    """
+    Attribute the calls made inside to run and/or document (inner scopes win)
+    and yield a Totals that accumulates them
+
+    Args:
+        run: Run name; a run without explicit budgets gets LLM_BUDGET_TOKENS
+            and LLM_BUDGET_USD, if set
+        document: Document the calls are made for
+        max_tokens: Hard token budget of this scope
+        max_cost_usd: Hard USD budget of this scope
+    """
+    if run is not None and max_tokens is None and max_cost_usd is None:
+        max_tokens = _env_number("LLM_BUDGET_TOKENS", int)
+        max_cost_usd = _env_number("LLM_BUDGET_USD", float)
+    labels = {key: value for key, value in (("run", run), ("document", document)) if value is not None}
+    frame = _Frame(labels, Totals(), max_tokens, max_cost_usd)
+    token = _frames.set(_frames.get() + (frame,))
+    try:
+        yield frame.tally
+    finally:
+        _frames.reset(token)
+
+
+def current_labels() -> Dict[str, str]:
+    """Run and document of the innermost scopes that set them"""
+    labels: Dict[str, str] = {}
+    for frame in _frames.get():
+        labels.update(frame.labels)
+    return labels
+
+
+class CostLedger:
+    """Thread-safe per-(run, document, operation, model) usage totals"""
+
+    def __init__(self):
+        self._entries: Dict[Tuple[str, Optional[str], str, str], Totals] = {}
+        self._lock = threading.Lock()
+
+    def check(self, model: Optional[str], estimated_tokens: int) -> Reservation:
+        """
+        Reserve about estimated_tokens for a call in every enclosing scope
+
+        Raises:
+            BudgetExceeded: if the call would break an enclosing budget; nothing
+                is reserved then
+        """
+        estimated_cost = estimated_tokens * prices_for(model)[0] / 1e6
+        frames = _frames.get()
+        with self._lock:
+            for frame in frames:
+                name = frame.labels.get("run") or frame.labels.get("document") or "scope"
+                tokens = frame.tally.tokens + frame.reserved_tokens
+                cost = frame.tally.cost_usd + frame.reserved_cost_usd
+                if frame.max_tokens is not None and tokens + estimated_tokens > frame.max_tokens:
+                    raise BudgetExceeded(
+                        f"{name}: {tokens} tokens used or in flight, next call (~{estimated_tokens}) "
+                        f"would exceed the budget of {frame.max_tokens}"
+                    )
+                if frame.max_cost_usd is not None and cost + estimated_cost > frame.max_cost_usd:
+                    raise BudgetExceeded(
+                        f"{name}: ${cost:.4f} spent or in flight, next call (~${estimated_cost:.4f}) "
+                        f"would exceed the budget of ${frame.max_cost_usd:.2f}"
+                    )
+            for frame in frames:
+                frame.reserved_tokens += estimated_tokens
+                frame.reserved_cost_usd += estimated_cost
+        return Reservation(frames, estimated_tokens, estimated_cost)
+
+    def _settle(self, reservation: Optional[Reservation]) -> None:
+        # caller holds self._lock
+        if reservation is None or reservation.settled:
+            return
+        reservation.settled = True
+        for frame in reservation.frames:
+            frame.reserved_tokens -= reservation.tokens
+            frame.reserved_cost_usd -= reservation.cost_usd
+
+    def release(self, reservation: Optional[Reservation]) -> None:
+        """Drop a reservation whose call was not recorded (failed); no-op once settled"""
+        with self._lock:
+            self._settle(reservation)
+
+    def record(
+        self,
+        operation: str,
+        model: Optional[str],
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        cached_tokens: int = 0,
+        embedding_tokens: int = 0,
+        reservation: Optional[Reservation] = None,
+    ) -> Totals:
+        """
+        Account one call under the current scope, replacing the call's
+        reservation (from check) with its actual usage; returns its totals
+        """
+        call = usage_cost(model, prompt_tokens, completion_tokens, cached_tokens, embedding_tokens)
+        frames = _frames.get()
+        labels = current_labels()
+        key = (labels.get("run", DEFAULT_RUN), labels.get("document"), operation, model or "")
+        with self._lock:
+            self._settle(reservation)
+            self._entries.setdefault(key, Totals()).add(call)
+            for frame in frames:
+                frame.tally.add(call)
+        return call
+
+    def rows(self, run: Optional[str] = None) -> List[Dict[str, Any]]:
+        """One row per (run, document, operation, model), optionally of one run"""
+        with self._lock:
+            entries = [(key, Totals(**asdict(totals))) for key, totals in self._entries.items()]
+        return [
+            {"run": r, "document": d, "operation": o, "model": m, **totals.to_dict()}
+            for (r, d, o, m), totals in entries
+            if run is None or r == run
+        ]
+
+    def totals(self, by: str, run: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """Totals grouped by "run", "document", "operation" or "model" """
+        grouped: Dict[str, Totals] = {}
+        with self._lock:
+            for key, totals in self._entries.items():
+                labels = dict(zip(("run", "document", "operation", "model"), key))
+                if run is not None and labels["run"] != run:
+                    continue
+                grouped.setdefault(labels[by] or "(none)", Totals()).add(totals)
+        return {name: totals.to_dict() for name, totals in grouped.items()}
+
+    def summary(self, run: Optional[str] = None) -> Dict[str, Any]:
+        """Overall totals plus totals per operation, model and document"""
+        total = Totals()
+        with self._lock:
+            for key, totals in self._entries.items():
+                if run is None or key[0] == run:
+                    total.add(totals)
+        return {
+            "run": run,
+            "total": total.to_dict(),
+            "by_operation": self.totals("operation", run),
+            "by_model": self.totals("model", run),
+            "by_document": self.totals("document", run),
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_ledger = CostLedger()
+
+
+def get_ledger() -> CostLedger:
+    """The process-wide ledger the LLM gateway records into"""
+    return _ledger
@@ -0,0 +1,83 @@
+"""
+Per-row cache of evaluation results.
+
+A row's key hashes its question and grading notes together with a
+fingerprint of everything else that decides the outcome (corpus, retriever
+and settings, RAG prompt, generation model, judge model and metric prompt).
+Rerunning an experiment only executes rows whose key is not cached, e.g.
+new questions or all rows after the prompt changed.
+
+Results live in a single SQLite file, safe to share between threads and
+processes.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Tuple
+
+DEFAULT_CACHE_FILENAME = "eval_cache.sqlite"
+
+
+def row_key(row: Dict[str, Any], fingerprint: Dict[str, Any]) -> str:
+    """Cache key of one evaluation row under a run fingerprint"""
+    payload = json.dumps(
+        [row.get("question"), row.get("grading_notes"), fingerprint], sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class EvalCache:
+    """SQLite-backed map from row key to that row's result columns"""
+
+    def __init__(self, path: str = DEFAULT_CACHE_FILENAME):
+        """
+        Args:
+            path: SQLite database file (created if missing)
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, result TEXT NOT NULL, created TEXT NOT NULL)"
+            )
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Cached results for the keys that have one"""
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                batch = keys[i : i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, result FROM results WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                found.update((key, json.loads(result)) for key, result in rows)
+        return found
+
+    def put_many(self, items: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """Store (key, result) pairs, replacing existing entries"""
+        created = datetime.now().isoformat()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO results (key, result, created) VALUES (?, ?, ?)",
+                [(key, json.dumps(result, default=str), created) for key, result in items],
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM results")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
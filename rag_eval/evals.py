@@ -1,35 +1,93 @@
+import asyncio
+import json
 import os
 import sys
+from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 from dotenv import load_dotenv
-from ragas import Dataset, experiment
-from ragas.llms import llm_factory
-from ragas.metrics import DiscreteMetric
-from openai import AzureOpenAI
 
 load_dotenv()
 
 # Add the current directory to the path so we can import rag module when run as a script
 sys.path.insert(0, str(Path(__file__).parent))
 from rag import default_rag_client
+from eval_cache import DEFAULT_CACHE_FILENAME, EvalCache, row_key
+from batch_judge import BatchJudge
+from cost_ledger import Totals, cost_scope, get_ledger
+from llm_gateway import get_gateway, model_for
+
+# ragas and openai are imported inside the factories below: importing this
+# module (e.g. from a Streamlit page) must not pay for them, construct
+# clients or require the services to be configured
 
 #azure client initialization
 azure_endpoint = os.getenv("AZURE_ENDPOINT")
 azure_api_key = os.getenv("OPEN_AI_AZURE_KEY")
 deployment_name = "rag-pipeline-openai"
 
-openai_client = AzureOpenAI(
-    api_version="2024-12-01-preview",
-    azure_endpoint=azure_endpoint,
-    api_key=azure_api_key,
-    azure_deployment="gpt-4o"
-)
+JUDGE_MODEL = model_for("judge", "gpt-4o")
+CORRECTNESS_PROMPT = "Check if the response contains points mentioned from the grading notes and return 'pass' or 'fail'.\nResponse: {response} Grading Notes: {grading_notes}"
+
+# Columns an experiment adds to a dataset row; these are what gets cached
+RESULT_COLUMNS = ("response", "score", "log_file")
+# Tokens and USD the row's answer and per-row judge call cost in this run (0
+# when served from cache); batched judge calls grade several rows at once, so
+# with a batch judge they only appear in the run summary
+COST_COLUMNS = ("answer_tokens", "answer_cost_usd", "judge_tokens", "judge_cost_usd")
+# Answers ExampleRAG.query returns on failure; such rows are never cached
+ERROR_PREFIXES = ("Error processing query", "Error generating response")
+
+
+def get_openai_client(caller: str = "evals"):
+    """Azure client routed through the shared LLM gateway, accounted under caller"""
+    return get_gateway().client_for(caller, "azure")
+
+
+@lru_cache(maxsize=None)
+def get_rag_client():
+    """Shared RAG client over the default documents"""
+    return default_rag_client(llm_client=get_openai_client("answer"))
+
+
+@lru_cache(maxsize=None)
+def get_batch_judge(batch_size):
+    """
+    Correctness judge grading batch_size rows per call, and single rows with
+    score_one (CORRECTNESS_PROMPT); all its calls go through the gateway
+    """
+    return BatchJudge(get_openai_client("judge"), model=JUDGE_MODEL, batch_size=batch_size)
+
+
+def score_per_row(response, grading_notes):
+    """One correctness judge call for one row"""
+    # ragas' llm_factory only accepts a raw OpenAI client, which would skip the
+    # gateway's rate limits, retries and cost accounting
+    return get_batch_judge(1).score_one(response, grading_notes)
+
 
-rag_client = default_rag_client(llm_client=openai_client)
-llm = llm_factory("gpt-4o", client=openai_client)
+@lru_cache(maxsize=None)
+def get_eval_cache():
+    """Shared per-row result cache ($EVAL_CACHE_PATH, default next to this file)"""
+    return EvalCache(os.getenv("EVAL_CACHE_PATH", str(Path(__file__).parent / DEFAULT_CACHE_FILENAME)))
+
+
+# Module attributes kept for existing callers, built on first access
+_LAZY_ATTRIBUTES = {
+    "openai_client": get_openai_client,
+    "rag_client": get_rag_client,
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 #function that came with the ragas evals to create a sample dataset
 def load_dataset():
+    from ragas import Dataset
+
     dataset = Dataset(
         name="test_dataset",
         backend="local/csv",
@@ -72,78 +130,180 @@ def load_dataset_from_qa(qa_results):
         }
     ]
     """
-    dataset = Dataset(
-        name="generated_qa_dataset",
-        backend="local/csv",
-        root_dir=str(Path(__file__).parent),
-    )
-
-    import json
+    return make_dataset(qa_rows(qa_results))
 
+#rows (question + grading notes) of the generated q/a pairs, in upload order
+def qa_rows(qa_results):
+    rows = []
     for doc in qa_results:
         qa_json = json.loads(doc["qa_pairs"])
         for pair in qa_json["qa_pairs"]:
-            dataset.append({
+            rows.append({
                 "question": pair["question"],
                 "grading_notes": pair["answer"], # used as reference
+                "document_name": doc.get("document_name", ""), # source document, for retrieval metrics
             })
+    return rows
+
+def make_dataset(rows, name="generated_qa_dataset"):
+    from ragas import Dataset
+
+    dataset = Dataset(
+        name=name,
+        backend="local/csv",
+        root_dir=str(Path(__file__).parent),
+    )
+    for row in rows:
+        dataset.append(row)
 
     dataset.save()
     return dataset
 
-#correctness definition for rag evaluation
-my_metric = DiscreteMetric(
-    name="correctness",
-    prompt="Check if the response contains points mentioned from the grading notes and return 'pass' or 'fail'.\nResponse: {response} Grading Notes: {grading_notes}",
-    allowed_values=["pass", "fail"],
-)
-
 #experiment definition for rag evaluation
-def create_run_experiment(rag_client, llm_instance, metric_instance):
+#each row is graded by its own judge call; with a BatchJudge, rows waiting for their verdict are graded together instead
+def create_run_experiment(rag_client, judge=None):
+    from ragas import experiment
+
     @experiment()
     async def run_experiment(row):
-        response = rag_client.query(row["question"])
+        with cost_scope(document=row.get("document_name")) as answer_cost:
+            response = rag_client.query(row["question"])
 
-        score = metric_instance.score(
-            llm=llm_instance,
-            response=response.get("answer", " "),
-            grading_notes=row["grading_notes"],
-        )
+        if judge is not None:
+            score_value = await judge.ascore(response.get("answer", " "), row["grading_notes"])
+            judge_cost = Totals()
+        else:
+            with cost_scope(document=row.get("document_name")) as judge_cost:
+                score_value = await asyncio.to_thread(
+                    score_per_row, response.get("answer", " "), row["grading_notes"]
+                )
 
         return {
             **row,
             "response": response.get("answer", ""),
-            "score": score.value,
+            "score": score_value,
             "log_file": response.get("logs", " "),
+            "answer_tokens": answer_cost.tokens,
+            "answer_cost_usd": round(answer_cost.cost_usd, 6),
+            "judge_tokens": judge_cost.tokens,
+            "judge_cost_usd": round(judge_cost.cost_usd, 6),
         }
     return run_experiment
 
+#function to build a rag client over uploaded documents
+def build_rag_client(documents):
+    """RAG client over the given documents, sharing the Azure client"""
+    rag_client_instance = default_rag_client(llm_client=get_openai_client("answer"))
+    # Reuses a saved index when the same documents were evaluated before
+    rag_client_instance.load_or_build_index(
+        documents, os.getenv("RAG_INDEX_DIR", "indexes")
+    )
+    return rag_client_instance
+
+#everything besides the row itself that decides an evaluation result
+def eval_fingerprint(rag_client, judge=None):
+    fingerprint = {
+        "rag": rag_client.fingerprint(),
+        "judge_model": JUDGE_MODEL,
+        "metric": CORRECTNESS_PROMPT,
+    }
+    # batched verdicts can differ from per-row ones
+    fingerprint["judge"] = "batch" if judge is not None else "per_row"
+    return fingerprint
+
+#function to run the experiment only on rows without a cached result and merge both, in row order
+#the uncached rows are saved as their own dataset (pending_<run>), never over the full generated_qa_dataset
+async def run_rows_cached(rows, rag_client, cache=None, judge=None, run=None):
+    """
+    Returns:
+        (merged result rows, experiment name, number of rows served from cache)
+    """
+    fingerprint = eval_fingerprint(rag_client, judge)
+    keys = [row_key(row, fingerprint) for row in rows]
+    cached = cache.get_many(keys) if cache is not None else {}
+    pending = [row for row, key in zip(rows, keys) if key not in cached]
+
+    fresh = {}
+    name = None
+    if pending:
+        run_experiment_instance = create_run_experiment(rag_client, judge=judge)
+        pending_name = f"pending_{run}" if run else f"pending_{datetime.now():%Y%m%d_%H%M%S_%f}"
+        experiment_results = await run_experiment_instance.arun(make_dataset(pending, name=pending_name))
+        name = experiment_results.name
+        # rows may finish out of order: match them back by key
+        for record in experiment_results.to_pandas().to_dict("records"):
+            fresh[row_key(record, fingerprint)] = {
+                column: record.get(column) for column in RESULT_COLUMNS + COST_COLUMNS
+            }
+        if cache is not None:
+            cache.put_many([
+                (key, {column: result[column] for column in RESULT_COLUMNS})
+                for key, result in fresh.items()
+                if not str(result["response"]).startswith(ERROR_PREFIXES)
+            ])
+
+    no_cost = dict.fromkeys(COST_COLUMNS, 0)
+    merged = [{**row, **no_cost, **fresh.get(key, cached.get(key, {}))} for row, key in zip(rows, keys)]
+    return merged, name or f"cached_{datetime.now():%Y%m%d_%H%M%S}", len(rows) - len(pending)
+
 #function to run the rag evaluation from the generated q/a pairs and return the results as a pandas dataframe - easiest for streamlit digestion 
-async def run_evaluation_from_qa(qa_results, documents=None):
-    dataset = load_dataset_from_qa(qa_results)
+#callers that keep a client across runs (e.g. a cached Streamlit resource) can pass it as rag_client
+#rows whose question, grading notes, corpus, retriever, prompt and models are unchanged come from the eval cache
+#judge_batch_size > 1 grades that many rows per judge call ($EVAL_JUDGE_BATCH_SIZE, off by default)
+#token and cost totals of the run are in results.attrs["cost"] and experiments/<name>_cost.json;
+#a run over $LLM_BUDGET_TOKENS / $LLM_BUDGET_USD (or max_cost_usd) stops with BudgetExceeded
+async def run_evaluation_from_qa(
+    qa_results, documents=None, rag_client=None, use_cache=True, judge_batch_size=None,
+    max_cost_usd=None,
+):
+    import pandas as pd
+
+    if judge_batch_size is None:
+        judge_batch_size = int(os.getenv("EVAL_JUDGE_BATCH_SIZE", "0"))
+    judge = get_batch_judge(judge_batch_size) if judge_batch_size > 1 else None
+
+    rows = qa_rows(qa_results)
+    # Every row of the upload, e.g. for benchmarks/retrieval_quality.py
+    make_dataset(rows)
 
-    if documents:
-        from rag import default_rag_client
+    if rag_client is not None:
+        rag_client_instance = rag_client
+    elif documents:
         # Use same Azure client as page.py
-        rag_client_instance = default_rag_client(llm_client=openai_client)
-        rag_client_instance.set_documents(documents)
+        rag_client_instance = build_rag_client(documents)
     else:
-        from rag_eval.evals import rag_client
-        rag_client_instance = rag_client
+        rag_client_instance = get_rag_client()
 
-    run_experiment_instance = create_run_experiment(
-        rag_client_instance, llm, my_metric
+    run = f"eval_{datetime.now():%Y%m%d_%H%M%S_%f}"
+    with cost_scope(run=run, max_cost_usd=max_cost_usd):
+        merged, name, num_cached = await run_rows_cached(
+            rows, rag_client_instance, get_eval_cache() if use_cache else None, judge, run=run
+        )
+    cost = get_ledger().summary(run)
+    print(
+        f"Evaluated {len(rows) - num_cached} rows, {num_cached} from cache; "
+        f"{cost['total']['tokens']} tokens, ${cost['total']['cost_usd']:.4f}"
     )
 
-    experiment_results = await run_experiment_instance.arun(dataset)
-    experiment_results.save()
-    return experiment_results.to_pandas()
+    # experiment output holds every row, cached or fresh (same place and
+    # columns the local/csv backend uses)
+    results = pd.DataFrame(
+        merged, columns=["question", "grading_notes", "document_name", *RESULT_COLUMNS, *COST_COLUMNS]
+    )
+    experiments_dir = Path(__file__).parent / "experiments"
+    experiments_dir.mkdir(exist_ok=True)
+    results.to_csv(experiments_dir / f"{name}.csv", index=False)
+    with open(experiments_dir / f"{name}_cost.json", "w", encoding="utf-8") as f:
+        json.dump(cost, f, indent=2)
+    results.attrs["cost"] = cost
+    return results
 
 
 #main function that came from the installation of ragas evals to run the experiment
 async def main():
     dataset = load_dataset()
     print("dataset loaded successfully", dataset)
+    run_experiment = create_run_experiment(get_rag_client())
     experiment_results = await run_experiment.arun(dataset)
     print("Experiment completed successfully!")
     print("Experiment results:", experiment_results)
@@ -155,6 +315,4 @@ async def main():
 
 
 if __name__ == "__main__":
-    import asyncio
-
     asyncio.run(main())
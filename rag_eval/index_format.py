@@ -0,0 +1,236 @@
+"""
+On-disk format for retriever index snapshots.
+
+An index is a directory:
+
+    manifest.json            format name/version, retriever type and config, contents
+    documents.bin            UTF-8 document texts, concatenated
+    documents_offsets.npy    int64 [N + 1] byte offsets into documents.bin (the doc-ID table)
+    <name>.npy               retriever arrays (postings, doc lengths, vectors, ...)
+    <name>.bin/_offsets.npy  further string tables (e.g. the sorted vocabulary)
+
+Everything is a plain .npy array or a byte blob, so loading maps files with
+np.load(mmap_mode="r") and pages them in lazily instead of re-tokenizing
+the corpus. Snapshots are written to a temporary directory and renamed into
+place (the previous snapshot is renamed aside first, then removed), so
+readers never see a half-written index.
+"""
+
+import bisect
+import json
+import os
+import shutil
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+
+FORMAT_NAME = "rag-eval-index"
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+DOCUMENTS_TABLE = "documents"
+
+
+class IndexFormatError(ValueError):
+    """Raised when an index directory is missing, corrupt or of an unknown version"""
+
+
+class MappedStrings(Sequence[str]):
+    """
+    Read-only sequence of strings backed by a blob and an offsets array.
+
+    Strings are decoded on access, so a memory-mapped table costs no memory
+    until entries are actually read.
+    """
+
+    def __init__(self, blob: Union[np.ndarray, bytes], offsets: np.ndarray):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("string table index out of range")
+        start, end = int(self._offsets[index]), int(self._offsets[index + 1])
+        return bytes(self._blob[start:end]).decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the blob and offsets (mapped, not necessarily resident)"""
+        return len(self._blob) + self._offsets.nbytes
+
+    def find(self, value: str) -> Optional[int]:
+        """Position of value in a sorted table, or None (binary search)"""
+        i = bisect.bisect_left(self, value)
+        if i < len(self) and self[i] == value:
+            return i
+        return None
+
+
+def _write_strings(directory: str, name: str, strings: Sequence[str]) -> None:
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    with open(os.path.join(directory, f"{name}.bin"), "wb") as f:
+        for i, text in enumerate(strings):
+            data = text.encode("utf-8")
+            f.write(data)
+            offsets[i + 1] = offsets[i] + len(data)
+    np.save(os.path.join(directory, f"{name}_offsets.npy"), offsets)
+
+
+def write_index(
+    path: str,
+    retriever_type: str,
+    documents: Sequence[str],
+    arrays: Dict[str, np.ndarray],
+    tables: Optional[Dict[str, Sequence[str]]] = None,
+    config: Optional[Dict[str, Any]] = None,
+    directories: Optional[Dict[str, str]] = None,
+) -> str:
+    """
+    Write an index snapshot directory atomically
+
+    Args:
+        path: Target directory (replaced if it exists)
+        retriever_type: Class name used to pick the loader
+        documents: Document texts, in doc-ID order
+        arrays: Retriever-specific arrays, saved as <name>.npy
+        tables: Retriever-specific string tables
+        config: JSON-serializable retriever settings
+        directories: Subdirectories copied into the snapshot (name -> source
+            directory), e.g. the per-shard indexes of a sharded retriever
+
+    Returns:
+        The index path
+    """
+    path = os.path.abspath(path)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    tables = {DOCUMENTS_TABLE: documents, **(tables or {})}
+    for name, strings in tables.items():
+        _write_strings(tmp_path, name, strings)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), np.ascontiguousarray(array))
+    for name, source in (directories or {}).items():
+        shutil.copytree(source, os.path.join(tmp_path, name))
+
+    manifest = {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "retriever": retriever_type,
+        "num_documents": len(documents),
+        "created": datetime.now().isoformat(),
+        "arrays": sorted(arrays),
+        "tables": sorted(tables),
+        "config": config or {},
+    }
+    with open(os.path.join(tmp_path, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    _swap_into_place(tmp_path, path)
+    return path
+
+
+def _swap_into_place(tmp_path: str, path: str) -> None:
+    """
+    Rename a finished snapshot over path
+
+    A directory cannot be renamed over a non-empty one, so the old index is
+    renamed aside first and removed only after the new one is in place; path
+    is missing for just the instant between the two renames, and the old
+    index is restored if the second rename fails.
+    """
+    old_path = None
+    if os.path.exists(path):
+        old_path = f"{path}.old-{os.getpid()}"
+        if os.path.exists(old_path):
+            shutil.rmtree(old_path)
+        os.replace(path, old_path)
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        if old_path is not None:
+            os.replace(old_path, path)
+        raise
+    if old_path is not None:
+        shutil.rmtree(old_path, ignore_errors=True)
+
+
+def read_manifest(path: str) -> Dict[str, Any]:
+    """Read and validate an index manifest"""
+    manifest_path = os.path.join(path, MANIFEST)
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise IndexFormatError(f"No index at {path} (missing {MANIFEST})")
+    except ValueError as e:
+        raise IndexFormatError(f"Corrupt index manifest {manifest_path}: {e}")
+
+    if manifest.get("format") != FORMAT_NAME:
+        raise IndexFormatError(f"{path} is not a {FORMAT_NAME} directory")
+    if manifest.get("version") != FORMAT_VERSION:
+        raise IndexFormatError(
+            f"Index {path} has format version {manifest.get('version')}, "
+            f"expected {FORMAT_VERSION}; rebuild it with save()"
+        )
+    return manifest
+
+
+def load_array(path: str, name: str, mmap: bool = True) -> np.ndarray:
+    return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None)
+
+
+def load_strings(path: str, name: str, mmap: bool = True) -> MappedStrings:
+    offsets = load_array(path, f"{name}_offsets", mmap)
+    blob_path = os.path.join(path, f"{name}.bin")
+    if not mmap or int(offsets[-1]) == 0:  # zero-length files cannot be mapped
+        with open(blob_path, "rb") as f:
+            blob = f.read()
+    else:
+        blob = np.memmap(blob_path, dtype=np.uint8, mode="r")
+    return MappedStrings(blob, offsets)
+
+
+def build_postings(documents: Sequence[str]) -> Dict[str, Any]:
+    """
+    Inverted index over lowercased whitespace tokens, in CSR layout
+
+    Returns:
+        vocab (sorted list of terms), postings_offsets (int64 [V + 1]),
+        postings (int32 doc ids, ascending per term) and doc_lengths (int32 [N])
+    """
+    term_docs: Dict[str, List[int]] = {}
+    doc_lengths = np.zeros(len(documents), dtype=np.int32)
+    for doc_id, doc in enumerate(documents):
+        tokens = doc.lower().split()
+        doc_lengths[doc_id] = len(tokens)
+        for term in set(tokens):
+            term_docs.setdefault(term, []).append(doc_id)
+
+    vocab = sorted(term_docs)
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    for i, term in enumerate(vocab):
+        offsets[i + 1] = offsets[i] + len(term_docs[term])
+    postings = np.empty(int(offsets[-1]), dtype=np.int32)
+    for i, term in enumerate(vocab):
+        postings[offsets[i] : offsets[i + 1]] = term_docs[term]
+
+    return {
+        "vocab": vocab,
+        "postings_offsets": offsets,
+        "postings": postings,
+        "doc_lengths": doc_lengths,
+    }
@@ -0,0 +1,447 @@
+"""
+Shared gateway for every LLM and embedding call in the process.
+
+Call sites used to build their own OpenAI/AzureOpenAI clients, each with its
+own connection pool, no shared view of the rate limits and a hard-coded
+model. LLMGateway owns, per endpoint ("openai" or "azure"):
+
+  - one client with a keep-alive connection pool
+  - a request bucket and a token bucket (requests and tokens per minute),
+    drawn from before every call and corrected with the reported usage
+  - retries with jittered exponential backoff on 408/409/429/5xx and
+    connection errors, waiting at least as long as Retry-After asks
+
+Identical requests that are in flight at the same time are sent once and
+every caller receives the same response. Usage (requests, tokens, retries,
+coalesced calls, errors) is accounted per caller name, and every successful
+call is recorded in the cost ledger (see cost_ledger.py), which also enforces
+the budgets of the enclosing cost_scope().
+
+client_for(caller) returns an object with the OpenAI client surface used in
+this repo (chat.completions.create, embeddings.create), so ExampleRAG,
+BatchJudge and the Streamlit pages take it in place of an OpenAI client.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import asdict, dataclass
+from email.utils import parsedate_to_datetime
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Optional
+
+from context_budget import count_tokens
+from cost_ledger import CostLedger, get_ledger
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REQUESTS_PER_MINUTE = 500.0
+DEFAULT_TOKENS_PER_MINUTE = 150_000.0
+DEFAULT_MAX_CONNECTIONS = 32
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_CAP = 30.0
+# Completion tokens reserved for a chat call without max_tokens, until usage is known
+DEFAULT_COMPLETION_ESTIMATE = 256
+
+AZURE_API_VERSION = "2024-12-01-preview"
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+def model_for(role: str, default: str) -> str:
+    """Model for a role ("generation", "judge", ...), overridable with LLM_MODEL_<ROLE>"""
+    return os.getenv(f"LLM_MODEL_{role.upper()}", default)
+
+
+def default_endpoint() -> str:
+    """Azure when AZURE_ENDPOINT is set, else the public OpenAI API"""
+    return "azure" if os.getenv("AZURE_ENDPOINT") else "openai"
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled at rate_per_minute, holding at most one
+    minute's worth. acquire() blocks until the amount is available; a request
+    larger than the bucket waits for a full bucket and leaves it in debt.
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = rate_per_minute
+        self._tokens = rate_per_minute
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """Take amount, sleeping as needed; returns the seconds waited"""
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                needed = min(amount, self.capacity)
+                if self._tokens >= needed:
+                    self._tokens -= amount
+                    return waited
+                wait = (needed - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def adjust(self, amount: float) -> None:
+        """Charge (positive) or refund (negative) after the real cost is known"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens - amount)
+
+
+@dataclass
+class Usage:
+    requests: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+    retries: int = 0
+    coalesced: int = 0
+    errors: int = 0
+    throttled_seconds: float = 0.0
+    latency_seconds: float = 0.0
+
+
+def _headers(error: Exception) -> Dict[str, str]:
+    response = getattr(error, "response", None)
+    return dict(getattr(response, "headers", None) or {})
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Delay the server asked for (retry-after-ms or Retry-After), if any"""
+    headers = {k.lower(): v for k, v in _headers(error).items()}
+    if "retry-after-ms" in headers:
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def is_retryable(error: Exception) -> bool:
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    try:
+        from openai import APIConnectionError
+    except ImportError:
+        return False
+    return isinstance(error, APIConnectionError)  # includes APITimeoutError
+
+
+def _usage_of(response: Any) -> Dict[str, int]:
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return {}
+    prompt = getattr(usage, "prompt_tokens", 0) or 0
+    completion = getattr(usage, "completion_tokens", 0) or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": prompt,
+        "cached_tokens": getattr(details, "cached_tokens", 0) or 0,
+        "completion_tokens": completion,
+        "total_tokens": getattr(usage, "total_tokens", 0) or prompt + completion,
+    }
+
+
+def estimate_tokens(kind: str, kwargs: Dict[str, Any]) -> int:
+    """Tokens a request will use, for the token bucket before the call"""
+    if kind == "embeddings":
+        inputs = kwargs.get("input", "")
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        return sum(count_tokens(text) for text in inputs if isinstance(text, str))
+    prompt = sum(count_tokens(str(m.get("content") or "")) for m in kwargs.get("messages", []))
+    completion = kwargs.get("max_completion_tokens") or kwargs.get("max_tokens") or DEFAULT_COMPLETION_ESTIMATE
+    return prompt + completion
+
+
+class LLMGateway:
+    """Pooled clients, rate limits, retries, coalescing and usage per caller"""
+
+    def __init__(
+        self,
+        requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff_base: float = DEFAULT_BACKOFF_BASE,
+        backoff_cap: float = DEFAULT_BACKOFF_CAP,
+        coalesce: bool = True,
+        clients: Optional[Dict[str, Any]] = None,
+        ledger: Optional[CostLedger] = None,
+    ):
+        """
+        Args:
+            requests_per_minute: Request budget per endpoint (0 = unlimited)
+            tokens_per_minute: Token budget per endpoint (0 = unlimited)
+            max_connections: Keep-alive pool size of each endpoint's client
+            max_retries: Retries after the first attempt of a call
+            backoff_base: First backoff in seconds, doubled per retry
+            backoff_cap: Longest backoff in seconds
+            coalesce: Share one in-flight call among identical requests
+            clients: Prebuilt clients by endpoint name (e.g. fakes), used
+                instead of constructing OpenAI clients
+            ledger: Cost ledger calls are recorded in (default: the
+                process-wide one)
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.coalesce = coalesce
+        self._clients: Dict[str, Any] = dict(clients or {})
+        self.ledger = ledger if ledger is not None else get_ledger()
+        self._buckets: Dict[str, Dict[str, TokenBucket]] = {}
+        self._usage: Dict[str, Usage] = {}
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, **overrides: Any) -> "LLMGateway":
+        """Limits from LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE, LLM_MAX_CONNECTIONS, LLM_MAX_RETRIES"""
+        options = {
+            "requests_per_minute": float(os.getenv("LLM_REQUESTS_PER_MINUTE", DEFAULT_REQUESTS_PER_MINUTE)),
+            "tokens_per_minute": float(os.getenv("LLM_TOKENS_PER_MINUTE", DEFAULT_TOKENS_PER_MINUTE)),
+            "max_connections": int(os.getenv("LLM_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS)),
+            "max_retries": int(os.getenv("LLM_MAX_RETRIES", DEFAULT_MAX_RETRIES)),
+        }
+        options.update(overrides)
+        return cls(**options)
+
+    # ------------------------------------------------------------------
+    # Endpoints
+
+    def _build_client(self, endpoint: str):
+        import httpx
+        from openai import AzureOpenAI, DefaultHttpxClient, OpenAI
+
+        http_client = DefaultHttpxClient(
+            limits=httpx.Limits(
+                max_connections=self.max_connections, max_keepalive_connections=self.max_connections
+            )
+        )
+        # Retries are done here, where they also see the rate limits
+        if endpoint == "azure":
+            return AzureOpenAI(
+                api_version=AZURE_API_VERSION,
+                azure_endpoint=os.getenv("AZURE_ENDPOINT"),
+                api_key=os.getenv("OPEN_AI_AZURE_KEY"),
+                azure_deployment=os.getenv("AZURE_DEPLOYMENT", "gpt-4o"),
+                http_client=http_client,
+                max_retries=0,
+            )
+        if endpoint == "openai":
+            return OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client, max_retries=0)
+        raise ValueError(f"Unknown LLM endpoint: {endpoint}")
+
+    def raw_client(self, endpoint: Optional[str] = None):
+        """
+        The endpoint's pooled OpenAI client itself, for libraries that require
+        a real client instance; calls made on it bypass limits and accounting
+        """
+        endpoint = endpoint or default_endpoint()
+        with self._lock:
+            client = self._clients.get(endpoint)
+            if client is None:
+                client = self._clients[endpoint] = self._build_client(endpoint)
+            return client
+
+    def _bucket(self, endpoint: str, name: str) -> TokenBucket:
+        with self._lock:
+            buckets = self._buckets.get(endpoint)
+            if buckets is None:
+                buckets = self._buckets[endpoint] = {
+                    "requests": TokenBucket(self.requests_per_minute),
+                    "tokens": TokenBucket(self.tokens_per_minute),
+                }
+            return buckets[name]
+
+    def client_for(self, caller: str, endpoint: Optional[str] = None) -> "GatewayClient":
+        """OpenAI-client-shaped handle whose calls are limited and accounted under caller"""
+        return GatewayClient(self, caller, endpoint or default_endpoint())
+
+    # ------------------------------------------------------------------
+    # Calls
+
+    def _account(self, caller: str, **counts: Any) -> None:
+        with self._lock:
+            usage = self._usage.setdefault(caller, Usage())
+            for name, value in counts.items():
+                setattr(usage, name, getattr(usage, name) + value)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        requested = retry_after_seconds(error)
+        return max(delay, requested) if requested is not None else delay
+
+    def _send(self, caller: str, endpoint: str, kind: str, kwargs: Dict[str, Any]) -> Any:
+        client = self.raw_client(endpoint)
+        create: Callable[..., Any] = (
+            client.embeddings.create if kind == "embeddings" else client.chat.completions.create
+        )
+        estimate = estimate_tokens(kind, kwargs)
+        # Raises BudgetExceeded before anything is sent; the estimate stays
+        # reserved against the budgets until the call is recorded or fails
+        reservation = self.ledger.check(kwargs.get("model"), estimate)
+        try:
+            for attempt in range(self.max_retries + 1):
+                throttled = self._bucket(endpoint, "requests").acquire(1)
+                throttled += self._bucket(endpoint, "tokens").acquire(estimate)
+                started = time.perf_counter()
+                try:
+                    response = create(**kwargs)
+                except Exception as e:
+                    self._bucket(endpoint, "tokens").adjust(-estimate)
+                    if attempt >= self.max_retries or not is_retryable(e):
+                        self._account(caller, requests=1, errors=1, throttled_seconds=throttled)
+                        raise
+                    delay = self._backoff(attempt, e)
+                    logger.warning(
+                        f"{caller}: {kind} call failed ({e}); retry {attempt + 1}/{self.max_retries} in {delay:.2f}s"
+                    )
+                    self._account(caller, requests=1, retries=1, throttled_seconds=throttled)
+                    time.sleep(delay)
+                    continue
+                usage = _usage_of(response)
+                if usage:
+                    self._bucket(endpoint, "tokens").adjust(usage["total_tokens"] - estimate)
+                    if kind == "embeddings":
+                        self.ledger.record(
+                            caller,
+                            kwargs.get("model"),
+                            embedding_tokens=usage["total_tokens"],
+                            reservation=reservation,
+                        )
+                    else:
+                        self.ledger.record(
+                            caller,
+                            kwargs.get("model"),
+                            prompt_tokens=usage["prompt_tokens"],
+                            completion_tokens=usage["completion_tokens"],
+                            cached_tokens=usage["cached_tokens"],
+                            reservation=reservation,
+                        )
+                self._account(
+                    caller,
+                    requests=1,
+                    throttled_seconds=throttled,
+                    latency_seconds=time.perf_counter() - started,
+                    **usage,
+                )
+                return response
+        finally:
+            # No-op once recorded
+            self.ledger.release(reservation)
+
+    def call(self, caller: str, endpoint: str, kind: str, **kwargs: Any) -> Any:
+        """
+        One chat ("chat") or embeddings ("embeddings") request with the
+        OpenAI create() keyword arguments
+        """
+        key = None
+        if self.coalesce and not kwargs.get("stream"):
+            payload = json.dumps([endpoint, kind, kwargs], sort_keys=True, default=str)
+            key = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+            with self._lock:
+                future = self._inflight.get(key)
+                leader = future is None
+                if leader:
+                    future = self._inflight[key] = Future()
+            if not leader:
+                self._account(caller, coalesced=1)
+                return future.result()
+
+        try:
+            response = self._send(caller, endpoint, kind, kwargs)
+        except BaseException as e:
+            if key is not None:
+                future.set_exception(e)
+            raise
+        else:
+            if key is not None:
+                future.set_result(response)
+            return response
+        finally:
+            if key is not None:
+                with self._lock:
+                    self._inflight.pop(key, None)
+
+    def usage(self, caller: Optional[str] = None) -> Dict[str, Any]:
+        """Usage counters of one caller, or of every caller by name"""
+        with self._lock:
+            if caller is not None:
+                return asdict(self._usage.get(caller, Usage()))
+            return {name: asdict(usage) for name, usage in self._usage.items()}
+
+
+class _Create:
+    def __init__(self, client: "GatewayClient", kind: str):
+        self._client = client
+        self._kind = kind
+
+    def create(self, **kwargs: Any) -> Any:
+        client = self._client
+        return client.gateway.call(client.caller, client.endpoint, self._kind, **kwargs)
+
+
+class GatewayClient:
+    """The subset of the OpenAI client used in this repo, routed through a gateway"""
+
+    def __init__(self, gateway: LLMGateway, caller: str, endpoint: str):
+        self.gateway = gateway
+        self.caller = caller
+        self.endpoint = endpoint
+        self.chat = SimpleNamespace(completions=_Create(self, "chat"))
+        self.embeddings = _Create(self, "embeddings")
+
+    def usage(self) -> Dict[str, Any]:
+        return self.gateway.usage(self.caller)
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    """The process-wide gateway, configured from the environment on first use"""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway.from_env()
+        return _gateway
+
+
+def configure_gateway(**options: Any) -> LLMGateway:
+    """Replace the process-wide gateway (e.g. a service sizing its pool at startup)"""
+    global _gateway
+    with _gateway_lock:
+        _gateway = LLMGateway.from_env(**options)
+        return _gateway
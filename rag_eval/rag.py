@@ -1,11 +1,33 @@
-import json
+import contextvars
+import copy
+import hashlib
 import os
-from dataclasses import asdict, dataclass
+import sys
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
 from dotenv import load_dotenv
 
-from openai import OpenAI
+from context_budget import ContextAssembler
+from cost_ledger import BudgetExceeded
+from llm_gateway import get_gateway, model_for
+from index_format import (
+    DOCUMENTS_TABLE,
+    IndexFormatError,
+    MappedStrings,
+    build_postings,
+    load_array,
+    load_strings,
+    read_manifest,
+    write_index,
+)
+from trace_store import open_store
+from tracing import TraceEvent, TraceRecorder, TraceSink  # noqa: F401
 
 load_dotenv()
 
@@ -18,19 +40,118 @@ DOCUMENTS = [
 ]
 
 
-@dataclass
-class TraceEvent:
-    """Single event in the RAG application trace"""
+DEFAULT_SYSTEM_PROMPT = """Answer the following question based on the provided documents.
+Documents:
+{context}
+Question: {query}
+Answer:"""
+
+# Appended to templates that have no {query}/{context} placeholders
+DEFAULT_PROMPT_SUFFIX = """Documents:
+{context}
+Question: {query}
+Answer:"""
+
+_PLACEHOLDERS = ("{query}", "{context}")
 
-    event_type: str
-    component: str
-    data: Dict[str, Any]
+GENERATION_MODEL = model_for("generation", "gpt-4o")
+NO_DOCUMENTS_ANSWER = "I couldn't find any relevant documents to answer your question."
+
+# Upper bound on the (queries x documents) score matrix a batch query
+# materializes at once; larger batches are scored in blocks
+BATCH_SCORE_CELLS = 1 << 22
+
+
+def split_prompt_template(template: str) -> Tuple[str, str]:
+    """
+    Split a prompt template into a static prefix and a variable suffix.
+
+    Providers cache prompts by exact prefix, so everything before the first
+    {query}/{context} placeholder is sent once as the system message and the
+    remainder is formatted into the user message. The instructions are then a
+    byte-identical prefix across requests and only the tail varies.
+
+    Returns:
+        (instructions, suffix_template)
+    """
+    positions = [template.find(p) for p in _PLACEHOLDERS if p in template]
+    if not positions:
+        return template.strip(), DEFAULT_PROMPT_SUFFIX
+
+    cut = min(positions)
+    # Keep labels such as "Question:" or a "Documents:" line with the variable
+    # part they introduce
+    line_start = template.rfind("\n", 0, cut) + 1
+    if template[line_start:cut].strip():
+        cut = line_start
+    else:
+        prev_start = template.rfind("\n", 0, max(line_start - 1, 0)) + 1
+        if template[prev_start:line_start].strip().endswith(":"):
+            cut = prev_start
+    return template[:cut].strip(), template[cut:].strip()
+
+
+def cached_prompt_tokens(usage) -> Optional[int]:
+    """Prompt tokens served from the provider's prompt cache, if reported"""
+    details = getattr(usage, "prompt_tokens_details", None)
+    if details is None:
+        return None
+    return getattr(details, "cached_tokens", None)
+
+
+def corpus_digest(documents: Sequence[str], salt: str = "") -> str:
+    """sha256 over the documents' own hashes, so it is independent of how they are joined"""
+    digest = hashlib.sha256(salt.encode("utf-8"))
+    for doc in documents:
+        digest.update(hashlib.sha256(doc.encode("utf-8")).digest())
+    return digest.hexdigest()
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> List[Tuple[int, Any]]:
+    """
+    Top-k (index, score) pairs, best first, ties broken by lower index
+
+    Matches a stable sort of all scores, but only fully sorts the candidates.
+    """
+    n = len(scores)
+    k = min(k, n)
+    if k <= 0:
+        return []
+    if k < n:
+        kth = np.partition(scores, n - k)[n - k]
+        above = np.flatnonzero(scores > kth)
+        ties = np.flatnonzero(scores == kth)[: k - len(above)]
+        candidates = np.concatenate([above, ties])
+    else:
+        candidates = np.arange(n)
+    order = candidates[np.lexsort((candidates, -scores[candidates]))]
+    return [(int(i), scores[i].item()) for i in order]
+
+
+def top_k_rows(scores: np.ndarray, k: int) -> List[List[Tuple[int, Any]]]:
+    """
+    top_k_indices for every row of an integer score matrix, vectorized
+
+    Score and index are folded into one int64 key (higher score first, then
+    lower index), so a single argpartition over the block keeps the ties rule.
+    """
+    rows, n = scores.shape
+    k = min(k, n)
+    if k <= 0:
+        return [[] for _ in range(rows)]
+    keys = scores.astype(np.int64) * n + (n - 1 - np.arange(n))
+    candidates = np.argpartition(-keys, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(keys, candidates, axis=1), axis=1)
+    indices = np.take_along_axis(candidates, order, axis=1)
+    values = np.take_along_axis(scores, indices, axis=1)
+    return [list(zip(i, v)) for i, v in zip(indices.tolist(), values.tolist())]
 
 
 class BaseRetriever:
     """
     Base class for retrievers.
-    Subclasses should implement the fit and get_top_k methods.
+    Subclasses should implement the fit and get_top_k methods, and
+    _index_arrays/_load_index to support save() and load().
     """
 
     def __init__(self):
@@ -40,39 +161,332 @@ class BaseRetriever:
         """Store the documents"""
         self.documents = documents
 
+    def fitted_copy(self, documents: Sequence[str]) -> "BaseRetriever":
+        """
+        Return a new retriever of the same configuration fitted on documents,
+        leaving this one untouched.
+
+        Subclasses whose fit() mutates shared state in place (rather than
+        rebinding attributes) should override this.
+        """
+        retriever = copy.copy(self)
+        retriever.fit(documents)
+        return retriever
+
     def get_top_k(self, query: str, k: int = 3) -> List[tuple]:
         """Retrieve top-k most relevant documents for the query."""
         raise NotImplementedError("Subclasses should implement this method.")
 
+    def get_top_k_batch(self, queries: Sequence[str], k: int = 3) -> List[List[tuple]]:
+        """
+        Top-k for every query, in order; same results as calling get_top_k
+        per query. Subclasses override this with vectorized scoring.
+        """
+        return [self.get_top_k(query, k) for query in queries]
+
+    def _block_size(self) -> int:
+        """Queries per block so a block's score matrix stays under BATCH_SCORE_CELLS"""
+        return max(1, BATCH_SCORE_CELLS // max(len(self.documents), 1))
+
+    def config(self) -> Dict[str, Any]:
+        """JSON-serializable settings that affect results (saved with the index)"""
+        return {}
+
+    def memory_footprint(self) -> Dict[str, int]:
+        """Approximate bytes held by the documents and index structures"""
+        documents = self.documents
+        if isinstance(documents, MappedStrings):
+            documents_bytes = documents.nbytes
+        else:
+            documents_bytes = sys.getsizeof(documents) + sum(sys.getsizeof(d) for d in documents)
+        return {"documents_bytes": documents_bytes, "index_bytes": 0}
+
+    def _index_arrays(self) -> Tuple[Dict[str, np.ndarray], Dict[str, Sequence[str]], Dict[str, Any]]:
+        """(arrays, string tables, config) persisted by save()"""
+        raise NotImplementedError(f"{type(self).__name__} does not support save()")
+
+    def _load_index(self, path: str, manifest: Dict[str, Any], mmap: bool) -> None:
+        """Restore the state written by _index_arrays"""
+        raise NotImplementedError(f"{type(self).__name__} does not support load()")
+
+    def save(self, path: str) -> str:
+        """
+        Write the fitted index to a versioned snapshot directory
+
+        Args:
+            path: Directory to write (replaced atomically if it exists)
+
+        Returns:
+            The absolute index path
+        """
+        arrays, tables, config = self._index_arrays()
+        return write_index(
+            path, type(self).__name__, self.documents, arrays, tables=tables, config=config
+        )
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True, **kwargs) -> "BaseRetriever":
+        """
+        Open a snapshot written by save()
+
+        Args:
+            path: Index directory
+            mmap: Memory-map the arrays and documents instead of reading them
+            **kwargs: Constructor arguments for the retriever (e.g. an
+                embedding client); saved config fills in the rest
+
+        Returns:
+            A fitted retriever of the saved type
+        """
+        manifest = read_manifest(path)
+        if manifest["retriever"] == "ShardedRetriever":
+            import sharded_retriever  # noqa: F401  (registers itself; imports this module)
+        retriever_cls = RETRIEVER_TYPES.get(manifest["retriever"])
+        if retriever_cls is None:
+            raise IndexFormatError(f"Unknown retriever type in {path}: {manifest['retriever']}")
+        if not issubclass(retriever_cls, cls):
+            raise IndexFormatError(
+                f"{path} holds a {manifest['retriever']}, not a {cls.__name__}"
+            )
+
+        retriever = retriever_cls(**{**manifest["config"], **kwargs})
+        retriever.documents = load_strings(path, DOCUMENTS_TABLE, mmap)
+        retriever._load_index(path, manifest, mmap)
+        return retriever
+
 
 class SimpleKeywordRetriever(BaseRetriever):
-    """Ultra-simple keyword matching retriever"""
+    """
+    Ultra-simple keyword matching retriever
+
+    Scores are the number of query words present in a document. fit() builds
+    a CSR inverted index (int64 term offsets into int32 doc-id postings) with
+    a term -> id dict, so a query only touches the postings of its own words
+    and the corpus is never re-tokenized. load() maps the same arrays from
+    disk and looks terms up in the sorted on-disk vocabulary instead of
+    building the dict.
+    """
 
     def __init__(self):
         super().__init__()
+        self._vocab: Optional[Sequence[str]] = None
+        self._term_ids: Optional[Dict[str, int]] = None
+        self._postings_offsets: Optional[np.ndarray] = None
+        self._postings: Optional[np.ndarray] = None
+        self._doc_lengths: Optional[np.ndarray] = None
 
-    def _count_keyword_matches(self, query: str, document: str) -> int:
-        """Count how many query words appear in the document"""
-        query_words = query.lower().split()
-        document_words = document.lower().split()
-        matches = 0
-        for word in query_words:
-            if word in document_words:
-                matches += 1
-        return matches
+    def fit(self, documents: List[str]):
+        super().fit(documents)
+        index = build_postings(documents)
+        self._vocab = index["vocab"]
+        self._term_ids = {term: i for i, term in enumerate(self._vocab)}
+        self._postings_offsets = index["postings_offsets"]
+        self._postings = index["postings"]
+        self._doc_lengths = index["doc_lengths"]
+
+    def _term_id(self, word: str) -> Optional[int]:
+        if self._term_ids is not None:
+            return self._term_ids.get(word)
+        return self._vocab.find(word)
+
+    def _score_postings(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self.documents), dtype=np.int32)
+        for word in query.lower().split():
+            term = self._term_id(word)
+            if term is not None:
+                start, end = self._postings_offsets[term], self._postings_offsets[term + 1]
+                scores[self._postings[start:end]] += 1
+        return scores
+
+    def get_top_k_batch(self, queries: Sequence[str], k: int = 3) -> List[List[tuple]]:
+        """
+        Score a block of queries at once: the binary query-term matrix times
+        the term-document postings, computed as one bincount over the
+        concatenated postings of every (query, term) pair
+        """
+        if self._postings is None:
+            return super().get_top_k_batch(queries, k)
+
+        n = len(self.documents)
+        tokenized = [query.lower().split() for query in queries]
+        # Each distinct word is looked up once per batch
+        term_ids = {word: self._term_id(word) for words in tokenized for word in set(words)}
+        block = self._block_size()
+        results: List[List[tuple]] = []
+        for start in range(0, len(queries), block):
+            chunk = tokenized[start : start + block]
+            rows, slices = [], []
+            for row, words in enumerate(chunk):
+                for word in words:
+                    term = term_ids[word]
+                    if term is not None:
+                        rows.append(row)
+                        slices.append(
+                            self._postings[self._postings_offsets[term] : self._postings_offsets[term + 1]]
+                        )
+            cells = np.zeros(0, dtype=np.int64)
+            if slices:
+                lengths = [len(postings) for postings in slices]
+                cells = np.repeat(np.asarray(rows, dtype=np.int64) * n, lengths) + np.concatenate(slices)
+            scores = np.bincount(cells, minlength=len(chunk) * n).reshape(len(chunk), n)
+            results.extend(top_k_rows(scores, k))
+        return results
 
     def get_top_k(self, query: str, k: int = 3) -> List[tuple]:
         """Get top k documents by keyword match count"""
-        scores = []
+        if self._postings is None:
+            return []
+        return top_k_indices(self._score_postings(query), k)
+
+    def memory_footprint(self) -> Dict[str, int]:
+        footprint = super().memory_footprint()
+        arrays = {
+            "postings": self._postings,
+            "postings_offsets": self._postings_offsets,
+            "doc_lengths": self._doc_lengths,
+        }
+        for name, array in arrays.items():
+            footprint[f"{name}_bytes"] = int(array.nbytes) if array is not None else 0
+        if self._term_ids is not None:
+            # dict table plus the term strings (shared with the sorted vocab list)
+            footprint["vocab_bytes"] = sys.getsizeof(self._term_ids) + sys.getsizeof(self._vocab) + sum(
+                sys.getsizeof(term) for term in self._vocab
+            )
+        elif self._vocab is not None:
+            footprint["vocab_bytes"] = self._vocab.nbytes
+        footprint["num_terms"] = len(self._vocab) if self._vocab is not None else 0
+        footprint["index_bytes"] = sum(
+            footprint[key] for key in ("postings_bytes", "postings_offsets_bytes", "doc_lengths_bytes")
+        ) + footprint.get("vocab_bytes", 0)
+        return footprint
+
+    def _index_arrays(self):
+        arrays = {
+            "postings_offsets": self._postings_offsets,
+            "postings": self._postings,
+            "doc_lengths": self._doc_lengths,
+        }
+        return arrays, {"vocab": self._vocab}, self.config()
+
+    def _load_index(self, path: str, manifest: Dict[str, Any], mmap: bool) -> None:
+        self._vocab = load_strings(path, "vocab", mmap)
+        self._term_ids = None
+        self._postings_offsets = load_array(path, "postings_offsets", mmap)
+        self._postings = load_array(path, "postings", mmap)
+        self._doc_lengths = load_array(path, "doc_lengths", mmap)
+
+
+class EmbeddingRetriever(BaseRetriever):
+    """
+    Dense retriever: cosine similarity between OpenAI-style embeddings
+
+    Document vectors are L2-normalized float32 rows, so scoring a query is a
+    single matrix-vector product.
+    """
+
+    def __init__(
+        self,
+        embedding_client=None,
+        model: str = "text-embedding-3-small",
+        batch_size: int = 256,
+    ):
+        """
+        Args:
+            embedding_client: Client with embeddings.create(model=..., input=[...])
+            model: Embedding model name
+            batch_size: Documents per embeddings request while fitting
+        """
+        super().__init__()
+        self.embedding_client = embedding_client
+        self.model = model
+        self.batch_size = batch_size
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Embed texts into normalized float32 rows"""
+        if self.embedding_client is None:
+            raise ValueError("EmbeddingRetriever needs an embedding_client to embed text")
+        rows = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = list(texts[start : start + self.batch_size])
+            response = self.embedding_client.embeddings.create(model=self.model, input=batch)
+            rows.extend(item.embedding for item in sorted(response.data, key=lambda d: d.index))
+        vectors = np.asarray(rows, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def fit(self, documents: List[str]):
+        super().fit(documents)
+        self.vectors = self.embed(documents) if len(documents) else np.zeros((0, 0), np.float32)
+
+    def get_top_k(self, query: str, k: int = 3) -> List[tuple]:
+        """Get top k documents by cosine similarity"""
+        if not len(self.documents):
+            return []
+        scores = self.vectors @ self.embed([query])[0]
+        return top_k_indices(scores, k)
+
+    def get_top_k_batch(self, queries: Sequence[str], k: int = 3) -> List[List[tuple]]:
+        """Embed all queries in batched requests, then score blocks with one matrix multiply"""
+        if not len(self.documents):
+            return [[] for _ in queries]
+        query_vectors = self.embed(list(queries))
+        block = self._block_size()
+        results: List[List[tuple]] = []
+        for start in range(0, len(queries), block):
+            scores = query_vectors[start : start + block] @ self.vectors.T
+            results.extend(top_k_indices(row_scores, k) for row_scores in scores)
+        return results
+
+    def config(self) -> Dict[str, Any]:
+        return {"model": self.model, "batch_size": self.batch_size}
+
+    def memory_footprint(self) -> Dict[str, int]:
+        footprint = super().memory_footprint()
+        footprint["vectors_bytes"] = footprint["index_bytes"] = int(self.vectors.nbytes)
+        return footprint
+
+    def _index_arrays(self):
+        return {"vectors": self.vectors}, {}, self.config()
+
+    def _load_index(self, path: str, manifest: Dict[str, Any], mmap: bool) -> None:
+        self.vectors = load_array(path, "vectors", mmap)
+
+
+RETRIEVER_TYPES = {
+    cls.__name__: cls for cls in (SimpleKeywordRetriever, EmbeddingRetriever)
+}
+
+
+@dataclass(frozen=True)
+class CorpusSnapshot:
+    """
+    Immutable view of the knowledge base: the documents and a retriever
+    fitted on exactly those documents.
+
+    ExampleRAG swaps whole snapshots on update, so a query that captured a
+    snapshot keeps consistent document ids even if the corpus changes
+    mid-flight.
+    """
+
+    documents: Sequence[str]
+    retriever: BaseRetriever
+    version: int = 0
+    is_fitted: bool = False
+
 
-        for i, doc in enumerate(self.documents):
-            match_count = self._count_keyword_matches(query, doc)
-            scores.append((i, match_count))
+@dataclass
+class RequestContext:
+    """Per-request state: the trace recorder and the corpus snapshot in use"""
+
+    snapshot: CorpusSnapshot
+    run_id: Optional[str] = None
+    traces: TraceRecorder = field(default_factory=TraceRecorder)
 
-        # Sort by match count (descending)
-        scores.sort(key=lambda x: x[1], reverse=True)
 
-        return scores[:k]
+def new_run_id() -> str:
+    """Unique run id; concurrent queries for the same question do not collide"""
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
 
 
 class ExampleRAG:
@@ -81,6 +495,12 @@ class ExampleRAG:
     1. accepts a llm client
     2. uses simple keyword matching to retrieve relevant documents
     3. uses the llm client to generate a response based on the retrieved documents when a query is made
+
+    One instance can serve many threads or asyncio tasks: per-query traces
+    live in a RequestContext, and the corpus is an immutable CorpusSnapshot
+    replaced atomically by add_documents()/set_documents(). Only those
+    writers take a lock; queries read the current snapshot once and never
+    block.
     """
 
     def __init__(
@@ -89,6 +509,8 @@ class ExampleRAG:
         retriever: Optional[BaseRetriever] = None,
         system_prompt: Optional[str] = None,
         logdir: str = "logs",
+        context_assembler: Optional[ContextAssembler] = None,
+        trace_sink: Optional[TraceSink] = None,
     ):
         """
         Initialize RAG system
@@ -98,249 +520,412 @@ class ExampleRAG:
             retriever: Document retriever (defaults to SimpleKeywordRetriever)
             system_prompt: System prompt template for generation
             logdir: Directory for trace log files
+            context_assembler: Builds the prompt context under a token budget
+                (defaults to ContextAssembler with DEFAULT_CONTEXT_TOKEN_BUDGET)
+            trace_sink: Where finished query traces go (defaults to an
+                append-only TraceStore in logdir)
         """
         self.llm_client = llm_client
-        self.retriever = retriever or SimpleKeywordRetriever()
-        self.system_prompt = (
-            system_prompt
-            or """Answer the following question based on the provided documents:
-                                Question: {query}
-                                Documents:
-                                {context}
-                                Answer:
-                            """
+        retriever = retriever or SimpleKeywordRetriever()
+        self.context_assembler = context_assembler or ContextAssembler()
+        self.system_prompt = system_prompt or DEFAULT_SYSTEM_PROMPT
+        self.instructions, self.prompt_template = split_prompt_template(
+            self.system_prompt
         )
-        self.documents = []
-        self.is_fitted = False
-        self.traces = []
+        self._snapshot = CorpusSnapshot(documents=(), retriever=retriever)
+        self._update_lock = threading.Lock()
+        # (snapshot, corpus digest) of the last fingerprint() call
+        self._digest: Optional[Tuple[CorpusSnapshot, str]] = None
+        # Lifecycle events (init, document updates); queries trace into their
+        # own RequestContext
+        self.traces = TraceRecorder()
         self.logdir = logdir
+        self.trace_sink = trace_sink or open_store(self.logdir)
 
         # Create log directory if it doesn't exist
         os.makedirs(self.logdir, exist_ok=True)
 
         # Initialize tracing
-        self.traces.append(
-            TraceEvent(
-                event_type="init",
-                component="rag_system",
-                data={
-                    "retriever_type": type(self.retriever).__name__,
-                    "system_prompt_length": len(self.system_prompt),
-                    "logdir": self.logdir,
-                },
-            )
+        self.traces.event(
+            "init",
+            "rag_system",
+            retriever_type=type(retriever).__name__,
+            system_prompt_length=len(self.system_prompt),
+            context_token_budget=self.context_assembler.max_tokens,
+            logdir=self.logdir,
+            trace_sink=type(self.trace_sink).__name__,
         )
 
-    def add_documents(self, documents: List[str]):
-        """Add documents to the knowledge base"""
-        self.traces.append(
-            TraceEvent(
-                event_type="document_operation",
-                component="rag_system",
-                data={
-                    "operation": "add_documents",
-                    "num_new_documents": len(documents),
-                    "total_documents_before": len(self.documents),
-                    "document_lengths": [len(doc) for doc in documents],
-                },
-            )
+    @property
+    def snapshot(self) -> CorpusSnapshot:
+        """The corpus snapshot new queries will use"""
+        return self._snapshot
+
+    @property
+    def documents(self) -> Sequence[str]:
+        return self._snapshot.documents
+
+    @property
+    def retriever(self) -> BaseRetriever:
+        return self._snapshot.retriever
+
+    @property
+    def is_fitted(self) -> bool:
+        return self._snapshot.is_fitted
+
+    def fingerprint(self) -> Dict[str, Any]:
+        """
+        Everything that determines the answer to a given question: corpus,
+        retriever and its settings, prompt, context budget and model. Used to
+        key cached evaluation results.
+        """
+        snapshot = self._snapshot
+        if self._digest is None or self._digest[0] is not snapshot:
+            self._digest = (snapshot, corpus_digest(snapshot.documents))
+        return {
+            "corpus": self._digest[1],
+            "retriever": type(snapshot.retriever).__name__,
+            "retriever_config": snapshot.retriever.config(),
+            "system_prompt": self.system_prompt,
+            "context_token_budget": self.context_assembler.max_tokens,
+            "model": GENERATION_MODEL,
+        }
+
+    def new_context(self, run_id: Optional[str] = None) -> RequestContext:
+        """Start a request against the current corpus snapshot"""
+        return RequestContext(snapshot=self._snapshot, run_id=run_id)
+
+    def _publish(
+        self,
+        documents: Sequence[str],
+        current: CorpusSnapshot,
+        retriever: Optional[BaseRetriever] = None,
+    ) -> CorpusSnapshot:
+        """
+        Atomically swap in a new snapshot, fitting a retriever on documents
+        unless an already fitted one (e.g. loaded from disk) is given
+        """
+        if retriever is None:
+            with self.traces.span(
+                "document_operation",
+                "retriever",
+                operation="fit",
+                retriever_type=type(current.retriever).__name__,
+            ) as span:
+                retriever = current.retriever.fitted_copy(list(documents))
+                span.set(total_documents=len(documents), version=current.version + 1)
+
+        snapshot = CorpusSnapshot(
+            documents=documents,
+            retriever=retriever,
+            version=current.version + 1,
+            is_fitted=True,
         )
+        self._snapshot = snapshot
+        return snapshot
 
-        self.documents.extend(documents)
-        # Refit retriever with all documents
-        self.retriever.fit(self.documents)
-        self.is_fitted = True
-
-        self.traces.append(
-            TraceEvent(
-                event_type="document_operation",
-                component="retriever",
-                data={
-                    "operation": "fit_completed",
-                    "total_documents": len(self.documents),
-                    "retriever_type": type(self.retriever).__name__,
-                },
+    def add_documents(self, documents: List[str]):
+        """Add documents to the knowledge base"""
+        with self._update_lock:
+            current = self._snapshot
+            self.traces.event(
+                "document_operation",
+                "rag_system",
+                operation="add_documents",
+                num_new_documents=len(documents),
+                total_documents_before=len(current.documents),
+                total_new_characters=sum(len(doc) for doc in documents),
             )
-        )
+            # Refit retriever with all documents
+            self._publish(tuple(current.documents) + tuple(documents), current)
 
     def set_documents(self, documents: List[str]):
         """Set documents (replacing any existing ones)"""
-        old_doc_count = len(self.documents)
-
-        self.traces.append(
-            TraceEvent(
-                event_type="document_operation",
-                component="rag_system",
-                data={
-                    "operation": "set_documents",
-                    "num_new_documents": len(documents),
-                    "old_document_count": old_doc_count,
-                    "document_lengths": [len(doc) for doc in documents],
-                },
+        with self._update_lock:
+            current = self._snapshot
+            self.traces.event(
+                "document_operation",
+                "rag_system",
+                operation="set_documents",
+                num_new_documents=len(documents),
+                old_document_count=len(current.documents),
+                total_new_characters=sum(len(doc) for doc in documents),
             )
-        )
+            self._publish(tuple(documents), current)
+
+    def save_index(self, path: str) -> str:
+        """Persist the current corpus and retriever index (see BaseRetriever.save)"""
+        snapshot = self._snapshot
+        if not snapshot.is_fitted:
+            raise ValueError("Nothing to save: no documents have been added.")
+        with self.traces.span(
+            "document_operation", "retriever", operation="save_index", path=path
+        ) as span:
+            path = snapshot.retriever.save(path)
+            span.set(total_documents=len(snapshot.documents))
+        return path
+
+    def load_index(self, path: str, mmap: bool = True, **kwargs) -> CorpusSnapshot:
+        """
+        Replace the corpus with a saved index snapshot
 
-        self.documents = documents
-        self.retriever.fit(self.documents)
-        self.is_fitted = True
-
-        self.traces.append(
-            TraceEvent(
-                event_type="document_operation",
-                component="retriever",
-                data={
-                    "operation": "fit_completed",
-                    "total_documents": len(self.documents),
-                    "retriever_type": type(self.retriever).__name__,
-                },
-            )
-        )
+        Args:
+            path: Directory written by save_index()/BaseRetriever.save()
+            mmap: Memory-map the index instead of reading it into memory
+            **kwargs: Passed to the retriever constructor (e.g. embedding_client)
+        """
+        with self._update_lock:
+            current = self._snapshot
+            with self.traces.span(
+                "document_operation", "retriever", operation="load_index", path=path, mmap=mmap
+            ) as span:
+                retriever = BaseRetriever.load(path, mmap=mmap, **kwargs)
+                span.set(
+                    retriever_type=type(retriever).__name__,
+                    total_documents=len(retriever.documents),
+                )
+            return self._publish(retriever.documents, current, retriever)
+
+    def load_or_build_index(self, documents: Sequence[str], index_root: str) -> str:
+        """
+        Use a saved index for exactly these documents if one exists, otherwise
+        fit on them and save one for the next process
+
+        Indexes live in index_root under a hash of the documents and the
+        retriever type, so a changed corpus never loads a stale index.
+
+        Returns:
+            The index path
+        """
+        digest = corpus_digest(documents, salt=type(self._snapshot.retriever).__name__)
+        path = os.path.join(index_root, digest[:16])
 
-    def retrieve_documents(self, query: str, top_k: int = 3) -> List[Dict[str, Any]]:
+        try:
+            self.load_index(path)
+        except IndexFormatError:
+            self.set_documents(list(documents))
+            self.save_index(path)
+        return path
+
+    def retrieve_documents(
+        self, query: str, top_k: int = 3, context: Optional[RequestContext] = None
+    ) -> List[Dict[str, Any]]:
         """
         Retrieve top-k most relevant documents for the query
 
         Args:
             query: Search query
             top_k: Number of documents to retrieve
+            context: Request context to trace into and read the corpus from
+                (a fresh one on the current snapshot when not given)
 
         Returns:
             List of dictionaries containing document info
         """
-        if not self.is_fitted:
-            raise ValueError(
-                "No documents have been added. Call add_documents() or set_documents() first."
-            )
+        context = context or self.new_context()
+        return self.retrieve_documents_batch([query], top_k, [context])[0]
 
-        self.traces.append(
-            TraceEvent(
-                event_type="retrieval",
-                component="retriever",
-                data={
-                    "operation": "retrieve_start",
-                    "query": query,
-                    "query_length": len(query),
-                    "top_k": top_k,
-                    "total_documents": len(self.documents),
-                },
-            )
-        )
+    def retrieve_documents_batch(
+        self,
+        queries: Sequence[str],
+        top_k: int = 3,
+        contexts: Optional[Sequence[RequestContext]] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Retrieve top-k documents for many queries with one batched retriever call
+        per corpus snapshot
 
-        top_docs = self.retriever.get_top_k(query, k=top_k)
-
-        retrieved_docs = []
-        for idx, score in top_docs:
-            if score > 0:  # Only include documents with positive similarity scores
-                retrieved_docs.append(
-                    {
-                        "content": self.documents[idx],
-                        "similarity_score": score,
-                        "document_id": idx,
-                    }
-                )
+        Args:
+            queries: Search queries
+            top_k: Number of documents to retrieve per query
+            contexts: One request context per query (fresh ones on the
+                current snapshot when not given); contexts pinned to
+                different snapshots are scored against their own snapshot
 
-        self.traces.append(
-            TraceEvent(
-                event_type="retrieval",
-                component="retriever",
-                data={
-                    "operation": "retrieve_complete",
-                    "num_retrieved": len(retrieved_docs),
-                    "scores": [doc["similarity_score"] for doc in retrieved_docs],
-                    "document_ids": [doc["document_id"] for doc in retrieved_docs],
-                },
-            )
-        )
+        Returns:
+            Retrieved documents per query, in order
+        """
+        if contexts is None:
+            snapshot = self._snapshot
+            contexts = [RequestContext(snapshot=snapshot) for _ in queries]
+        if len(contexts) != len(queries):
+            raise ValueError("retrieve_documents_batch needs one context per query")
+
+        groups: Dict[int, List[int]] = {}
+        for i, context in enumerate(contexts):
+            if not context.snapshot.is_fitted:
+                raise ValueError(
+                    "No documents have been added. Call add_documents() or set_documents() first."
+                )
+            groups.setdefault(id(context.snapshot), []).append(i)
+
+        results: List[List[Dict[str, Any]]] = [[] for _ in queries]
+        for indices in groups.values():
+            snapshot = contexts[indices[0]].snapshot
+            with ExitStack() as stack:
+                spans = [
+                    stack.enter_context(
+                        contexts[i].traces.span(
+                            "retrieval",
+                            "retriever",
+                            operation="retrieve",
+                            query_length=len(queries[i]),
+                            top_k=top_k,
+                            total_documents=len(snapshot.documents),
+                            corpus_version=snapshot.version,
+                            batch_size=len(indices),
+                        )
+                    )
+                    for i in indices
+                ]
+                batch_top_docs = snapshot.retriever.get_top_k_batch(
+                    [queries[i] for i in indices], k=top_k
+                )
 
-        return retrieved_docs
+                for i, span, top_docs in zip(indices, spans, batch_top_docs):
+                    retrieved_docs = []
+                    for idx, score in top_docs:
+                        if score > 0:  # Only include documents with positive similarity scores
+                            retrieved_docs.append(
+                                {
+                                    "content": snapshot.documents[idx],
+                                    "similarity_score": score,
+                                    "document_id": idx,
+                                }
+                            )
+
+                    span.set(
+                        num_retrieved=len(retrieved_docs),
+                        retrieved_chars=sum(len(doc["content"]) for doc in retrieved_docs),
+                        scores=[doc["similarity_score"] for doc in retrieved_docs],
+                        document_ids=[doc["document_id"] for doc in retrieved_docs],
+                    )
+                    results[i] = retrieved_docs
+
+        return results
+
+    def build_messages(self, query: str, context: str) -> List[Dict[str, str]]:
+        """
+        Build chat messages with a stable, cacheable prefix
 
-    def generate_response(self, query: str, top_k: int = 3) -> str:
+        The system message holds only the static instructions, so it is
+        identical for every request; the retrieved context and the question
+        are formatted into the trailing user message.
+        """
+        return [
+            {"role": "system", "content": self.instructions},
+            {
+                "role": "user",
+                "content": self.prompt_template.format(query=query, context=context),
+            },
+        ]
+
+    def generate_response(
+        self,
+        query: str,
+        top_k: int = 3,
+        retrieved_docs: Optional[List[Dict[str, Any]]] = None,
+        context: Optional[RequestContext] = None,
+    ) -> str:
         """
         Generate response to query using retrieved documents
 
         Args:
             query: User query
             top_k: Number of documents to retrieve
+            retrieved_docs: Documents already retrieved for this query
+                (retrieved here when not given)
+            context: Request context to trace into (a fresh one when not given)
 
         Returns:
             Generated response
         """
-        if not self.is_fitted:
+        context = context or self.new_context()
+        traces = context.traces
+        if not context.snapshot.is_fitted:
             raise ValueError(
                 "No documents have been added. Call add_documents() or set_documents() first."
             )
 
         # Retrieve relevant documents
-        retrieved_docs = self.retrieve_documents(query, top_k)
+        if retrieved_docs is None:
+            retrieved_docs = self.retrieve_documents(query, top_k, context)
 
         if not retrieved_docs:
-            return "I couldn't find any relevant documents to answer your question."
-
-        # Build context from retrieved documents
-        context_parts = []
-        for i, doc in enumerate(retrieved_docs, 1):
-            context_parts.append(f"Document {i}:\n{doc['content']}")
-
-        context = "\n\n".join(context_parts)
-
-        # Generate response using LLM client
-        prompt = self.system_prompt.format(query=query, context=context)
-
-        self.traces.append(
-            TraceEvent(
-                event_type="llm_call",
-                component="openai_api",
-                data={
-                    "operation": "generate_response",
-                    "model": "gpt-4o",
-                    "query": query,
-                    "prompt_length": len(prompt),
-                    "context_length": len(context),
-                    "num_context_docs": len(retrieved_docs),
-                },
-            )
-        )
-
-        try:
-            response = self.llm_client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": self.system_prompt},
-                    {"role": "user", "content": prompt},
-                ],
-            )
-
-            response_text = response.choices[0].message.content.strip()
-
-            self.traces.append(
-                TraceEvent(
-                    event_type="llm_response",
-                    component="openai_api",
-                    data={
-                        "operation": "generate_response",
-                        "response_length": len(response_text),
-                        "usage": (
-                            response.usage.model_dump() if response.usage else None
-                        ),
-                        "model": "gpt-4o",
-                    },
+            return NO_DOCUMENTS_ANSWER
+
+        with traces.span("generation", "rag_system", operation="generate_response"):
+            # Build context from the best passages of the retrieved documents
+            with traces.span(
+                "context_assembly",
+                "context_assembler",
+                operation="assemble_context",
+                token_budget=self.context_assembler.max_tokens,
+                input_chars=sum(len(doc["content"]) for doc in retrieved_docs),
+            ) as span:
+                assembled = self.context_assembler.assemble(query, retrieved_docs)
+                span.set(output_chars=len(assembled.context), **assembled.trace_data())
+            if not assembled.documents:
+                # Nothing fit the budget: same as retrieving nothing
+                return NO_DOCUMENTS_ANSWER
+            context_text = assembled.context
+
+            with traces.span(
+                "prompt_assembly", "rag_system", operation="build_messages"
+            ) as span:
+                messages = self.build_messages(query, context_text)
+                span.set(
+                    num_messages=len(messages),
+                    request_chars=sum(len(m["content"]) for m in messages),
                 )
-            )
 
-            return response_text
-
-        except Exception as e:
-            self.traces.append(
-                TraceEvent(
-                    event_type="error",
-                    component="openai_api",
-                    data={"operation": "generate_response", "error": str(e)},
+            # Generate response using LLM client
+            try:
+                with traces.span(
+                    "llm_response",
+                    "openai_api",
+                    operation="generate_response",
+                    model=GENERATION_MODEL,
+                    prompt_length=len(messages[-1]["content"]),
+                    instructions_length=len(self.instructions),
+                    context_length=len(context_text),
+                    context_tokens=assembled.tokens_after,
+                    num_context_docs=len(assembled.documents),
+                ) as span:
+                    response = self.llm_client.chat.completions.create(
+                        model=GENERATION_MODEL,
+                        messages=messages,
+                    )
+
+                    response_text = response.choices[0].message.content.strip()
+
+                    usage = response.usage
+                    span.set(
+                        response_length=len(response_text),
+                        usage=usage.model_dump() if usage else None,
+                        prompt_tokens=getattr(usage, "prompt_tokens", None),
+                        completion_tokens=getattr(usage, "completion_tokens", None),
+                        cached_tokens=cached_prompt_tokens(usage),
+                    )
+
+                return response_text
+
+            except BudgetExceeded:
+                # Stops the caller's run; not an answer to grade
+                raise
+            except Exception as e:
+                traces.event(
+                    "error", "openai_api", operation="generate_response", error=str(e)
                 )
-            )
-            return f"Error generating response: {str(e)}"
+                return f"Error generating response: {str(e)}"
 
     def query(
-        self, question: str, top_k: int = 3, run_id: Optional[str] = None
+        self,
+        question: str,
+        top_k: int = 3,
+        run_id: Optional[str] = None,
+        retrieved_docs: Optional[List[Dict[str, Any]]] = None,
+        context: Optional[RequestContext] = None,
     ) -> Dict[str, Any]:
         """
         Complete RAG pipeline: retrieve documents and generate response
@@ -349,112 +934,162 @@ class ExampleRAG:
             question: User question
             top_k: Number of documents to retrieve
             run_id: Optional run ID for tracing (auto-generated if not provided)
+            retrieved_docs: Documents already retrieved for this question
+                (e.g. by a batched retrieval), skipping the retrieval step
+            context: Request context the documents were retrieved under
 
         Returns:
             Dictionary containing response and retrieved documents
         """
+        # Fresh traces and a pinned corpus snapshot for this query
+        if context is None:
+            context = self.new_context(run_id)
         # Generate run_id if not provided
-        if run_id is None:
-            run_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{hash(question) % 10000:04d}"
-
-        # Reset traces for this query
-        self.traces = []
-
-        self.traces.append(
-            TraceEvent(
-                event_type="query_start",
-                component="rag_system",
-                data={
-                    "run_id": run_id,
-                    "question": question,
-                    "question_length": len(question),
-                    "top_k": top_k,
-                    "total_documents": len(self.documents),
-                },
-            )
+        run_id = run_id or context.run_id or new_run_id()
+        context.run_id = run_id
+        traces = context.traces
+
+        traces.event(
+            "query_start",
+            "rag_system",
+            run_id=run_id,
+            question=question,
+            question_length=len(question),
+            top_k=top_k,
+            total_documents=len(context.snapshot.documents),
         )
 
         try:
-            retrieved_docs = self.retrieve_documents(question, top_k)
-            response = self.generate_response(question, top_k)
+            with traces.span(
+                "query_complete", "rag_system", operation="query", run_id=run_id
+            ) as span:
+                if retrieved_docs is None:
+                    retrieved_docs = self.retrieve_documents(question, top_k, context)
+                response = self.generate_response(question, top_k, retrieved_docs, context)
+                span.set(
+                    success=True,
+                    response_length=len(response),
+                    num_retrieved=len(retrieved_docs),
+                )
 
             result = {"answer": response, "run_id": run_id}
 
-            self.traces.append(
-                TraceEvent(
-                    event_type="query_complete",
-                    component="rag_system",
-                    data={
-                        "run_id": run_id,
-                        "success": True,
-                        "response_length": len(response),
-                        "num_retrieved": len(retrieved_docs),
-                    },
-                )
-            )
-
-            logs_path = self.export_traces_to_log(run_id, question, result)
+            logs_path = self.export_traces_to_log(run_id, question, result, context)
             return {"answer": response, "run_id": run_id, "logs": logs_path}
 
+        except BudgetExceeded:
+            self.export_traces_to_log(run_id, question, None, context)
+            raise
         except Exception as e:
-            self.traces.append(
-                TraceEvent(
-                    event_type="error",
-                    component="rag_system",
-                    data={"run_id": run_id, "operation": "query", "error": str(e)},
-                )
+            traces.event(
+                "error", "rag_system", run_id=run_id, operation="query", error=str(e)
             )
 
             # Return error result
-            logs_path = self.export_traces_to_log(run_id, question, None)
+            logs_path = self.export_traces_to_log(run_id, question, None, context)
             return {
                 "answer": f"Error processing query: {str(e)}",
                 "run_id": run_id,
                 "logs": logs_path,
             }
 
+    def query_batch(
+        self,
+        questions: Sequence[str],
+        top_k: int = 3,
+        max_workers: int = 8,
+    ) -> List[Dict[str, Any]]:
+        """
+        Answer many questions: one batched retrieval for all of them on a single
+        corpus snapshot, then generation for each question concurrently
+
+        Args:
+            questions: User questions
+            top_k: Number of documents to retrieve per question
+            max_workers: Concurrent generation requests
+
+        Returns:
+            One query() result per question, in order
+        """
+        snapshot = self._snapshot
+        contexts = [RequestContext(snapshot=snapshot, run_id=new_run_id()) for _ in questions]
+        try:
+            batch_docs = self.retrieve_documents_batch(questions, top_k, contexts)
+        except Exception as e:
+            # Fall back to per-query retrieval inside query(), which reports
+            # and traces any error per question
+            for context in contexts:
+                context.traces.event(
+                    "error", "retriever", operation="retrieve_batch", error=str(e)
+                )
+            batch_docs = [None] * len(questions)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(questions)))) as executor:
+            # Worker threads do not inherit context variables (the cost scope)
+            futures = [
+                executor.submit(
+                    contextvars.copy_context().run,
+                    self.query, question, top_k, context.run_id, retrieved_docs, context,
+                )
+                for question, retrieved_docs, context in zip(questions, batch_docs, contexts)
+            ]
+            return [future.result() for future in futures]
+
     def export_traces_to_log(
         self,
         run_id: str,
         query: Optional[str] = None,
         result: Optional[Dict[str, Any]] = None,
-    ):
-        """Export traces to a log file with run_id"""
-        timestamp = datetime.now().isoformat()
-        log_filename = (
-            f"rag_run_{run_id}_{timestamp.replace(':', '-').replace('.', '-')}.json"
-        )
-        log_filepath = os.path.join(self.logdir, log_filename)
+        context: Optional[RequestContext] = None,
+    ) -> Optional[str]:
+        """
+        Hand a request's traces to the trace sink
 
+        Serialization and any file writes happen on the sink's side, off the
+        request path. Without a context, the instance's lifecycle traces are
+        exported. Returns the sink's reference to the record (for the
+        default TraceStore, "segment:offset" within logdir).
+        """
+        traces = context.traces if context is not None else self.traces
+        snapshot = context.snapshot if context is not None else self._snapshot
         log_data = {
             "run_id": run_id,
-            "timestamp": timestamp,
+            "timestamp": datetime.now().isoformat(),
+            "origin_unix_ns": traces.origin_unix_ns,
             "query": query,
             "result": result,
-            "num_documents": len(self.documents),
-            "traces": [asdict(trace) for trace in self.traces],
+            "num_documents": len(snapshot.documents),
+            "corpus_version": snapshot.version,
+            "traces": traces.to_dicts(),
         }
 
-        with open(log_filepath, "w") as f:
-            json.dump(log_data, f, indent=2)
-
-        print(f"RAG traces exported to: {log_filepath}")
-        return log_filepath
+        log_ref = self.trace_sink.emit(log_data)
+        if log_ref is not None:
+            print(f"RAG traces exported to: {log_ref}")
+        return log_ref
 
 
-def default_rag_client(llm_client, logdir: str = "logs") -> ExampleRAG:
+def default_rag_client(
+    llm_client, logdir: str = "logs", index_path: Optional[str] = None
+) -> ExampleRAG:
     """
     Create a default RAG client with OpenAI LLM and optional retriever.
 
     Args:
-        retriever: Optional retriever instance (defaults to SimpleKeywordRetriever)
+        llm_client: LLM client used for generation
         logdir: Directory for trace logs
+        index_path: Saved index to memory-map instead of fitting on the
+            default documents (defaults to $RAG_INDEX_PATH, if set)
     Returns:
         ExampleRAG instance
     """
     retriever = SimpleKeywordRetriever()
     client = ExampleRAG(llm_client=llm_client, retriever=retriever, logdir=logdir)
-    client.add_documents(DOCUMENTS)  # Add default documents
+    index_path = index_path or os.getenv("RAG_INDEX_PATH")
+    if index_path:
+        client.load_index(index_path)
+    else:
+        client.add_documents(DOCUMENTS)  # Add default documents
     return client
 
 
@@ -468,7 +1103,7 @@ if __name__ == "__main__":
         exit(1)
 
     # Initialize RAG system with tracing enabled
-    llm = OpenAI(api_key=api_key)
+    llm = get_gateway().client_for("answer", "openai")
     r = SimpleKeywordRetriever()
     rag_client = ExampleRAG(llm_client=llm, retriever=r, logdir="logs")
 
@@ -0,0 +1,457 @@
+"""
+Long-running HTTP query service for the RAG pipeline.
+
+A plain ASGI application (no web framework) holding one warm ExampleRAG and
+one pooled LLM client for the lifetime of the process:
+
+    POST /query     {"question": "...", "top_k": 3, "run_id": null}
+    POST /retrieve  {"query": "...", "top_k": 3}
+    GET  /healthz
+
+Concurrent retrievals are micro-batched through a bounded queue; when the
+queue (or the number of in-flight queries) is full the service answers 429
+with Retry-After instead of letting latency grow without bound.
+
+Usage:
+    uvicorn service:app                    # configured from RAG_* env vars
+    python service.py [--documents DIR | --index INDEX_DIR] [--fake-llm] [--port 8000]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent))
+from rag import DOCUMENTS, ExampleRAG, RequestContext
+from llm_gateway import configure_gateway
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BATCH = 32
+DEFAULT_MAX_WAIT_MS = 2.0
+DEFAULT_MAX_QUEUE = 256
+DEFAULT_MAX_INFLIGHT = 256
+DEFAULT_LLM_CONNECTIONS = 32
+
+
+class Overloaded(Exception):
+    """Raised when the service cannot accept more work right now"""
+
+
+class RetrievalBatcher:
+    """
+    Collects concurrent retrieval requests and scores them together.
+
+    A single worker task takes the first queued request, then keeps
+    collecting until max_batch requests or max_wait_ms have passed, and runs
+    the whole batch in one executor hop.
+    """
+
+    def __init__(
+        self,
+        rag: ExampleRAG,
+        executor: ThreadPoolExecutor,
+        max_batch: int = DEFAULT_MAX_BATCH,
+        max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+    ):
+        self.rag = rag
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.batches = 0
+        self.batched_requests = 0
+        self._worker: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._worker is None:
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def retrieve(
+        self, query: str, top_k: int, context: RequestContext
+    ) -> List[Dict[str, Any]]:
+        """Queue a retrieval and wait for its batch; raises Overloaded if the queue is full"""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((query, top_k, context, future, time.perf_counter_ns()))
+        except asyncio.QueueFull:
+            raise Overloaded("retrieval queue is full")
+        return await future
+
+    async def _collect(self) -> List[Tuple]:
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _retrieve_batch(self, batch: List[Tuple]) -> List[Any]:
+        started = time.perf_counter_ns()
+        # One vectorized retriever call per distinct top_k
+        by_top_k: Dict[int, List[int]] = {}
+        for i, (query, top_k, context, _, queued_ns) in enumerate(batch):
+            context.traces.event(
+                "retrieval_batch",
+                "service",
+                batch_size=len(batch),
+                queue_wait_ms=(started - queued_ns) / 1e6,
+            )
+            by_top_k.setdefault(top_k, []).append(i)
+
+        results: List[Any] = [None] * len(batch)
+        for top_k, indices in by_top_k.items():
+            try:
+                retrieved = self.rag.retrieve_documents_batch(
+                    [batch[i][0] for i in indices], top_k, [batch[i][2] for i in indices]
+                )
+            except Exception as e:
+                retrieved = [e] * len(indices)
+            for i, result in zip(indices, retrieved):
+                results[i] = result
+        return results
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            try:
+                results = await loop.run_in_executor(self.executor, self._retrieve_batch, batch)
+            except Exception as e:
+                results = [e] * len(batch)
+            self.batches += 1
+            self.batched_requests += len(batch)
+
+            for item, result in zip(batch, results):
+                future = item[3]
+                if future.done():  # client went away
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str, headers: Optional[List[Tuple[bytes, bytes]]] = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or []
+
+
+def pooled_llm_client(max_connections: int = DEFAULT_LLM_CONNECTIONS):
+    """
+    Client for the service's LLM calls, routed through the shared gateway
+    with a keep-alive connection pool sized for the service's concurrency.
+    Azure is used when AZURE_ENDPOINT is set, as in evals.py.
+    """
+    return configure_gateway(max_connections=max_connections).client_for("answer")
+
+
+def load_documents(path: Optional[str]) -> List[str]:
+    """A folder of .txt files, a text file with one document per line, or the demo DOCUMENTS"""
+    if not path:
+        return list(DOCUMENTS)
+    source = Path(path)
+    if source.is_dir():
+        return [p.read_text(encoding="utf-8") for p in sorted(source.glob("*.txt"))]
+    with open(source, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+class RAGService:
+    """ASGI application serving one warm ExampleRAG"""
+
+    def __init__(
+        self,
+        rag_factory: Callable[[], ExampleRAG],
+        max_batch: int = DEFAULT_MAX_BATCH,
+        max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        max_inflight: int = DEFAULT_MAX_INFLIGHT,
+        generation_workers: int = DEFAULT_LLM_CONNECTIONS,
+    ):
+        """
+        Args:
+            rag_factory: Builds the ExampleRAG (with documents loaded) at startup
+            max_batch: Most retrievals scored in one batch
+            max_wait_ms: How long the first request of a batch waits for company
+            max_queue: Bound of the retrieval queue; beyond it requests get 429
+            max_inflight: Bound of concurrently processed /query requests
+            generation_workers: Threads making (blocking) LLM calls
+        """
+        self.rag_factory = rag_factory
+        self.batch_options = {
+            "max_batch": max_batch,
+            "max_wait_ms": max_wait_ms,
+            "max_queue": max_queue,
+        }
+        self.max_inflight = max_inflight
+        self.generation_workers = generation_workers
+        self.inflight = 0
+        self.rag: Optional[ExampleRAG] = None
+        self.batcher: Optional[RetrievalBatcher] = None
+        self._retrieval_executor: Optional[ThreadPoolExecutor] = None
+        self._generation_executor: Optional[ThreadPoolExecutor] = None
+        self._startup_lock: Optional[asyncio.Lock] = None
+
+    async def startup(self) -> None:
+        """Build the index and start the batcher (idempotent)"""
+        if self._startup_lock is None:
+            self._startup_lock = asyncio.Lock()
+        async with self._startup_lock:
+            if self.batcher is not None:
+                return
+            loop = asyncio.get_running_loop()
+            self.rag = await loop.run_in_executor(None, self.rag_factory)
+            self._retrieval_executor = ThreadPoolExecutor(1, thread_name_prefix="rag-retrieval")
+            self._generation_executor = ThreadPoolExecutor(
+                self.generation_workers, thread_name_prefix="rag-generation"
+            )
+            self.batcher = RetrievalBatcher(self.rag, self._retrieval_executor, **self.batch_options)
+            self.batcher.start()
+            logger.info(f"RAG service ready with {len(self.rag.documents)} documents")
+
+    async def shutdown(self) -> None:
+        if self.batcher is not None:
+            await self.batcher.stop()
+            self.batcher = None
+        for executor in (self._retrieval_executor, self._generation_executor):
+            if executor is not None:
+                executor.shutdown(wait=False)
+        if self.rag is not None:
+            self.rag.trace_sink.flush()
+
+    # ASGI entry point
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self.startup()
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send) -> None:
+        routes = {
+            ("POST", "/query"): self.handle_query,
+            ("POST", "/retrieve"): self.handle_retrieve,
+            ("GET", "/healthz"): self.handle_health,
+        }
+        method, path = scope["method"], scope["path"]
+        handler = routes.get((method, path))
+        try:
+            if handler is None:
+                known = any(route_path == path for _, route_path in routes)
+                raise HTTPError(405 if known else 404, "method not allowed" if known else "not found")
+            await self.startup()
+            body = await self._read_body(receive) if method == "POST" else {}
+            status, payload, headers = 200, await handler(body), []
+        except HTTPError as e:
+            status, payload, headers = e.status, {"error": e.message}, e.headers
+        except Overloaded as e:
+            status, payload, headers = 429, {"error": str(e)}, [(b"retry-after", b"1")]
+        except Exception as e:
+            logger.exception("Unhandled error serving %s", path)
+            status, payload, headers = 500, {"error": str(e)}, []
+
+        data = json.dumps(payload).encode("utf-8")
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(data)).encode()),
+                    *headers,
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": data})
+
+    @staticmethod
+    async def _read_body(receive) -> Dict[str, Any]:
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        try:
+            body = json.loads(b"".join(chunks) or b"{}")
+        except ValueError:
+            raise HTTPError(400, "request body must be JSON")
+        if not isinstance(body, dict):
+            raise HTTPError(400, "request body must be a JSON object")
+        return body
+
+    @staticmethod
+    def _field(body: Dict[str, Any], name: str) -> str:
+        value = body.get(name)
+        if not isinstance(value, str) or not value.strip():
+            raise HTTPError(400, f"'{name}' must be a non-empty string")
+        return value
+
+    @staticmethod
+    def _top_k(body: Dict[str, Any]) -> int:
+        top_k = body.get("top_k", 3)
+        if not isinstance(top_k, int) or not 1 <= top_k <= 100:
+            raise HTTPError(400, "'top_k' must be an integer between 1 and 100")
+        return top_k
+
+    async def handle_retrieve(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        query, top_k = self._field(body, "query"), self._top_k(body)
+        context = self.rag.new_context()
+        documents = await self.batcher.retrieve(query, top_k, context)
+        return {"documents": documents, "corpus_version": context.snapshot.version}
+
+    async def handle_query(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        question, top_k = self._field(body, "question"), self._top_k(body)
+        if self.inflight >= self.max_inflight:
+            raise Overloaded("too many queries in flight")
+
+        self.inflight += 1
+        try:
+            context = self.rag.new_context(body.get("run_id"))
+            documents = await self.batcher.retrieve(question, top_k, context)
+            loop = asyncio.get_running_loop()
+            # Generation is a blocking LLM call; the rest of query() reuses the
+            # batched retrieval and traces into the same context
+            return await loop.run_in_executor(
+                self._generation_executor,
+                lambda: self.rag.query(
+                    question, top_k, retrieved_docs=documents, context=context
+                ),
+            )
+        finally:
+            self.inflight -= 1
+
+    async def handle_health(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        snapshot = self.rag.snapshot
+        return {
+            "status": "ok",
+            "documents": len(snapshot.documents),
+            "corpus_version": snapshot.version,
+            "queue_depth": self.batcher.queue.qsize(),
+            "inflight_queries": self.inflight,
+            "batches": self.batcher.batches,
+            "mean_batch_size": round(self.batcher.batched_requests / self.batcher.batches, 2)
+            if self.batcher.batches
+            else None,
+        }
+
+
+def create_app(
+    documents_path: Optional[str] = None,
+    index_path: Optional[str] = None,
+    fake_llm: bool = False,
+    logdir: str = "logs",
+    llm_connections: int = DEFAULT_LLM_CONNECTIONS,
+    **options: Any,
+) -> RAGService:
+    """Build the service; the index and LLM client are created once, at startup"""
+
+    def rag_factory() -> ExampleRAG:
+        if fake_llm:
+            from benchmarks.fakes import FakeLLMClient
+
+            llm_client = FakeLLMClient(latency_ms=float(os.getenv("RAG_FAKE_LLM_LATENCY_MS", "0")))
+        else:
+            llm_client = pooled_llm_client(llm_connections)
+        rag = ExampleRAG(llm_client=llm_client, logdir=logdir)
+        if index_path:
+            rag.load_index(index_path)
+        else:
+            rag.set_documents(load_documents(documents_path))
+        return rag
+
+    return RAGService(rag_factory, generation_workers=llm_connections, **options)
+
+
+# For `uvicorn service:app`
+app = create_app(
+    documents_path=os.getenv("RAG_DOCUMENTS"),
+    index_path=os.getenv("RAG_INDEX_PATH"),
+    fake_llm=os.getenv("RAG_FAKE_LLM") == "1",
+    logdir=os.getenv("RAG_LOGDIR", "logs"),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RAG query service")
+    parser.add_argument("--documents", help="Folder of .txt files or a one-document-per-line file")
+    parser.add_argument("--index", help="Saved index directory to memory-map (overrides --documents)")
+    parser.add_argument("--fake-llm", action="store_true", help="Use the deterministic offline LLM")
+    parser.add_argument("--logdir", default="logs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS)
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE)
+    parser.add_argument("--max-inflight", type=int, default=DEFAULT_MAX_INFLIGHT)
+    parser.add_argument("--llm-connections", type=int, default=DEFAULT_LLM_CONNECTIONS)
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+    except ImportError:
+        print("Error: uvicorn is required to serve. Install it with: pip install uvicorn")
+        exit(1)
+
+    service = create_app(
+        documents_path=args.documents,
+        index_path=args.index,
+        fake_llm=args.fake_llm,
+        logdir=args.logdir,
+        llm_connections=args.llm_connections,
+        max_batch=args.max_batch,
+        max_wait_ms=args.max_wait_ms,
+        max_queue=args.max_queue,
+        max_inflight=args.max_inflight,
+    )
+    uvicorn.run(service, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
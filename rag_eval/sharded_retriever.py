@@ -0,0 +1,270 @@
+"""
+Multi-process retrieval over a partitioned corpus.
+
+ShardedRetriever splits the documents into num_shards contiguous ranges.
+Each range is fitted and saved as an ordinary index snapshot (shard-000,
+shard-001, ...) and served by its own worker process, which opens the shard
+with mmap so its pages live in the OS page cache instead of a private heap.
+A query, or better a batch of queries, is sent to every shard at once; each
+shard answers with its local top-k mapped to global document ids, and the
+per-shard lists are merged with a heap.
+
+Results match a single retriever over the whole corpus: ranking is by score
+with ties going to the lower document id, as in top_k_indices.
+
+Refitting shuts down the previous workers and removes the temporary shard
+directory fit() created. A retriever that is garbage-collected (e.g. the one
+of a replaced ExampleRAG snapshot) or still open at interpreter exit is
+cleaned up the same way.
+"""
+
+import copy
+import heapq
+import multiprocessing
+import os
+import shutil
+import tempfile
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from index_format import DOCUMENTS_TABLE, load_array, load_strings, write_index
+from rag import RETRIEVER_TYPES, BaseRetriever, EmbeddingRetriever, top_k_indices
+
+SHARD_PREFIX = "shard-"
+
+# State of a shard worker process, set by _init_shard
+_shard: Dict[str, Any] = {}
+
+
+def shard_name(i: int) -> str:
+    return f"{SHARD_PREFIX}{i:03d}"
+
+
+def _build_shard(retriever_type: str, config: Dict[str, Any], documents: List[str], path: str) -> str:
+    retriever = RETRIEVER_TYPES[retriever_type](**config)
+    retriever.fit(documents)
+    return retriever.save(path)
+
+
+def _init_shard(path: str, offset: int) -> None:
+    _shard["retriever"] = BaseRetriever.load(path, mmap=True)
+    _shard["offset"] = offset
+
+
+def _search_shard(queries: Any, k: int) -> List[List[Tuple[int, Any]]]:
+    """Local top-k per query, with global ids; queries are strings or (dense) query vectors"""
+    retriever = _shard["retriever"]
+    offset = _shard["offset"]
+    if isinstance(queries, np.ndarray):
+        if not len(retriever.documents):
+            return [[] for _ in queries]
+        scores = np.asarray(retriever.vectors @ queries.T)
+        results = [top_k_indices(scores[:, i], k) for i in range(len(queries))]
+    else:
+        results = retriever.get_top_k_batch(queries, k)
+    return [[(offset + doc_id, score) for doc_id, score in top] for top in results]
+
+
+def _shutdown(executors: List[ProcessPoolExecutor], owned_root: Optional[str]) -> None:
+    """Stop shard workers and remove the temporary shard directory, if fit() made one"""
+    for executor in executors:
+        executor.shutdown(wait=False, cancel_futures=True)
+    if owned_root is not None:
+        shutil.rmtree(owned_root, ignore_errors=True)
+
+
+def merge_top_k(per_shard: Sequence[List[Tuple[int, Any]]], k: int) -> List[Tuple[int, Any]]:
+    """Global top-k from per-shard top-k lists: highest score first, then lowest id"""
+    return heapq.nsmallest(k, (item for top in per_shard for item in top), key=lambda t: (-t[1], t[0]))
+
+
+class ConcatenatedStrings(Sequence[str]):
+    """Read-only view over several string sequences laid end to end"""
+
+    def __init__(self, parts: Sequence[Sequence[str]]):
+        self._parts = list(parts)
+        self._offsets = np.cumsum([0] + [len(p) for p in self._parts])
+
+    def __len__(self) -> int:
+        return int(self._offsets[-1])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("document index out of range")
+        part = int(np.searchsorted(self._offsets, index, side="right")) - 1
+        return self._parts[part][index - int(self._offsets[part])]
+
+    def __iter__(self) -> Iterator[str]:
+        for part in self._parts:
+            yield from part
+
+
+class ShardedRetriever(BaseRetriever):
+    """
+    Fans queries out to one worker process per shard and merges their top-k.
+
+    Keyword shards are built in the workers in parallel. Embedding shards are
+    built in this process (the embedding client stays here), and queries are
+    embedded here once and sent to the shards as vectors.
+    """
+
+    def __init__(
+        self,
+        num_shards: Optional[int] = None,
+        retriever_type: str = "SimpleKeywordRetriever",
+        retriever_config: Optional[Dict[str, Any]] = None,
+        index_dir: Optional[str] = None,
+        **retriever_kwargs: Any,
+    ):
+        """
+        Args:
+            num_shards: Worker processes / partitions (defaults to the CPU count)
+            retriever_type: Name of the per-shard retriever class (see RETRIEVER_TYPES)
+            retriever_config: JSON-serializable settings for the shard retriever
+            index_dir: Where fit() writes shard indexes (a temporary directory if not given)
+            **retriever_kwargs: Extra constructor arguments kept in this process,
+                e.g. the embedding_client of an EmbeddingRetriever
+        """
+        super().__init__()
+        if retriever_type not in RETRIEVER_TYPES:
+            raise ValueError(f"Unknown retriever type: {retriever_type}")
+        self.num_shards = num_shards or os.cpu_count() or 1
+        self.retriever_type = retriever_type
+        self.retriever_config = dict(retriever_config or {})
+        self.index_dir = index_dir
+        self._prototype = RETRIEVER_TYPES[retriever_type](**self.retriever_config, **retriever_kwargs)
+        self._shard_offsets = np.zeros(1, dtype=np.int64)
+        self._shard_root: Optional[str] = None
+        self._executors: List[ProcessPoolExecutor] = []
+        self._finalizer: Optional[weakref.finalize] = None
+
+    @property
+    def dense(self) -> bool:
+        return isinstance(self._prototype, EmbeddingRetriever)
+
+    def config(self) -> Dict[str, Any]:
+        return {
+            "num_shards": self.num_shards,
+            "retriever_type": self.retriever_type,
+            "retriever_config": self.retriever_config,
+        }
+
+    def fitted_copy(self, documents: Sequence[str]) -> "ShardedRetriever":
+        """A new retriever with its own workers and shards; this one keeps serving until closed"""
+        retriever = copy.copy(self)
+        retriever._shard_root = None
+        retriever._executors = []
+        retriever._finalizer = None
+        retriever.fit(list(documents))
+        return retriever
+
+    def fit(self, documents: List[str]):
+        """Partition documents, build one index per shard and start the shard workers"""
+        self.close()
+        super().fit(documents)
+        bounds = np.linspace(0, len(documents), self.num_shards + 1).astype(np.int64)
+        root = tempfile.mkdtemp(prefix="rag_shards_", dir=self.index_dir)
+        paths = [os.path.join(root, shard_name(i)) for i in range(self.num_shards)]
+        slices = [list(documents[bounds[i] : bounds[i + 1]]) for i in range(self.num_shards)]
+
+        if self.dense:
+            for path, shard_docs in zip(paths, slices):
+                shard = copy.copy(self._prototype)
+                shard.fit(shard_docs)
+                shard.save(path)
+        else:
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=self.num_shards, mp_context=context) as pool:
+                list(pool.map(
+                    _build_shard,
+                    [self.retriever_type] * self.num_shards,
+                    [self.retriever_config] * self.num_shards,
+                    slices,
+                    paths,
+                ))
+        self._start(root, bounds, owned=True)
+
+    def _start(self, root: str, bounds: np.ndarray, owned: bool = False) -> None:
+        context = multiprocessing.get_context("spawn")
+        self._shard_root = root
+        self._shard_offsets = bounds
+        self._executors = [
+            ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=context,
+                initializer=_init_shard,
+                initargs=(os.path.join(root, shard_name(i)), int(bounds[i])),
+            )
+            for i in range(len(bounds) - 1)
+        ]
+        # Runs on close(), when this retriever is garbage-collected, or at exit
+        self._finalizer = weakref.finalize(
+            self, _shutdown, self._executors, root if owned else None
+        )
+
+    def close(self) -> None:
+        """Stop the shard workers and remove the shard directory fit() created"""
+        if self._finalizer is not None:
+            self._finalizer()
+            self._finalizer = None
+        self._executors = []
+        self._shard_root = None
+
+    def get_top_k(self, query: str, k: int = 3) -> List[tuple]:
+        return self.get_top_k_batch([query], k)[0]
+
+    def get_top_k_batch(self, queries: Sequence[str], k: int = 3) -> List[List[tuple]]:
+        """Top-k for every query, searching all shards in parallel"""
+        if not self._executors:
+            raise ValueError("ShardedRetriever is not fitted")
+        payload: Any = list(queries)
+        if self.dense:
+            payload = self._prototype.embed(payload)
+        futures = [executor.submit(_search_shard, payload, k) for executor in self._executors]
+        per_shard = [future.result() for future in futures]
+        return [
+            merge_top_k([shard_results[i] for shard_results in per_shard], k)
+            for i in range(len(queries))
+        ]
+
+    def _index_arrays(self):
+        return {"shard_offsets": self._shard_offsets}, {}, self.config()
+
+    def save(self, path: str) -> str:
+        """
+        Write the manifest and shard offsets with a copy of every shard index;
+        the shards are copied into the staging directory, so the snapshot is
+        swapped into place complete
+        """
+        if self._shard_root is None:
+            raise ValueError("ShardedRetriever is not fitted")
+        arrays, tables, config = self._index_arrays()
+        shards = {
+            shard_name(i): os.path.join(self._shard_root, shard_name(i))
+            for i in range(len(self._shard_offsets) - 1)
+        }
+        # The shards hold the documents
+        return write_index(
+            path, type(self).__name__, (), arrays, tables=tables, config=config, directories=shards
+        )
+
+    def _load_index(self, path: str, manifest: Dict[str, Any], mmap: bool) -> None:
+        bounds = np.asarray(load_array(path, "shard_offsets", mmap=False))
+        self.documents = ConcatenatedStrings(
+            [
+                load_strings(os.path.join(path, shard_name(i)), DOCUMENTS_TABLE, mmap)
+                for i in range(len(bounds) - 1)
+            ]
+        )
+        self.close()
+        self._start(path, bounds)
+
+
+RETRIEVER_TYPES[ShardedRetriever.__name__] = ShardedRetriever
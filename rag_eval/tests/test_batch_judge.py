@@ -0,0 +1,95 @@
+import asyncio
+import json
+
+import pytest
+
+from batch_judge import BatchJudge, parse_verdict, parse_verdicts
+from benchmarks.fakes import FakeLLMClient
+
+
+def verdicts(*pairs):
+    return json.dumps({"verdicts": [{"id": i, "verdict": v} for i, v in pairs]})
+
+
+def test_parse_verdicts_maps_back_to_item_order():
+    assert parse_verdicts(verdicts((1, "fail"), (0, "pass")), 2) == ["pass", "fail"]
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        verdicts((0, "pass")),
+        verdicts((0, "pass"), (0, "fail")),
+        verdicts((0, "pass"), (1, "maybe")),
+        verdicts((0, "pass"), (2, "pass")),
+        "not json",
+    ],
+)
+def test_parse_verdicts_rejects_incomplete_output(content):
+    with pytest.raises(ValueError):
+        parse_verdicts(content, 2)
+
+
+def is_batch(kwargs):
+    return kwargs["response_format"]["json_schema"]["name"] == "verdicts"
+
+
+def batch_responder(messages, kwargs):
+    """Batch calls pass items whose response mentions the notes; single calls always pass"""
+    if not is_batch(kwargs):
+        return json.dumps({"verdict": "pass"})
+    items = json.loads(messages[-1]["content"])["items"]
+    return verdicts(*((item["id"], "pass" if item["grading_notes"] in item["response"] else "fail") for item in items))
+
+
+def test_grade_batches_rows():
+    client = FakeLLMClient(responder=batch_responder)
+    judge = BatchJudge(client, batch_size=2)
+    pairs = [("uses ragas", "ragas"), ("nothing", "ragas"), ("neo4j graph", "graph")]
+    assert judge.grade(pairs) == ["pass", "fail", "pass"]
+    assert client.calls == judge.calls == 2
+
+
+def test_unparseable_batch_is_graded_per_row():
+    client = FakeLLMClient(responder=lambda messages, kwargs: "garbled" if is_batch(kwargs) else '{"verdict": "fail"}')
+    judge = BatchJudge(client, batch_size=3)
+    assert judge.grade([("a", "b"), ("c", "d")]) == ["fail", "fail"]
+    assert judge.fallback_rows == 2 and client.calls == 3
+
+
+def test_ascore_collects_waiting_rows_into_one_call():
+    client = FakeLLMClient(responder=batch_responder)
+    judge = BatchJudge(client, batch_size=10, max_wait_ms=20)
+
+    async def scenario():
+        return await asyncio.gather(*(judge.ascore(f"answer {i}", str(i)) for i in range(4)))
+
+    assert asyncio.run(scenario()) == ["pass"] * 4
+    assert client.calls == 1
+
+
+@pytest.mark.parametrize(
+    "reply, verdict",
+    [
+        ('{"verdict": "pass"}', "pass"),
+        ('{"verdict": "fail"}', "fail"),
+        ("**Pass**", "pass"),
+        ("Result: pass", "pass"),
+        ("The response passes the grading notes.", "pass"),
+        ("FAIL - missing points", "fail"),
+        ("I cannot tell", "fail"),
+    ],
+)
+def test_parse_verdict_accepts_non_canonical_replies(reply, verdict):
+    assert parse_verdict(reply) == verdict
+
+
+def test_score_one_requests_a_single_verdict_schema():
+    seen = []
+
+    def responder(messages, kwargs):
+        seen.append(kwargs["response_format"]["json_schema"]["schema"]["properties"]["verdict"]["enum"])
+        return "**Pass**"
+
+    assert BatchJudge(FakeLLMClient(responder=responder)).score_one("answer", "notes") == "pass"
+    assert seen == [["pass", "fail"]]
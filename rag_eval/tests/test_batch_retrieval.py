@@ -0,0 +1,56 @@
+import pytest
+
+import rag
+from benchmarks.corpus import make_corpus, make_queries
+from benchmarks.fakes import FakeEmbeddingsClient, FakeLLMClient
+from rag import EmbeddingRetriever, ExampleRAG, SimpleKeywordRetriever
+from tracing import NullSink
+
+
+def queries_for(documents, count, seed=1):
+    return [query for query, _ in make_queries(documents, count, words_per_query=3, seed=seed)] + [
+        "",
+        "zzzunknown",
+    ]
+
+
+def test_keyword_batch_above_score_cells_matches_per_query():
+    documents = make_corpus(2_000, mean_words=15, vocabulary_size=500)
+    retriever = SimpleKeywordRetriever()
+    retriever.fit(documents)
+    queries = queries_for(documents, rag.BATCH_SCORE_CELLS // len(documents) + 100)
+    assert len(queries) * len(documents) > rag.BATCH_SCORE_CELLS
+    assert retriever._block_size() < len(queries)
+    assert retriever.get_top_k_batch(queries, 4) == [retriever.get_top_k(query, 4) for query in queries]
+
+
+def test_embedding_batch_in_blocks_matches_per_query(monkeypatch):
+    documents = make_corpus(50, mean_words=15, vocabulary_size=200)
+    retriever = EmbeddingRetriever(FakeEmbeddingsClient(dimensions=64), batch_size=16)
+    retriever.fit(documents)
+    queries = queries_for(documents, 30)
+    monkeypatch.setattr(rag, "BATCH_SCORE_CELLS", len(documents) * 7)
+    assert retriever._block_size() == 7
+
+    batched = retriever.get_top_k_batch(queries, 3)
+    single = [retriever.get_top_k(query, 3) for query in queries]
+    assert [[i for i, _ in row] for row in batched] == [[i for i, _ in row] for row in single]
+    for batch_row, single_row in zip(batched, single):
+        assert [score for _, score in batch_row] == pytest.approx([score for _, score in single_row])
+
+
+def test_query_batch_matches_query(tmp_path, monkeypatch):
+    documents = make_corpus(60, mean_words=15, vocabulary_size=200)
+    # Answer with the prompt, so equal answers mean equal retrieved context
+    llm = FakeLLMClient(responder=lambda messages, kwargs: messages[-1]["content"])
+    client = ExampleRAG(llm_client=llm, logdir=str(tmp_path), trace_sink=NullSink())
+    client.set_documents(documents)
+    questions = queries_for(documents, 20)
+    monkeypatch.setattr(rag, "BATCH_SCORE_CELLS", len(documents) * 3)
+
+    batched = client.query_batch(questions, top_k=2, max_workers=4)
+    single = [client.query(question, top_k=2) for question in questions]
+    assert [result["answer"] for result in batched] == [result["answer"] for result in single]
+    assert client.retrieve_documents_batch(questions, 2) == [
+        client.retrieve_documents(question, 2) for question in questions
+    ]
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from benchmarks import run
+from benchmarks.corpus import make_corpus, make_queries
+from benchmarks.fakes import FakeEmbeddingsClient, FakeLLMClient
+
+MESSAGES = [{"role": "system", "content": "Answer."}, {"role": "user", "content": "What is Ragas?"}]
+
+
+def complete(client, messages=MESSAGES, **kwargs):
+    return client.chat.completions.create(model="gpt-4o", messages=messages, **kwargs)
+
+
+def test_fake_llm_is_deterministic_per_prompt_and_seed():
+    first, second = complete(FakeLLMClient()), complete(FakeLLMClient())
+    assert first.choices[0].message.content == second.choices[0].message.content
+    other_prompt = complete(FakeLLMClient(), [{"role": "user", "content": "Something else"}])
+    other_seed = complete(FakeLLMClient(seed=1))
+    assert other_prompt.choices[0].message.content != first.choices[0].message.content
+    assert other_seed.choices[0].message.content != first.choices[0].message.content
+
+
+def test_fake_llm_reports_usage_and_calls():
+    client = FakeLLMClient(responder=lambda messages, kwargs: kwargs["response_format"]["type"] + " reply")
+    response = complete(client, response_format={"type": "json_object"})
+    assert response.choices[0].message.content == "json_object reply"
+    assert response.model == "gpt-4o" and client.calls == 1
+    prompt_tokens = len("Answer.What is Ragas?") // 4
+    assert response.usage.model_dump() == {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": len("json_object reply") // 4,
+        "total_tokens": prompt_tokens + len("json_object reply") // 4,
+        "prompt_tokens_details": {"cached_tokens": 0},
+    }
+
+
+def test_fake_embeddings_are_unit_vectors_in_input_order():
+    client = FakeEmbeddingsClient(dimensions=64)
+    texts = ["intel processors", "intel makes processors", "neo4j graph database"]
+    response = client.embeddings.create(model="text-embedding-3-small", input=texts)
+    vectors = np.array([item.embedding for item in sorted(response.data, key=lambda d: d.index)])
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0)
+    assert vectors[0] @ vectors[1] > vectors[0] @ vectors[2]
+    assert np.allclose(vectors[0], client.vector(texts[0]))
+    assert response.usage.prompt_tokens > 0 and client.calls == 1
+
+
+def test_corpus_and_queries_are_reproducible():
+    documents = make_corpus(20, mean_words=30, vocabulary_size=500)
+    assert documents == make_corpus(20, mean_words=30, vocabulary_size=500)
+    assert documents != make_corpus(20, mean_words=30, vocabulary_size=500, seed=1)
+    for query, doc_id in make_queries(documents, 10, words_per_query=4):
+        assert set(query.split()) <= set(documents[doc_id].replace(".", "").split())
+
+
+def test_percentile_interpolates():
+    assert run.percentile([1.0, 2.0, 3.0, 4.0], 50) == 2.5
+    assert run.percentile([1.0, 2.0, 3.0, 4.0], 100) == 4.0
+    assert run.percentile([5.0], 95) == 5.0
+
+
+def test_measure_stops_at_max_iterations():
+    seen = []
+    result = run.measure(seen.append, max_iterations=5, max_seconds=60)
+    assert seen == [0, 1, 2, 3, 4]
+    assert result["iterations"] == 5 and result["qps"] > 0
+    assert result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"]
+
+
+def test_compare_reports_relative_change_for_shared_benchmarks():
+    def report(*results):
+        return {"results": [{"benchmark": b, "corpus": "1k", "qps": q, "p95_ms": p} for b, q, p in results]}
+
+    rows = run.compare(report(("rag.query", 150.0, 8.0), ("chunking", 10.0, 1.0)), report(("rag.query", 100.0, 10.0)))
+    assert rows == [{"benchmark": "rag.query", "corpus": "1k", "qps_change": 0.5, "p95_change": -0.2}]
+
+
+@pytest.mark.parametrize("name", ["retriever.keyword", "rag.query"])
+def test_run_one_measures_a_benchmark(name):
+    result = run.run_one(name, "1k", {"llm_latency_ms": 0.0, "max_iterations": 3, "max_seconds": 5.0})
+    assert result["benchmark"] == name and result["corpus"] == "1k"
+    assert result["iterations"] == 3
+    assert {"setup_seconds", "p50_ms", "p95_ms", "peak_rss_mb"} <= set(result)
@@ -0,0 +1,76 @@
+import pytest
+
+import context_budget
+from context_budget import ContextAssembler
+
+
+class CharEncoder:
+    """One token per character, with tiktoken's encode/decode_with_offsets surface"""
+
+    def encode(self, text, disallowed_special=()):
+        return [ord(c) for c in text]
+
+    def decode_with_offsets(self, tokens):
+        return "".join(map(chr, tokens)), list(range(len(tokens)))
+
+
+@pytest.fixture
+def char_tokens(monkeypatch):
+    monkeypatch.setitem(context_budget._encoders, context_budget.DEFAULT_MODEL, CharEncoder())
+
+
+def test_passage_longer_than_budget_is_split_not_dropped():
+    assembled = ContextAssembler(max_tokens=100).assemble("word", [{"content": "word " * 2000}])
+    assert assembled.passages_kept > 0
+    assert assembled.context
+    assert 0 < assembled.tokens_after <= 100
+
+
+def test_hard_split_pieces_are_verbatim_and_within_limit(char_tokens):
+    document = "Intro sentence. " + "abcdefghij" * 50
+    assembler = ContextAssembler(max_tokens=1000, passage_tokens=64)
+    passages = assembler._split_passages(0, document)
+    assert all(p.tokens <= 64 for p in passages)
+    assert all(p.text == document[p.start : p.end] for p in passages)
+    assert "".join(p.text for p in passages) == document
+
+
+def test_budget_smaller_than_passage_size_limits_pieces():
+    assembler = ContextAssembler(max_tokens=20, passage_tokens=150)
+    passages = assembler._split_passages(0, "x " * 1000)
+    assert passages and all(p.tokens <= 20 for p in passages)
+
+
+def test_sentences_are_packed_into_passages():
+    document = " ".join(f"Sentence number {i} is here." for i in range(50))
+    assembled = ContextAssembler(max_tokens=10_000, passage_tokens=50).assemble("sentence", [{"content": document}])
+    assert assembled.passages_total > 1
+    assert assembled.passages_kept == assembled.passages_total
+
+
+def test_budget_keeps_best_passages():
+    documents = [
+        {"content": "Unrelated filler text about weather. " * 40},
+        {"content": "Ragas evaluates retrieval augmented generation pipelines."},
+    ]
+    assembled = ContextAssembler(max_tokens=40, passage_tokens=20).assemble("ragas evaluates", documents)
+    assert "Ragas evaluates" in assembled.context
+    assert assembled.tokens_after <= 40
+
+
+def test_duplicate_passages_are_dropped():
+    text = "The quick brown fox jumps over the lazy dog near the river bank."
+    assembled = ContextAssembler().assemble("fox", [{"content": text}, {"content": text}])
+    assert assembled.duplicates_dropped == 1
+    assert len(assembled.documents) == 1
+
+
+def test_empty_documents_give_empty_context():
+    assembled = ContextAssembler().assemble("anything", [{"content": "   "}])
+    assert assembled.context == ""
+    assert assembled.documents == []
+
+
+def test_no_documents():
+    assembled = ContextAssembler().assemble("anything", [])
+    assert assembled.context == "" and assembled.passages_total == 0
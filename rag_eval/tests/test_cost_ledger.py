@@ -0,0 +1,130 @@
+import contextvars
+import threading
+
+import pytest
+
+from benchmarks.fakes import FakeLLMClient
+from cost_ledger import BudgetExceeded, CostLedger, cost_scope, usage_cost
+from llm_gateway import LLMGateway
+
+
+def test_usage_cost_prices_cached_tokens_separately():
+    call = usage_cost("gpt-4o-mini-2024", prompt_tokens=1000, completion_tokens=100, cached_tokens=400)
+    assert call.tokens == 1100
+    assert call.cost_usd == pytest.approx((600 * 0.15 + 400 * 0.075 + 100 * 0.60) / 1e6)
+
+
+def test_record_attributes_to_innermost_labels():
+    ledger = CostLedger()
+    with cost_scope(run="r") as run_cost:
+        with cost_scope(document="a.pdf") as doc_cost:
+            ledger.record("answer", "gpt-4o", prompt_tokens=10, completion_tokens=5)
+        ledger.record("judge", "gpt-4o", prompt_tokens=3)
+    assert doc_cost.tokens == 15 and run_cost.tokens == 18
+    assert ledger.totals("document", "r") == {
+        "a.pdf": usage_cost("gpt-4o", 10, 5).to_dict(),
+        "(none)": usage_cost("gpt-4o", 3).to_dict(),
+    }
+    assert ledger.summary("r")["by_operation"]["judge"]["tokens"] == 3
+
+
+def test_check_enforces_token_and_cost_budgets():
+    ledger = CostLedger()
+    with cost_scope(run="r", max_tokens=100):
+        ledger.record("answer", "gpt-4o", prompt_tokens=90)
+        with pytest.raises(BudgetExceeded):
+            ledger.check("gpt-4o", 20)
+    with cost_scope(run="s", max_cost_usd=0.001):
+        with pytest.raises(BudgetExceeded):
+            ledger.check("gpt-4o", 1000)
+
+
+def test_run_budget_from_environment(monkeypatch):
+    monkeypatch.setenv("LLM_BUDGET_TOKENS", "50")
+    ledger = CostLedger()
+    with cost_scope(run="r"):
+        with pytest.raises(BudgetExceeded):
+            ledger.check("gpt-4o", 51)
+    with cost_scope(run="r", max_tokens=1000):
+        ledger.release(ledger.check("gpt-4o", 51))
+
+
+def test_record_and_release_settle_reservations():
+    ledger = CostLedger()
+    with cost_scope(run="r", max_tokens=100) as tally:
+        reservation = ledger.check("gpt-4o", 60)
+        with pytest.raises(BudgetExceeded):
+            ledger.check("gpt-4o", 60)
+        ledger.record("answer", "gpt-4o", prompt_tokens=10, reservation=reservation)
+        ledger.release(reservation)  # already settled: no-op
+        assert tally.tokens == 10
+        ledger.release(ledger.check("gpt-4o", 90))
+        ledger.release(ledger.check("gpt-4o", 90))
+
+
+def test_concurrent_checks_cannot_overspend():
+    ledger = CostLedger()
+    barrier = threading.Barrier(10)
+    admitted, refused = [], []
+
+    def call():
+        barrier.wait()
+        try:
+            admitted.append(ledger.check("gpt-4o", 30))
+        except BudgetExceeded:
+            refused.append(True)
+
+    with cost_scope(run="r", max_tokens=100) as tally:
+        threads = [threading.Thread(target=contextvars.copy_context().run, args=(call,)) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(admitted) == 3 and len(refused) == 7
+        for reservation in admitted:
+            ledger.record("answer", "gpt-4o", prompt_tokens=30, reservation=reservation)
+        assert tally.tokens == 90
+        with pytest.raises(BudgetExceeded):
+            ledger.check("gpt-4o", 30)
+
+
+def test_gateway_holds_budget_for_calls_in_flight():
+    client = FakeLLMClient(latency_ms=50)
+    ledger = CostLedger()
+    gateway = LLMGateway(clients={"azure": client}, ledger=ledger, coalesce=False)
+    chat = gateway.client_for("answer", "azure").chat.completions
+    results = []
+
+    def call(i):
+        try:
+            chat.create(model="gpt-4o", max_tokens=100, messages=[{"role": "user", "content": f"question {i}"}])
+            results.append("sent")
+        except BudgetExceeded:
+            results.append("refused")
+
+    with cost_scope(run="r", max_tokens=250):
+        threads = [threading.Thread(target=contextvars.copy_context().run, args=(call, i)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    # each call is estimated at ~103 tokens: only two fit while both are in flight
+    assert results.count("sent") == 2 and client.calls == 2
+
+
+def test_gateway_releases_reservation_of_failed_call():
+    class Failing:
+        def __init__(self):
+            self.chat = self
+            self.completions = self
+
+        def create(self, **kwargs):
+            raise ValueError("bad request")
+
+    ledger = CostLedger()
+    gateway = LLMGateway(clients={"azure": Failing()}, ledger=ledger)
+    chat = gateway.client_for("answer", "azure").chat.completions
+    with cost_scope(run="r", max_tokens=150):
+        for _ in range(3):
+            with pytest.raises(ValueError):
+                chat.create(model="gpt-4o", max_tokens=100, messages=[{"role": "user", "content": "hi"}])
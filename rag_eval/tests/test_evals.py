@@ -0,0 +1,66 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import evals
+import llm_gateway
+from benchmarks.fakes import FakeLLMClient
+from cost_ledger import CostLedger, cost_scope
+from llm_gateway import LLMGateway
+
+
+@pytest.fixture
+def judge_client(monkeypatch):
+    client = FakeLLMClient(responder=lambda messages, kwargs: "pass")
+    ledger = CostLedger()
+    gateway = LLMGateway(clients={"azure": client}, ledger=ledger)
+    monkeypatch.setattr(llm_gateway, "_gateway", gateway)
+    evals.get_batch_judge.cache_clear()
+    yield client, gateway, ledger
+    evals.get_batch_judge.cache_clear()
+
+
+def test_per_row_judge_goes_through_the_gateway(judge_client):
+    client, gateway, ledger = judge_client
+    with cost_scope(run="eval_test", document="a.docx") as row_cost:
+        assert evals.score_per_row("Ragas evaluates RAG.", "- evaluates RAG") == "pass"
+
+    assert client.calls == 1
+    assert gateway.usage("judge")["requests"] == 1
+    assert row_cost.requests == 1 and row_cost.tokens > 0
+    assert ledger.totals("operation", "eval_test")["judge"]["requests"] == 1
+
+
+def test_batched_and_per_row_results_are_cached_apart():
+    class Client:
+        def fingerprint(self):
+            return {"rag": 1}
+
+    assert evals.eval_fingerprint(Client()) != evals.eval_fingerprint(Client(), judge=object())
+
+
+def test_uncached_rows_run_as_their_own_dataset(monkeypatch):
+    saved = []
+
+    class Records:
+        def __init__(self, rows):
+            self.rows = rows
+
+        def to_dict(self, orient):
+            return [{**row, "response": "answer", "score": "pass", "log_file": None} for row in self.rows]
+
+    class Experiment:
+        async def arun(self, dataset):
+            return SimpleNamespace(name="exp", to_pandas=lambda: Records(dataset))
+
+    class Client:
+        def fingerprint(self):
+            return {"rag": 1}
+
+    monkeypatch.setattr(evals, "make_dataset", lambda rows, name="generated_qa_dataset": saved.append(name) or rows)
+    monkeypatch.setattr(evals, "create_run_experiment", lambda rag_client, judge=None: Experiment())
+    rows = [{"question": "q", "grading_notes": "n", "document_name": "a.pdf"}]
+    merged, name, num_cached = asyncio.run(evals.run_rows_cached(rows, Client(), run="eval_1"))
+    assert saved == ["pending_eval_1"]
+    assert name == "exp" and num_cached == 0 and merged[0]["score"] == "pass"
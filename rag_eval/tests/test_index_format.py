@@ -0,0 +1,107 @@
+import json
+import os
+
+import pytest
+
+import index_format
+from benchmarks.fakes import FakeEmbeddingsClient, FakeLLMClient
+from index_format import MANIFEST, IndexFormatError, MappedStrings
+from rag import BaseRetriever, EmbeddingRetriever, ExampleRAG, SimpleKeywordRetriever
+from tracing import NullSink
+
+DOCUMENTS = ["Ragas evaluates RAG pipelines.", "Intel makes processors.", "Neo4j stores graphs.", ""]
+QUERIES = ["what evaluates rag", "processors", "graphs stores", "unknownterm"]
+
+
+def keyword_retriever():
+    retriever = SimpleKeywordRetriever()
+    retriever.fit(DOCUMENTS)
+    return retriever
+
+
+def embedding_retriever():
+    retriever = EmbeddingRetriever(FakeEmbeddingsClient(dimensions=32), model="fake-embed", batch_size=2)
+    retriever.fit(DOCUMENTS)
+    return retriever
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+@pytest.mark.parametrize("make", [keyword_retriever, embedding_retriever])
+def test_round_trip(tmp_path, make, mmap):
+    retriever = make()
+    path = retriever.save(str(tmp_path / "index"))
+    kwargs = {"embedding_client": retriever.embedding_client} if isinstance(retriever, EmbeddingRetriever) else {}
+
+    loaded = BaseRetriever.load(path, mmap=mmap, **kwargs)
+    assert type(loaded) is type(retriever)
+    assert isinstance(loaded.documents, MappedStrings)
+    assert list(loaded.documents) == DOCUMENTS
+    assert loaded.config() == retriever.config()
+    assert loaded.get_top_k_batch(QUERIES, 2) == retriever.get_top_k_batch(QUERIES, 2)
+
+
+def test_version_mismatch_is_rejected(tmp_path):
+    path = keyword_retriever().save(str(tmp_path / "index"))
+    manifest_path = os.path.join(path, MANIFEST)
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    manifest["version"] = index_format.FORMAT_VERSION + 1
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f)
+
+    with pytest.raises(IndexFormatError, match="format version"):
+        BaseRetriever.load(path)
+    with pytest.raises(IndexFormatError, match="missing"):
+        BaseRetriever.load(str(tmp_path / "nothing"))
+
+
+def test_load_checks_retriever_type(tmp_path):
+    path = keyword_retriever().save(str(tmp_path / "index"))
+    with pytest.raises(IndexFormatError, match="not a EmbeddingRetriever"):
+        EmbeddingRetriever.load(path)
+
+
+def test_save_replaces_existing_index(tmp_path):
+    path = keyword_retriever().save(str(tmp_path / "index"))
+    replacement = SimpleKeywordRetriever()
+    replacement.fit(DOCUMENTS[:2])
+    assert replacement.save(path) == path
+    assert list(BaseRetriever.load(path).documents) == DOCUMENTS[:2]
+    assert os.listdir(tmp_path) == ["index"]
+
+
+def test_failed_swap_keeps_previous_index(tmp_path, monkeypatch):
+    path = keyword_retriever().save(str(tmp_path / "index"))
+    replace = os.replace
+
+    def fail_publish(src, dst):
+        if ".tmp-" in src:
+            raise OSError("rename failed")
+        replace(src, dst)
+
+    monkeypatch.setattr(index_format.os, "replace", fail_publish)
+    replacement = SimpleKeywordRetriever()
+    replacement.fit(DOCUMENTS[:1])
+    with pytest.raises(OSError):
+        replacement.save(path)
+    assert list(BaseRetriever.load(path).documents) == DOCUMENTS
+
+
+def test_load_or_build_index_reuses_saved_index(tmp_path, monkeypatch):
+    def make_rag():
+        return ExampleRAG(llm_client=FakeLLMClient(), logdir=str(tmp_path / "logs"), trace_sink=NullSink())
+
+    index_root = str(tmp_path / "indexes")
+    path = make_rag().load_or_build_index(DOCUMENTS, index_root)
+
+    fits, fit = [], SimpleKeywordRetriever.fit
+    monkeypatch.setattr(
+        SimpleKeywordRetriever, "fit", lambda self, documents: fits.append(documents) or fit(self, documents)
+    )
+    reused = make_rag()
+    assert reused.load_or_build_index(DOCUMENTS, index_root) == path
+    assert fits == [] and isinstance(reused.documents, MappedStrings)
+    assert reused.retrieve_documents("intel", 1)[0]["content"] == DOCUMENTS[1]
+
+    assert make_rag().load_or_build_index(DOCUMENTS[:2], index_root) != path
+    assert len(fits) == 1
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from benchmarks.corpus import make_corpus, make_queries
+from rag import SimpleKeywordRetriever, top_k_indices, top_k_rows
+
+DOCUMENTS = make_corpus(200, mean_words=20, vocabulary_size=300, seed=3) + [
+    "the cat and the hat",
+    "The Cat sat",
+    "",
+    "the",
+]
+QUERIES = [query for query, _ in make_queries(DOCUMENTS[:200], 30, words_per_query=3, seed=4)] + [
+    "",
+    "   ",
+    "the and the",
+    "THE cat",
+    "zzzunknown qqqmissing",
+    "cat zzzunknown cat",
+]
+
+
+def reference_top_k(documents, query, k):
+    """The original linear scan: count query words present in each document, stable sort"""
+    query_words = query.lower().split()
+    scores = []
+    for i, doc in enumerate(documents):
+        document_words = doc.lower().split()
+        scores.append((i, sum(1 for word in query_words if word in document_words)))
+    scores.sort(key=lambda x: x[1], reverse=True)
+    return scores[:k]
+
+
+@pytest.fixture(scope="module")
+def retriever():
+    retriever = SimpleKeywordRetriever()
+    retriever.fit(DOCUMENTS)
+    return retriever
+
+
+@pytest.mark.parametrize("k", [1, 3, 10, len(DOCUMENTS) + 5])
+def test_matches_linear_scan(retriever, k):
+    expected = [reference_top_k(DOCUMENTS, query, k) for query in QUERIES]
+    assert [retriever.get_top_k(query, k) for query in QUERIES] == expected
+    assert retriever.get_top_k_batch(QUERIES, k) == expected
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_reloaded_index_matches_linear_scan(retriever, tmp_path, mmap):
+    loaded = SimpleKeywordRetriever.load(retriever.save(str(tmp_path / "index")), mmap=mmap)
+    expected = [reference_top_k(DOCUMENTS, query, 5) for query in QUERIES]
+    assert [loaded.get_top_k(query, 5) for query in QUERIES] == expected
+    assert loaded.get_top_k_batch(QUERIES, 5) == expected
+
+
+def test_top_k_rows_breaks_ties_by_lower_index():
+    scores = np.random.default_rng(0).integers(0, 3, size=(50, 40))
+    for k in (0, 1, 5, 40, 60):
+        assert top_k_rows(scores, k) == [top_k_indices(row, k) for row in scores]
+    assert top_k_rows(np.zeros((2, 4), dtype=np.int32), 2) == [[(0, 0), (1, 0)]] * 2
+
+
+def test_unfitted_retriever_returns_nothing():
+    retriever = SimpleKeywordRetriever()
+    assert retriever.get_top_k("anything") == []
+    assert retriever.get_top_k_batch(["anything", ""]) == [[], []]
@@ -0,0 +1,111 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.fakes import FakeLLMClient
+from cost_ledger import CostLedger
+from llm_gateway import LLMGateway, TokenBucket, is_retryable, model_for, retry_after_seconds
+
+
+class APIError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+class FlakyClient(FakeLLMClient):
+    """Fails its first calls with the given errors, then answers"""
+
+    def __init__(self, errors):
+        super().__init__()
+        self.errors = list(errors)
+        self.attempts = 0
+
+    def _complete(self, model, messages, kwargs):
+        self.attempts += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return super()._complete(model, messages, kwargs)
+
+
+def gateway_for(client, **options):
+    options.setdefault("backoff_base", 0.001)
+    return LLMGateway(clients={"azure": client}, ledger=CostLedger(), **options)
+
+
+def ask(gateway, content="hello", caller="answer"):
+    chat = gateway.client_for(caller, "azure").chat.completions
+    return chat.create(model="gpt-4o", messages=[{"role": "user", "content": content}])
+
+
+def test_retryable_errors_are_retried_and_accounted():
+    client = FlakyClient([APIError(429, {"retry-after-ms": "1"}), APIError(503)])
+    gateway = gateway_for(client)
+    assert ask(gateway).choices[0].message.content
+    usage = gateway.usage("answer")
+    assert client.attempts == 3
+    assert usage["requests"] == 3 and usage["retries"] == 2 and usage["errors"] == 0
+    assert usage["total_tokens"] > 0
+
+
+def test_non_retryable_error_is_raised_at_once():
+    client = FlakyClient([APIError(400)])
+    gateway = gateway_for(client)
+    with pytest.raises(APIError):
+        ask(gateway)
+    assert client.attempts == 1
+    assert gateway.usage("answer")["errors"] == 1
+
+
+def test_retries_stop_after_max_retries():
+    client = FlakyClient([APIError(500)] * 5)
+    gateway = gateway_for(client, max_retries=2)
+    with pytest.raises(APIError):
+        ask(gateway)
+    assert client.attempts == 3
+
+
+def test_identical_concurrent_requests_are_sent_once():
+    client = FakeLLMClient(latency_ms=100)
+    gateway = gateway_for(client)
+    answers = []
+    threads = [threading.Thread(target=lambda: answers.append(ask(gateway))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert client.calls == 1
+    assert len({id(answer) for answer in answers}) == 1
+    assert gateway.usage("answer")["coalesced"] == 4
+
+
+def test_usage_is_recorded_in_the_ledger_per_caller():
+    gateway = gateway_for(FakeLLMClient())
+    ask(gateway, caller="judge")
+    assert gateway.ledger.totals("operation")["judge"]["requests"] == 1
+
+
+def test_token_bucket_waits_when_empty():
+    bucket = TokenBucket(rate_per_minute=600)  # 10 per second
+    assert bucket.acquire(600) == 0.0
+    started = time.monotonic()
+    waited = bucket.acquire(1)
+    assert waited == pytest.approx(0.1, abs=0.05)
+    assert time.monotonic() - started >= 0.05
+
+
+def test_retry_after_headers():
+    assert retry_after_seconds(APIError(429, {"Retry-After": "2"})) == 2.0
+    assert retry_after_seconds(APIError(429, {"retry-after-ms": "250"})) == 0.25
+    assert retry_after_seconds(APIError(429)) is None
+    assert is_retryable(APIError(429)) and is_retryable(APIError(502))
+    assert not is_retryable(APIError(401))
+
+
+def test_model_for_env_override(monkeypatch):
+    monkeypatch.setenv("LLM_MODEL_JUDGE", "gpt-4o-mini")
+    assert model_for("judge", "gpt-4o") == "gpt-4o-mini"
+    assert model_for("generation", "gpt-4o") == "gpt-4o"
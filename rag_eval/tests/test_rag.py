@@ -0,0 +1,105 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchmarks.fakes import FakeLLMClient
+from context_budget import ContextAssembler
+from cost_ledger import BudgetExceeded, CostLedger, cost_scope
+from llm_gateway import LLMGateway
+from rag import NO_DOCUMENTS_ANSWER, ExampleRAG, SimpleKeywordRetriever
+from tracing import NullSink
+
+
+def make_rag(tmp_path, **kwargs):
+    llm = FakeLLMClient()
+    rag = ExampleRAG(llm_client=llm, logdir=str(tmp_path), trace_sink=NullSink(), **kwargs)
+    return rag, llm
+
+
+def test_query_answers_from_retrieved_documents(tmp_path):
+    rag, llm = make_rag(tmp_path)
+    rag.set_documents(["Ragas evaluates RAG pipelines.", "Intel makes processors."])
+    result = rag.query("What does Ragas evaluate?")
+    assert llm.calls == 1
+    assert result["answer"] and not result["answer"].startswith("Error")
+
+
+def test_empty_assembled_context_skips_llm(tmp_path):
+    rag, llm = make_rag(tmp_path, context_assembler=ContextAssembler(max_tokens=50))
+    rag.set_documents(["placeholder document"])
+    answer = rag.generate_response("question", retrieved_docs=[{"content": " \n "}])
+    assert answer == NO_DOCUMENTS_ANSWER
+    assert llm.calls == 0
+
+
+def test_oversized_document_still_reaches_llm(tmp_path):
+    rag, llm = make_rag(tmp_path, context_assembler=ContextAssembler(max_tokens=100))
+    rag.set_documents(["word " * 2000])
+    answer = rag.generate_response("word", retrieved_docs=[{"content": "word " * 2000}])
+    assert answer != NO_DOCUMENTS_ANSWER
+    assert llm.calls == 1
+
+
+def test_budget_exceeded_is_raised_not_answered(tmp_path):
+    llm = FakeLLMClient()
+    gateway = LLMGateway(clients={"azure": llm}, ledger=CostLedger())
+    rag = ExampleRAG(
+        llm_client=gateway.client_for("answer", "azure"), logdir=str(tmp_path), trace_sink=NullSink()
+    )
+    rag.set_documents(["Ragas evaluates RAG pipelines."])
+    with cost_scope(run="r", max_tokens=10):
+        with pytest.raises(BudgetExceeded):
+            rag.query("What does Ragas evaluate?")
+        with pytest.raises(BudgetExceeded):
+            rag.query_batch(["What does Ragas evaluate?", "Anything else?"])
+    assert llm.calls == 0
+
+
+class SlowRetriever(SimpleKeywordRetriever):
+    """Widens the window between scoring and reading the documents"""
+
+    def get_top_k_batch(self, queries, k=3):
+        results = super().get_top_k_batch(queries, k)
+        time.sleep(0.001)
+        return results
+
+
+def test_queries_see_one_snapshot_while_documents_are_swapped(tmp_path):
+    # The matching documents sit at different ids in each corpus
+    corpora = [
+        [f"alpha shared fact {i}" for i in range(3)],
+        [f"beta filler {i}" for i in range(37)] + [f"beta shared fact {i}" for i in range(3)],
+    ]
+    # Answer with the prompt, so the answer shows which documents were used
+    llm = FakeLLMClient(latency_ms=1, responder=lambda messages, kwargs: messages[-1]["content"])
+    rag = ExampleRAG(llm_client=llm, retriever=SlowRetriever(), logdir=str(tmp_path), trace_sink=NullSink())
+    rag.set_documents(corpora[0])
+    done = threading.Event()
+
+    def swap():
+        i = 0
+        while not done.is_set():
+            i += 1
+            rag.set_documents(corpora[i % 2])
+            time.sleep(0.0005)
+
+    def ask(n):
+        return [rag.query("shared fact", top_k=3)["answer"] for _ in range(n)]
+
+    swapper = threading.Thread(target=swap)
+    swapper.start()
+    try:
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            answers = [a for batch in executor.map(ask, [10] * 6) for a in batch]
+            answers += [result["answer"] for result in rag.query_batch(["shared fact"] * 20, top_k=3)]
+    finally:
+        done.set()
+        swapper.join()
+
+    assert rag.snapshot.version > 2
+    for answer in answers:
+        assert not answer.startswith("Error")
+        assert ("alpha" in answer) != ("beta" in answer)
+        assert answer.count(" shared fact ") == 3
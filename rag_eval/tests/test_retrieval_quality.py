@@ -0,0 +1,25 @@
+import csv
+
+from benchmarks.retrieval_quality import csv_dataset
+
+
+def test_csv_dataset_reads_uploads_and_counts_skipped_rows(tmp_path):
+    documents = tmp_path / "data"
+    documents.mkdir()
+    (documents / "a.txt").write_text("Ragas evaluates RAG pipelines.", encoding="utf-8")
+    (documents / "b.txt").write_text("Intel makes processors.", encoding="utf-8")
+    (documents / "empty.txt").write_text("  \n", encoding="utf-8")
+    (documents / "document_index.json").write_text("{}", encoding="utf-8")
+
+    dataset = tmp_path / "qa.csv"
+    with open(dataset, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["question", "grading_notes", "document_name"])
+        writer.writeheader()
+        writer.writerow({"question": "Who makes processors?", "grading_notes": "Intel", "document_name": "b.txt"})
+        writer.writerow({"question": "What is in the pdf?", "grading_notes": "x", "document_name": "gone.pdf"})
+        writer.writerow({"question": "Anything?", "grading_notes": "x", "document_name": "empty.txt"})
+
+    texts, questions, relevant, skipped = csv_dataset(dataset, documents)
+    assert texts == ["Ragas evaluates RAG pipelines.", "Intel makes processors."]
+    assert questions == ["Who makes processors?"] and relevant == [[1]]
+    assert skipped == 2
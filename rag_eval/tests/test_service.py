@@ -0,0 +1,89 @@
+import asyncio
+import json
+
+from benchmarks.fakes import FakeLLMClient
+from rag import ExampleRAG
+from service import RAGService
+from tracing import NullSink
+
+DOCUMENTS = ["Ragas evaluates RAG pipelines.", "Intel makes processors.", "Neo4j stores graphs."]
+
+
+def make_service(tmp_path, **options):
+    def rag_factory():
+        rag = ExampleRAG(llm_client=FakeLLMClient(), logdir=str(tmp_path), trace_sink=NullSink())
+        rag.set_documents(DOCUMENTS)
+        return rag
+
+    return RAGService(rag_factory, **options)
+
+
+async def request(service, method, path, body=None):
+    """One ASGI HTTP request; returns (status, headers, JSON payload)"""
+    data = b"" if body is None else body if isinstance(body, bytes) else json.dumps(body).encode()
+    messages = [{"type": "http.request", "body": data, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await service({"type": "http", "method": method, "path": path}, receive, send)
+    start, response = sent
+    return start["status"], dict(start["headers"]), json.loads(response["body"])
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_query_and_health(tmp_path):
+    async def scenario():
+        service = make_service(tmp_path)
+        status, _, result = await request(service, "POST", "/query", {"question": "What makes processors?"})
+        assert status == 200 and result["answer"]
+        status, _, health = await request(service, "GET", "/healthz")
+        assert status == 200 and health["documents"] == 3 and health["batches"] == 1
+        await service.shutdown()
+
+    run(scenario())
+
+
+def test_concurrent_retrievals_are_batched(tmp_path):
+    async def scenario():
+        service = make_service(tmp_path, max_wait_ms=50)
+        await service.startup()
+        responses = await asyncio.gather(
+            *(request(service, "POST", "/retrieve", {"query": q, "top_k": 1}) for q in DOCUMENTS)
+        )
+        assert [status for status, _, _ in responses] == [200] * 3
+        assert [payload["documents"][0]["content"] for _, _, payload in responses] == DOCUMENTS
+        assert service.batcher.batches < 3
+        await service.shutdown()
+
+    run(scenario())
+
+
+def test_bad_requests(tmp_path):
+    async def scenario():
+        service = make_service(tmp_path)
+        assert (await request(service, "POST", "/query", b"not json"))[0] == 400
+        assert (await request(service, "POST", "/query", {"question": " "}))[0] == 400
+        assert (await request(service, "POST", "/retrieve", {"query": "x", "top_k": 0}))[0] == 400
+        assert (await request(service, "GET", "/query"))[0] == 405
+        assert (await request(service, "GET", "/missing"))[0] == 404
+        await service.shutdown()
+
+    run(scenario())
+
+
+def test_overload_answers_429_with_retry_after(tmp_path):
+    async def scenario():
+        service = make_service(tmp_path, max_inflight=0)
+        status, headers, _ = await request(service, "POST", "/query", {"question": "anything"})
+        assert status == 429 and headers[b"retry-after"] == b"1"
+        await service.shutdown()
+
+    run(scenario())
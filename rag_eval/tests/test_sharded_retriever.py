@@ -0,0 +1,103 @@
+import gc
+import os
+
+import pytest
+
+import index_format
+from rag import BaseRetriever, SimpleKeywordRetriever
+from sharded_retriever import ShardedRetriever, merge_top_k
+
+DOCUMENTS = [f"document {i} about topic{i % 7} and shared words" for i in range(40)]
+QUERIES = ["topic3 words", "document 12", "topic0 shared", "nothing matches zzz"]
+
+
+@pytest.fixture
+def sharded():
+    retriever = ShardedRetriever(num_shards=2)
+    retriever.fit(DOCUMENTS)
+    yield retriever
+    retriever.close()
+
+
+def test_merge_top_k_orders_by_score_then_id():
+    assert merge_top_k([[(5, 2.0), (1, 1.0)], [(3, 2.0), (0, 1.0)]], 3) == [(3, 2.0), (5, 2.0), (0, 1.0)]
+
+
+def test_matches_single_retriever(sharded):
+    single = SimpleKeywordRetriever()
+    single.fit(DOCUMENTS)
+    assert sharded.get_top_k_batch(QUERIES, 5) == [single.get_top_k(q, 5) for q in QUERIES]
+
+
+def test_refit_shuts_down_previous_workers_and_directory(sharded):
+    old_root, old_executors = sharded._shard_root, list(sharded._executors)
+    sharded.fit(DOCUMENTS[:10])
+    assert not os.path.exists(old_root)
+    assert all(executor._shutdown_thread for executor in old_executors)
+    assert sharded.get_top_k("document 3", 1)[0][0] == 3
+
+
+def test_fitted_copy_is_independent(sharded):
+    copy = sharded.fitted_copy(DOCUMENTS[:10])
+    try:
+        assert copy._shard_root != sharded._shard_root
+        assert len(sharded.get_top_k("shared", 40)) == 40
+        assert len(copy.get_top_k("shared", 40)) == 10
+    finally:
+        copy.close()
+    assert os.path.exists(sharded._shard_root)
+
+
+def test_close_removes_temporary_shards(sharded):
+    root = sharded._shard_root
+    sharded.close()
+    assert not os.path.exists(root)
+
+
+def test_garbage_collected_retriever_is_cleaned_up():
+    retriever = ShardedRetriever(num_shards=1)
+    retriever.fit(DOCUMENTS[:5])
+    root = retriever._shard_root
+    del retriever
+    gc.collect()
+    assert not os.path.exists(root)
+
+
+def test_loaded_index_is_not_deleted_on_close(sharded, tmp_path):
+    path = sharded.save(str(tmp_path / "index"))
+    loaded = BaseRetriever.load(path)
+    assert loaded.get_top_k_batch(QUERIES, 3) == sharded.get_top_k_batch(QUERIES, 3)
+    loaded.close()
+    assert os.path.exists(path)
+
+
+def test_failed_save_keeps_previous_index(sharded, tmp_path, monkeypatch):
+    path = sharded.save(str(tmp_path / "index"))
+
+    def fail(source, target):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(index_format.shutil, "copytree", fail)
+    with pytest.raises(OSError):
+        sharded.save(path)
+    monkeypatch.undo()
+
+    loaded = BaseRetriever.load(path)
+    try:
+        assert loaded.get_top_k_batch(QUERIES, 3) == sharded.get_top_k_batch(QUERIES, 3)
+    finally:
+        loaded.close()
+
+
+def test_loaded_index_can_be_saved_over_itself(sharded, tmp_path):
+    path = sharded.save(str(tmp_path / "index"))
+    loaded = BaseRetriever.load(path, mmap=False)
+    try:
+        assert loaded.save(path) == path
+    finally:
+        loaded.close()
+    reloaded = BaseRetriever.load(path)
+    try:
+        assert reloaded.get_top_k_batch(QUERIES, 3) == sharded.get_top_k_batch(QUERIES, 3)
+    finally:
+        reloaded.close()
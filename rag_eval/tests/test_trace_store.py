@@ -0,0 +1,111 @@
+import json
+import os
+
+import pytest
+
+import trace_store
+from trace_store import TraceStore, is_segment_file, parse_ref, segment_number
+
+
+def record(i):
+    return {"run_id": f"run-{i}", "timestamp": f"2026-01-01T00:00:{i:02d}", "traces": [{"n": i}]}
+
+
+@pytest.mark.parametrize("background", [False, True])
+def test_append_then_read_and_get(tmp_path, background):
+    store = TraceStore(str(tmp_path), background=background)
+    refs = [store.append(record(i)) for i in range(3)]
+    store.flush()
+    assert [store.read(ref)["run_id"] for ref in refs] == ["run-0", "run-1", "run-2"]
+    assert store.get("run-1") == record(1)
+    assert store.get("missing") is None
+    store.close()
+
+
+def test_segments_rotate_and_reopen_resumes_index(tmp_path):
+    store = TraceStore(str(tmp_path), segment_bytes=100, background=False)
+    refs = [store.append(record(i)) for i in range(4)]
+    store.close()
+    assert len({parse_ref(ref)[0] for ref in refs}) == 4
+    assert sorted(p.name for p in tmp_path.iterdir() if is_segment_file(p.name)) == [
+        f"traces-p{os.getpid()}-00000{i}.jsonl" for i in range(1, 5)
+    ]
+
+    reopened = TraceStore(str(tmp_path), segment_bytes=100, background=False)
+    assert reopened.get("run-2") == record(2)
+    assert segment_number(parse_ref(reopened.append(record(4)))[0]) == 5
+    reopened.close()
+
+
+def test_scan_returns_time_range_oldest_first(tmp_path):
+    store = TraceStore(str(tmp_path), background=False)
+    for i in (3, 1, 2, 0):
+        store.append(record(i))
+    scanned = store.scan("2026-01-01T00:00:01", "2026-01-01T00:00:03")
+    assert [r["run_id"] for r in scanned] == ["run-1", "run-2"]
+    store.close()
+
+
+def test_parse_ref_rejects_bare_names():
+    assert parse_ref("traces-000001.jsonl:18") == ("traces-000001.jsonl", 18)
+    with pytest.raises(ValueError):
+        parse_ref("18")
+
+
+@pytest.mark.parametrize("background", [False, True])
+def test_failed_write_is_dropped_and_store_keeps_writing(tmp_path, background):
+    store = TraceStore(str(tmp_path), background=background)
+    write = store._write
+    calls = []
+
+    def fail_first(entry, payload):
+        calls.append(entry)
+        if len(calls) == 1:
+            raise OSError("disk full")
+        write(entry, payload)
+
+    store._write = fail_first
+    first = store.append(record(0))
+    store.flush()
+    refs = [store.append(record(i)) for i in (1, 2)]
+    store.flush()
+
+    assert store.dropped == 1 and store.get("run-0") is None
+    assert parse_ref(refs[0])[0] != parse_ref(first)[0]
+    assert [store.read(ref)["run_id"] for ref in refs] == ["run-1", "run-2"]
+    store.close()
+
+
+def store_of_process(root, pid, monkeypatch):
+    with monkeypatch.context() as patch:
+        patch.setattr(trace_store.os, "getpid", lambda: pid)
+        return TraceStore(root, background=False)
+
+
+def test_processes_write_their_own_segments(tmp_path, monkeypatch):
+    first, second = (store_of_process(str(tmp_path), pid, monkeypatch) for pid in (101, 202))
+    refs = [store.append(record(i)) for i, store in enumerate([first, second, first, second])]
+    assert {parse_ref(ref) for ref in refs} == {
+        ("traces-p101-000001.jsonl", 0),
+        ("traces-p202-000001.jsonl", 0),
+        ("traces-p101-000001.jsonl", len(json.dumps(record(0), separators=(",", ":"))) + 1),
+        ("traces-p202-000001.jsonl", len(json.dumps(record(1), separators=(",", ":"))) + 1),
+    }
+    first.close()
+    second.close()
+
+    reader = TraceStore(str(tmp_path), background=False)
+    assert [reader.read(ref)["run_id"] for ref in refs] == [f"run-{i}" for i in range(4)]
+    assert [entry["run_id"] for entry in reader.entries()] == [f"run-{i}" for i in range(4)]
+    reader.close()
+
+
+def test_reads_stores_written_before_per_process_segments(tmp_path):
+    line = json.dumps(record(0)).encode() + b"\n"
+    (tmp_path / "traces-000001.jsonl").write_bytes(line)
+    entry = {"run_id": "run-0", "ts": record(0)["timestamp"], "length": len(line),
+             "segment": "traces-000001.jsonl", "offset": 0}
+    (tmp_path / "index.jsonl").write_text(json.dumps(entry) + "\n")
+    store = TraceStore(str(tmp_path), background=False)
+    assert store.get("run-0") == record(0)
+    store.close()
@@ -0,0 +1,85 @@
+import json
+import os
+
+import pytest
+
+from tracing import (
+    BackgroundWriterSink,
+    FanoutSink,
+    InMemorySpanExporter,
+    NullSink,
+    RingBufferSink,
+    TraceRecorder,
+    record_spans,
+)
+
+
+def make_record(run_id="run-1"):
+    recorder = TraceRecorder()
+    with recorder.span("query", "rag", operation="query") as root:
+        recorder.event("retrieval_batch", "service", batch_size=2)
+        with recorder.span("llm_call", "generation", operation="generate") as child:
+            child.set(tokens=12)
+        root.set(answer_chars=42)
+    return {
+        "run_id": run_id,
+        "timestamp": "2026-01-01T00:00:00",
+        "origin_unix_ns": recorder.origin_unix_ns,
+        "traces": recorder.to_dicts(),
+    }, recorder
+
+
+def test_spans_record_parent_and_duration():
+    _, recorder = make_record()
+    child, root = [event for event in recorder if event.duration_ns is not None]
+    assert child.parent_id == root.span_id and root.parent_id is None
+    assert child.data == {"operation": "generate", "tokens": 12}
+    assert root.duration_ns >= child.duration_ns >= 0
+    assert len(recorder) == 3
+
+
+def test_span_records_error_and_reraises():
+    recorder = TraceRecorder()
+    with pytest.raises(ValueError):
+        with recorder.span("llm_call", "generation"):
+            raise ValueError("boom")
+    assert recorder.events[0].data["error"] == "boom"
+    assert recorder.open_spans == []
+
+
+def test_ring_buffer_keeps_latest_records():
+    record, _ = make_record()
+    ring = RingBufferSink(capacity=1)
+    assert NullSink().emit(record) is None
+    assert [ring.emit(record), ring.emit(record)] == ["memory:1", "memory:2"]
+    assert len(ring.records) == 1
+
+
+def test_record_spans_attaches_events_to_enclosing_span():
+    record, _ = make_record()
+    spans = {span["name"]: span for span in record_spans(record)}
+    assert set(spans) == {"rag.query", "generation.generate"}
+    assert [e["name"] for e in spans["rag.query"]["events"]] == ["retrieval_batch"]
+    assert spans["generation.generate"]["parent_id"] == spans["rag.query"]["span_id"]
+    assert spans["rag.query"]["start_unix_ns"] >= record["origin_unix_ns"]
+
+
+def test_in_memory_exporter_and_fanout():
+    record, _ = make_record()
+    ring, exporter = RingBufferSink(capacity=1), InMemorySpanExporter()
+    fanout = FanoutSink(NullSink(), exporter, ring)
+    assert fanout.emit(record) == "memory:1"
+    assert fanout.emit(record) == "memory:2"
+    assert len(ring.records) == 1
+    assert len(exporter.get_finished_spans("rag.query")) == 2
+
+
+def test_background_writer_writes_one_file_per_trace(tmp_path):
+    record, _ = make_record()
+    sink = BackgroundWriterSink(str(tmp_path))
+    path = sink.emit(record)
+    sink.flush()
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f)["run_id"] == "run-1"
+    sink.close()
+    assert os.listdir(tmp_path) == [os.path.basename(path)]
@@ -0,0 +1,255 @@
+"""
+Trace analytics over a logs directory.
+
+Reads both the legacy one-file-per-query traces (rag_run_*.json) and
+TraceStore segments (traces-*.jsonl[.zst]). Files are parsed in a process
+pool, one record at a time, and reduced to per-run rows and span rows; the
+parent aggregates latency percentiles per component, LLM token usage,
+retrieval score distributions and error rates.
+
+Usage:
+    python trace_analytics.py [LOGDIR] [--since 2025-12-08] [--until 2025-12-09]
+                              [--workers 4] [--parquet OUT_DIR]
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent))
+from trace_store import is_segment_file, iter_segment
+
+LEGACY_PREFIX = "rag_run_"
+PERCENTILES = (50, 90, 95, 99)
+# Legacy files are tiny, so they are handed to workers in batches
+LEGACY_BATCH_SIZE = 64
+
+
+def iter_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield the trace records stored in one file, whatever its format"""
+    name = os.path.basename(path)
+    if is_segment_file(name):
+        yield from iter_segment(path)
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            yield json.load(f)
+
+
+def _usage_tokens(data: Dict[str, Any]) -> Dict[str, int]:
+    usage = data.get("usage") or {}
+    details = usage.get("prompt_tokens_details") or {}
+    cached = data.get("cached_tokens")
+    if cached is None:
+        cached = details.get("cached_tokens")
+    return {
+        "prompt_tokens": usage.get("prompt_tokens") or 0,
+        "completion_tokens": usage.get("completion_tokens") or 0,
+        "total_tokens": usage.get("total_tokens") or 0,
+        "cached_tokens": cached or 0,
+    }
+
+
+def summarize_record(record: Dict[str, Any], source: str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Reduce one trace record to a run row and its span rows"""
+    run = {
+        "run_id": record.get("run_id"),
+        "timestamp": record.get("timestamp"),
+        "source": source,
+        "num_documents": record.get("num_documents"),
+        "num_events": 0,
+        "llm_calls": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "total_tokens": 0,
+        "cached_tokens": 0,
+        "retrieval_scores": [],
+        "error": record.get("result") is None,
+    }
+    spans = []
+
+    for event in record.get("traces") or []:
+        run["num_events"] += 1
+        event_type = event.get("event_type")
+        data = event.get("data") or {}
+
+        if event_type == "error":
+            run["error"] = True
+        elif event_type == "llm_response":
+            run["llm_calls"] += 1
+            for key, value in _usage_tokens(data).items():
+                run[key] += value
+        elif event_type == "retrieval" and "scores" in data:
+            run["retrieval_scores"].extend(data["scores"])
+
+        if event.get("duration_ns") is not None:
+            spans.append(
+                {
+                    "run_id": run["run_id"],
+                    "timestamp": run["timestamp"],
+                    "component": event.get("component"),
+                    "operation": data.get("operation") or event_type,
+                    "duration_ms": event["duration_ns"] / 1e6,
+                }
+            )
+
+    return run, spans
+
+
+def _in_window(timestamp: Optional[str], since: Optional[str], until: Optional[str]) -> bool:
+    if timestamp is None:
+        return since is None and until is None
+    if since is not None and timestamp < since:
+        return False
+    if until is not None and timestamp >= until:
+        return False
+    return True
+
+
+def scan_files(
+    paths: List[str], since: Optional[str] = None, until: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Worker entry point: run and span rows for a batch of trace files"""
+    runs, spans = [], []
+    for path in paths:
+        source = os.path.basename(path)
+        try:
+            for record in iter_records(path):
+                if not _in_window(record.get("timestamp"), since, until):
+                    continue
+                run, run_spans = summarize_record(record, source)
+                runs.append(run)
+                spans.extend(run_spans)
+        except (OSError, ValueError) as e:
+            print(f"Skipping unreadable trace file {path}: {e}", file=sys.stderr)
+    return runs, spans
+
+
+def discover(logdir: str) -> List[List[str]]:
+    """Trace files in logdir, grouped into work units"""
+    legacy, segments = [], []
+    for name in sorted(os.listdir(logdir)):
+        path = os.path.join(logdir, name)
+        if is_segment_file(name):
+            segments.append([path])
+        elif name.startswith(LEGACY_PREFIX) and name.endswith(".json"):
+            legacy.append(path)
+    batches = [legacy[i : i + LEGACY_BATCH_SIZE] for i in range(0, len(legacy), LEGACY_BATCH_SIZE)]
+    return segments + batches
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """Linear-interpolated percentile of pre-sorted values"""
+    if not sorted_values:
+        return None
+    rank = (len(sorted_values) - 1) * pct / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    value = sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+    return round(value, 3)
+
+
+def distribution(values: List[float]) -> Dict[str, Any]:
+    values = sorted(values)
+    summary: Dict[str, Any] = {"count": len(values)}
+    if values:
+        summary.update(
+            {
+                "min": values[0],
+                "mean": round(sum(values) / len(values), 3),
+                "max": values[-1],
+            }
+        )
+        summary.update({f"p{p}": percentile(values, p) for p in PERCENTILES})
+    return summary
+
+
+def aggregate(runs: List[Dict[str, Any]], spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    latencies: Dict[str, List[float]] = {}
+    for span in spans:
+        latencies.setdefault(f"{span['component']}.{span['operation']}", []).append(
+            span["duration_ms"]
+        )
+
+    token_keys = ("prompt_tokens", "completion_tokens", "total_tokens", "cached_tokens")
+    tokens = {key: sum(run[key] for run in runs) for key in token_keys}
+    tokens["llm_calls"] = sum(run["llm_calls"] for run in runs)
+
+    errors = sum(1 for run in runs if run["error"])
+    timestamps = sorted(run["timestamp"] for run in runs if run["timestamp"])
+
+    return {
+        "runs": len(runs),
+        "first_run": timestamps[0] if timestamps else None,
+        "last_run": timestamps[-1] if timestamps else None,
+        "error_rate": round(errors / len(runs), 4) if runs else None,
+        "errors": errors,
+        "tokens": tokens,
+        "latency_ms": {name: distribution(values) for name, values in sorted(latencies.items())},
+        "retrieval_scores": distribution(
+            [score for run in runs for score in run["retrieval_scores"]]
+        ),
+    }
+
+
+def write_parquet(out_dir: str, runs: List[Dict[str, Any]], spans: List[Dict[str, Any]]) -> List[str]:
+    """Write runs.parquet and spans.parquet for further analysis"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(out_dir, exist_ok=True)
+    written = []
+    for name, rows in (("runs", runs), ("spans", spans)):
+        path = os.path.join(out_dir, f"{name}.parquet")
+        pq.write_table(pa.Table.from_pylist(rows), path)
+        written.append(path)
+    return written
+
+
+def analyze(
+    logdir: str,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    workers: Optional[int] = None,
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Scan logdir in a process pool; returns (summary, run rows, span rows)"""
+    units = discover(logdir)
+    runs: List[Dict[str, Any]] = []
+    spans: List[Dict[str, Any]] = []
+
+    if workers == 1 or len(units) <= 1:
+        results = (scan_files(unit, since, until) for unit in units)
+        for unit_runs, unit_spans in results:
+            runs.extend(unit_runs)
+            spans.extend(unit_spans)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(scan_files, unit, since, until) for unit in units]
+            for future in futures:
+                unit_runs, unit_spans = future.result()
+                runs.extend(unit_runs)
+                spans.extend(unit_spans)
+
+    return aggregate(runs, spans), runs, spans
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate RAG trace logs")
+    parser.add_argument("logdir", nargs="?", default="logs")
+    parser.add_argument("--since", help="Only runs at or after this ISO timestamp/date")
+    parser.add_argument("--until", help="Only runs before this ISO timestamp/date")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument("--parquet", metavar="OUT_DIR", help="Also write runs/spans Parquet files")
+    args = parser.parse_args()
+
+    summary, runs, spans = analyze(args.logdir, args.since, args.until, args.workers)
+    if args.parquet:
+        summary["parquet"] = write_parquet(args.parquet, runs, spans)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
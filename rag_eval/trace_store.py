@@ -0,0 +1,359 @@
+"""
+Append-only trace store.
+
+Trace records are appended as compact JSON lines to rotating segment files
+(traces-p<pid>-000001.jsonl, ...), optionally as independent zstd frames
+(traces-p<pid>-000001.jsonl.zst) so any record can still be read by offset.
+A small append-only index (index-p<pid>.jsonl) maps run_id to segment,
+offset and length.
+
+A record is referenced as "segment:offset", e.g.
+"traces-p4242-000003.jsonl:18422".
+
+Offsets are reserved in the writing process's memory, so every process
+writes its own segments and index, named after its pid: Streamlit, the eval
+CLI and the service can share one logs/ directory without interleaving
+records. Readers load the indexes of all writers (and the unsuffixed
+traces-NNNNNN / index.jsonl files of older stores). A write that fails (disk full, permissions) is logged
+and counted in TraceStore.dropped; the rest of its segment is dropped too,
+since the offsets reserved after it no longer hold, and appends continue in
+a new segment.
+"""
+
+import atexit
+import io
+import logging
+import os
+import queue
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from tracing import TraceSink, dumps
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+except ImportError:
+    import json
+
+    _loads = json.loads
+
+try:
+    import zstandard
+except ImportError:  # zstandard is pinned in requirements.txt but optional here
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "traces-"
+INDEX_FILENAME = "index.jsonl"
+INDEX_PREFIX = "index-"
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+
+
+def parse_ref(ref: str) -> Tuple[str, int]:
+    """Split a "segment:offset" reference"""
+    segment, _, offset = ref.rpartition(":")
+    if not segment:
+        raise ValueError(f"Not a trace store reference: {ref!r}")
+    return segment, int(offset)
+
+
+_open_stores: Dict[str, "TraceStore"] = {}
+_open_stores_lock = threading.Lock()
+
+
+def open_store(root: str = "logs", **kwargs: Any) -> "TraceStore":
+    """
+    Return the process-wide TraceStore for a directory, creating it once.
+
+    Several ExampleRAG instances commonly share a logdir; they must share one
+    writer, since offsets are reserved in memory.
+    """
+    key = os.path.abspath(root)
+    with _open_stores_lock:
+        store = _open_stores.get(key)
+        if store is None:
+            store = _open_stores[key] = TraceStore(root, **kwargs)
+        return store
+
+
+def is_index_file(filename: str) -> bool:
+    return filename == INDEX_FILENAME or (filename.startswith(INDEX_PREFIX) and filename.endswith(".jsonl"))
+
+
+def segment_number(filename: str) -> int:
+    """Sequence number of a segment file ("traces-p42-000003.jsonl" -> 3)"""
+    return int(filename.split(".", 1)[0].rsplit("-", 1)[1])
+
+
+def is_segment_file(filename: str) -> bool:
+    return filename.startswith(SEGMENT_PREFIX) and (
+        filename.endswith(".jsonl") or filename.endswith(".jsonl.zst")
+    )
+
+
+def iter_segment(path: str) -> Iterator[Dict[str, Any]]:
+    """Stream the records of one segment file without loading it whole"""
+    with open(path, "rb") as f:
+        if path.endswith(".zst"):
+            reader = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+            lines = io.BufferedReader(reader)
+        else:
+            lines = f
+        for line in lines:
+            if line.strip():
+                try:
+                    record = _loads(line)
+                except ValueError:
+                    # Torn by a failed write
+                    logger.warning(f"Skipping unreadable record in {path}")
+                    continue
+                yield record
+
+
+class TraceStore(TraceSink):
+    """
+    Append-only, segment-based store for query traces.
+
+    append() reserves the record's offset under a lock and returns its
+    reference immediately; with background=True the bytes are written by a
+    daemon thread, in reservation order, so the caller never waits on disk.
+    """
+
+    def __init__(
+        self,
+        root: str = "logs",
+        segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+        compress: bool = False,
+        compression_level: int = 3,
+        background: bool = True,
+    ):
+        """
+        Args:
+            root: Directory holding the segments and the index
+            segment_bytes: Size after which a new segment is started
+            compress: Store each record as a zstd frame
+            compression_level: zstd compression level
+            background: Write from a background thread instead of the caller
+        """
+        if compress and zstandard is None:
+            raise ImportError("compress=True requires the zstandard package")
+
+        self.root = root
+        self.segment_bytes = segment_bytes
+        self.compress = compress
+        self._compressor = zstandard.ZstdCompressor(level=compression_level) if compress else None
+        # Reentrant: without a writer thread, append() writes under the lock
+        self._lock = threading.RLock()
+        self._index: Dict[str, Dict[str, Any]] = {}
+        self._lengths: Dict[Tuple[str, int], int] = {}
+        self._failed_segments: Set[str] = set()
+        self.dropped = 0
+        # This process's segments and index
+        self._writer = f"p{os.getpid()}"
+
+        os.makedirs(self.root, exist_ok=True)
+        self._load_index()
+        self._segment, self._offset = self._current_segment()
+
+        self._handles: Dict[str, Any] = {}
+        self._index_handle = None
+        self._queue: Optional["queue.Queue"] = None
+        if background:
+            self._queue = queue.Queue()
+            self._thread = threading.Thread(target=self._run, name="trace-store", daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    # ------------------------------------------------------------------ write
+
+    def _segment_name(self, number: int) -> str:
+        suffix = ".jsonl.zst" if self.compress else ".jsonl"
+        return f"{SEGMENT_PREFIX}{self._writer}-{number:06d}{suffix}"
+
+    def _current_segment(self) -> Tuple[str, int]:
+        """Resume the newest segment of this store's kind, or start the first"""
+        own = f"{SEGMENT_PREFIX}{self._writer}-"
+        segments = sorted(f for f in os.listdir(self.root) if is_segment_file(f) and f.startswith(own))
+        if not segments:
+            return self._segment_name(1), 0
+
+        last = segments[-1]
+        number = segment_number(last)
+        size = os.path.getsize(os.path.join(self.root, last))
+        if last != self._segment_name(number) or size >= self.segment_bytes:
+            return self._segment_name(number + 1), 0
+        return last, size
+
+    def _encode(self, record: Dict[str, Any]) -> bytes:
+        payload = dumps(record) + b"\n"
+        if self._compressor is not None:
+            return self._compressor.compress(payload)
+        return payload
+
+    def append(self, record: Dict[str, Any]) -> str:
+        """Append a trace record; returns its "segment:offset" reference"""
+        payload = self._encode(record)
+        entry = {
+            "run_id": record.get("run_id"),
+            "ts": record.get("timestamp") or datetime.now().isoformat(),
+            "length": len(payload),
+        }
+
+        with self._lock:
+            if self._segment in self._failed_segments or (
+                self._offset and self._offset + len(payload) > self.segment_bytes
+            ):
+                number = segment_number(self._segment)
+                self._segment, self._offset = self._segment_name(number + 1), 0
+
+            entry["segment"], entry["offset"] = self._segment, self._offset
+            self._offset += len(payload)
+            self._remember(entry)
+
+            # Enqueue under the lock so writes happen in offset order
+            if self._queue is not None:
+                self._queue.put((entry, payload))
+            else:
+                self._write_or_drop(entry, payload)
+
+        return f"{entry['segment']}:{entry['offset']}"
+
+    def emit(self, record: Dict[str, Any]) -> Optional[str]:
+        return self.append(record)
+
+    def _write(self, entry: Dict[str, Any], payload: bytes) -> None:
+        segment = entry["segment"]
+        handle = self._handles.get(segment)
+        if handle is None:
+            for old in self._handles.values():
+                old.close()
+            self._handles = {segment: open(os.path.join(self.root, segment), "ab")}
+            handle = self._handles[segment]
+        handle.write(payload)
+        handle.flush()
+
+        if self._index_handle is None:
+            self._index_handle = open(os.path.join(self.root, f"{INDEX_PREFIX}{self._writer}.jsonl"), "ab")
+        self._index_handle.write(dumps(entry) + b"\n")
+        self._index_handle.flush()
+
+    def _write_or_drop(self, entry: Dict[str, Any], payload: bytes) -> None:
+        segment = entry["segment"]
+        if segment not in self._failed_segments:
+            try:
+                self._write(entry, payload)
+                return
+            except Exception:
+                logger.exception(f"Failed to write trace to {segment}; continuing in a new segment")
+                handle = self._handles.pop(segment, None)
+                if handle is not None:
+                    try:
+                        handle.close()
+                    except OSError:
+                        pass
+        with self._lock:
+            self._failed_segments.add(segment)
+            self.dropped += 1
+            if self._index.get(entry.get("run_id")) is entry:
+                del self._index[entry["run_id"]]
+            self._lengths.pop((segment, entry["offset"]), None)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._write_or_drop(*item)
+            finally:
+                self._queue.task_done()
+
+    def flush(self) -> None:
+        if self._queue is not None:
+            self._queue.join()
+
+    def close(self) -> None:
+        if self._queue is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        for handle in self._handles.values():
+            handle.close()
+        self._handles = {}
+        if self._index_handle is not None:
+            self._index_handle.close()
+            self._index_handle = None
+
+    # ------------------------------------------------------------------- index
+
+    def _remember(self, entry: Dict[str, Any]) -> None:
+        if entry.get("run_id") is not None:
+            self._index[entry["run_id"]] = entry
+        self._lengths[(entry["segment"], entry["offset"])] = entry["length"]
+
+    def _load_index(self) -> None:
+        """Entries of every writer's index; the latest entry of a run_id wins"""
+        entries = []
+        for name in sorted(os.listdir(self.root)):
+            if not is_index_file(name):
+                continue
+            with open(os.path.join(self.root, name), "rb") as f:
+                for line in f:
+                    if line.strip():
+                        try:
+                            entries.append(_loads(line))
+                        except ValueError:
+                            logger.warning(f"Skipping unreadable index entry in {name}")
+        for entry in sorted(entries, key=lambda e: e["ts"]):
+            self._remember(entry)
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Index entries (latest per run_id), oldest first"""
+        with self._lock:
+            return sorted(self._index.values(), key=lambda e: e["ts"])
+
+    # -------------------------------------------------------------------- read
+
+    def read(self, ref: str) -> Dict[str, Any]:
+        """
+        Read the record at a "segment:offset" reference
+
+        Records appended by this instance may still be queued; call flush()
+        first when reading back your own writes.
+        """
+        segment, offset = parse_ref(ref)
+        length = self._lengths.get((segment, offset))
+        with open(os.path.join(self.root, segment), "rb") as f:
+            f.seek(offset)
+            if segment.endswith(".zst"):
+                if length is None:
+                    raise KeyError(f"No index entry for compressed record {ref}")
+                data = zstandard.ZstdDecompressor().decompress(f.read(length))
+            else:
+                data = f.read(length) if length is not None else f.readline()
+        return _loads(data)
+
+    def get(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """Fetch the latest record for a run_id, or None"""
+        entry = self._index.get(run_id)
+        if entry is None:
+            return None
+        return self.read(f"{entry['segment']}:{entry['offset']}")
+
+    def scan(
+        self,
+        start: Optional[Union[str, datetime]] = None,
+        end: Optional[Union[str, datetime]] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """Yield records with start <= timestamp < end, oldest first"""
+        start = start.isoformat() if isinstance(start, datetime) else start
+        end = end.isoformat() if isinstance(end, datetime) else end
+        for entry in self.entries():
+            if start is not None and entry["ts"] < start:
+                continue
+            if end is not None and entry["ts"] >= end:
+                break
+            yield self.read(f"{entry['segment']}:{entry['offset']}")
@@ -0,0 +1,483 @@
+"""
+Low-overhead tracing for the RAG pipeline.
+
+Events are slotted objects timestamped with the monotonic perf_counter_ns
+clock, relative to the start of their recorder. Spans record a single event
+when they close, carrying their duration and their parent span. Finished
+traces are handed to a sink; serialization, disk and network I/O happen on
+the sink's background thread, never on the request path.
+
+Sinks: NullSink, RingBufferSink, BackgroundWriterSink, TraceStore
+(trace_store.py), InMemorySpanExporter and OTLPSpanExporter (OpenTelemetry
+collector over OTLP/HTTP JSON). FanoutSink combines several.
+"""
+
+import atexit
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+from collections import deque
+from datetime import datetime
+from time import perf_counter_ns, time_ns
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import orjson
+except ImportError:  # orjson is pinned in requirements.txt but optional here
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+def dumps(record: Dict[str, Any]) -> bytes:
+    """Compact JSON encoding of a trace record"""
+    if orjson is not None:
+        return orjson.dumps(record, default=str)
+    return json.dumps(record, separators=(",", ":"), default=str).encode("utf-8")
+
+
+class TraceEvent:
+    """Single event in the RAG application trace"""
+
+    __slots__ = (
+        "event_type",
+        "component",
+        "data",
+        "ts_ns",
+        "duration_ns",
+        "span_id",
+        "parent_id",
+    )
+
+    def __init__(
+        self,
+        event_type: str,
+        component: str,
+        data: Dict[str, Any],
+        ts_ns: int = 0,
+        duration_ns: Optional[int] = None,
+        span_id: Optional[int] = None,
+        parent_id: Optional[int] = None,
+    ):
+        self.event_type = event_type
+        self.component = component
+        self.data = data
+        self.ts_ns = ts_ns
+        self.duration_ns = duration_ns
+        self.span_id = span_id
+        self.parent_id = parent_id
+
+    def to_dict(self) -> Dict[str, Any]:
+        event = {
+            "event_type": self.event_type,
+            "component": self.component,
+            "data": self.data,
+            "ts_ns": self.ts_ns,
+        }
+        if self.duration_ns is not None:
+            event["duration_ns"] = self.duration_ns
+            event["span_id"] = self.span_id
+        if self.parent_id is not None:
+            event["parent_id"] = self.parent_id
+        return event
+
+    def __repr__(self) -> str:
+        return f"TraceEvent({self.event_type!r}, {self.component!r}, {self.data!r})"
+
+
+class Span:
+    """
+    Times a block of work and records one event with its duration on exit.
+    Spans opened inside another span's block become its children.
+    """
+
+    __slots__ = (
+        "recorder",
+        "event_type",
+        "component",
+        "data",
+        "start_ns",
+        "span_id",
+        "parent_id",
+    )
+
+    def __init__(self, recorder: "TraceRecorder", event_type: str, component: str, data: Dict[str, Any]):
+        self.recorder = recorder
+        self.event_type = event_type
+        self.component = component
+        self.data = data
+        self.start_ns = 0
+        self.span_id = 0
+        self.parent_id = None
+
+    def set(self, **data: Any) -> None:
+        """Attach attributes that are only known once the work is done"""
+        self.data.update(data)
+
+    def __enter__(self) -> "Span":
+        recorder = self.recorder
+        recorder.last_span_id += 1
+        self.span_id = recorder.last_span_id
+        self.parent_id = recorder.open_spans[-1] if recorder.open_spans else None
+        recorder.open_spans.append(self.span_id)
+        self.start_ns = perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        end_ns = perf_counter_ns()
+        recorder = self.recorder
+        recorder.open_spans.pop()
+        if exc is not None:
+            self.data["error"] = str(exc)
+        recorder.events.append(
+            TraceEvent(
+                self.event_type,
+                self.component,
+                self.data,
+                ts_ns=self.start_ns - recorder.origin_ns,
+                duration_ns=end_ns - self.start_ns,
+                span_id=self.span_id,
+                parent_id=self.parent_id,
+            )
+        )
+        return False
+
+
+class TraceRecorder:
+    """Collects the events of one trace (one query, or one ingestion)"""
+
+    __slots__ = ("events", "origin_ns", "origin_unix_ns", "last_span_id", "open_spans")
+
+    def __init__(self):
+        self.events: List[TraceEvent] = []
+        self.origin_ns = perf_counter_ns()
+        # Wall-clock anchor, so exporters can turn offsets into absolute times
+        self.origin_unix_ns = time_ns()
+        self.last_span_id = 0
+        self.open_spans: List[int] = []
+
+    def event(self, event_type: str, component: str, **data: Any) -> None:
+        """Record an instantaneous event"""
+        self.events.append(
+            TraceEvent(
+                event_type,
+                component,
+                data,
+                ts_ns=perf_counter_ns() - self.origin_ns,
+                parent_id=self.open_spans[-1] if self.open_spans else None,
+            )
+        )
+
+    def span(self, event_type: str, component: str, **data: Any) -> Span:
+        """Record an event covering the duration of a with-block"""
+        return Span(self, event_type, component, data)
+
+    def append(self, event: TraceEvent) -> None:
+        self.events.append(event)
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        return [event.to_dict() for event in self.events]
+
+    def __iter__(self) -> Iterator[TraceEvent]:
+        return iter(self.events)
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+
+class TraceSink:
+    """
+    Destination for finished trace records.
+    Subclasses implement emit(), which must not block on I/O.
+    """
+
+    def emit(self, record: Dict[str, Any]) -> Optional[str]:
+        """Accept a trace record; returns a reference to where it will live"""
+        raise NotImplementedError("Subclasses should implement this method.")
+
+    def flush(self) -> None:
+        """Wait until all emitted records are persisted"""
+
+    def close(self) -> None:
+        self.flush()
+
+
+class NullSink(TraceSink):
+    """Discards traces (benchmarks, production with tracing disabled)"""
+
+    def emit(self, record: Dict[str, Any]) -> Optional[str]:
+        return None
+
+
+class RingBufferSink(TraceSink):
+    """Keeps the most recent traces in memory (tests, live dashboards)"""
+
+    def __init__(self, capacity: int = 1000):
+        self.records: deque = deque(maxlen=capacity)
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def emit(self, record: Dict[str, Any]) -> Optional[str]:
+        with self._lock:
+            self._seq += 1
+            self.records.append(record)
+            return f"memory:{self._seq}"
+
+
+class BackgroundWriterSink(TraceSink):
+    """
+    Writes one compact JSON file per trace from a daemon thread.
+
+    emit() only computes the target path and enqueues the record; if the
+    queue is full the record is dropped (and counted) rather than blocking.
+    """
+
+    def __init__(self, logdir: str = "logs", max_queue: int = 10000):
+        self.logdir = logdir
+        self.dropped = 0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(
+            target=self._run, name="trace-writer", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def emit(self, record: Dict[str, Any]) -> Optional[str]:
+        timestamp = record.get("timestamp") or datetime.now().isoformat()
+        filename = f"rag_run_{record.get('run_id')}_{timestamp.replace(':', '-').replace('.', '-')}.json"
+        path = os.path.join(self.logdir, filename)
+        try:
+            self._queue.put_nowait((path, record))
+        except queue.Full:
+            self.dropped += 1
+            return None
+        return path
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                path, record = item
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                with open(path, "wb") as f:
+                    f.write(dumps(record))
+            except Exception:
+                logger.exception("Failed to write trace")
+            finally:
+                self._queue.task_done()
+
+    def flush(self) -> None:
+        self._queue.join()
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+
+class FanoutSink(TraceSink):
+    """Sends every record to several sinks; returns the first sink's reference"""
+
+    def __init__(self, *sinks: TraceSink):
+        self.sinks = sinks
+
+    def emit(self, record: Dict[str, Any]) -> Optional[str]:
+        refs = [sink.emit(record) for sink in self.sinks]
+        return next((ref for ref in refs if ref is not None), None)
+
+    def flush(self) -> None:
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self) -> None:
+        for sink in self.sinks:
+            sink.close()
+
+
+def record_spans(record: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Flatten a trace record into finished spans with absolute unix-ns times.
+    Instantaneous events are attached to their enclosing span as span events.
+    """
+    origin = record.get("origin_unix_ns") or 0
+    spans = []
+    events_by_parent: Dict[Optional[int], List[Dict[str, Any]]] = {}
+    for event in record.get("traces") or []:
+        start = origin + event.get("ts_ns", 0)
+        if event.get("duration_ns") is None:
+            events_by_parent.setdefault(event.get("parent_id"), []).append(
+                {"name": event["event_type"], "time_unix_ns": start, "attributes": event["data"]}
+            )
+            continue
+        spans.append(
+            {
+                "trace_id": record.get("run_id"),
+                "span_id": event.get("span_id"),
+                "parent_id": event.get("parent_id"),
+                "name": f"{event['component']}.{event['data'].get('operation') or event['event_type']}",
+                "start_unix_ns": start,
+                "end_unix_ns": start + event["duration_ns"],
+                "duration_ns": event["duration_ns"],
+                "attributes": event["data"],
+                "events": [],
+            }
+        )
+
+    by_id = {span["span_id"]: span for span in spans}
+    for parent_id, events in events_by_parent.items():
+        owner = by_id.get(parent_id)
+        if owner is None and spans:
+            # Top-level events belong to the root span (the last one to close)
+            owner = next((s for s in reversed(spans) if s["parent_id"] is None), spans[-1])
+        if owner is not None:
+            owner["events"].extend(events)
+    return spans
+
+
+class InMemorySpanExporter(TraceSink):
+    """Collects finished spans in memory (tests and notebooks)"""
+
+    def __init__(self):
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def emit(self, record: Dict[str, Any]) -> Optional[str]:
+        spans = record_spans(record)
+        with self._lock:
+            self.spans.extend(spans)
+        return None
+
+    def get_finished_spans(self, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [s for s in self.spans if name is None or s["name"] == name]
+
+    def clear(self) -> None:
+        with self._lock:
+            self.spans = []
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, str):
+        return {"stringValue": value}
+    return {"stringValue": json.dumps(value, default=str)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [
+        {"key": key, "value": _otlp_value(value)}
+        for key, value in attributes.items()
+        if value is not None
+    ]
+
+
+def _otlp_id(value: Any, nbytes: int) -> str:
+    return hashlib.blake2b(str(value).encode("utf-8"), digest_size=nbytes).hexdigest()
+
+
+def to_otlp_json(record: Dict[str, Any], service_name: str = "rag-eval") -> Dict[str, Any]:
+    """Convert a trace record to an OTLP/JSON ExportTraceServiceRequest"""
+    run_id = record.get("run_id")
+    trace_id = _otlp_id(run_id, 16)
+    spans = []
+    for span in record_spans(record):
+        otlp_span = {
+            "traceId": trace_id,
+            "spanId": _otlp_id(f"{run_id}/{span['span_id']}", 8),
+            "name": span["name"],
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(span["start_unix_ns"]),
+            "endTimeUnixNano": str(span["end_unix_ns"]),
+            "attributes": _otlp_attributes({"run_id": run_id, **span["attributes"]}),
+            "events": [
+                {
+                    "name": event["name"],
+                    "timeUnixNano": str(event["time_unix_ns"]),
+                    "attributes": _otlp_attributes(event["attributes"]),
+                }
+                for event in span["events"]
+            ],
+            "status": {"code": 2 if "error" in span["attributes"] else 1},
+        }
+        if span["parent_id"] is not None:
+            otlp_span["parentSpanId"] = _otlp_id(f"{run_id}/{span['parent_id']}", 8)
+        spans.append(otlp_span)
+
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": _otlp_attributes({"service.name": service_name})},
+                "scopeSpans": [{"scope": {"name": "rag_eval.tracing"}, "spans": spans}],
+            }
+        ]
+    }
+
+
+class OTLPSpanExporter(TraceSink):
+    """
+    Exports spans to an OpenTelemetry collector over OTLP/HTTP (JSON encoding)
+    from a daemon thread. Failed exports are logged and dropped.
+    """
+
+    def __init__(
+        self,
+        endpoint: str = "http://localhost:4318/v1/traces",
+        service_name: str = "rag-eval",
+        timeout: float = 5.0,
+        max_queue: int = 10000,
+    ):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout = timeout
+        self.dropped = 0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="otlp-exporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def emit(self, record: Dict[str, Any]) -> Optional[str]:
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+        return None
+
+    def _post(self, record: Dict[str, Any]) -> None:
+        import urllib.request  # only exporters need it; keeps `import tracing` light
+
+        body = json.dumps(to_otlp_json(record, self.service_name), default=str).encode("utf-8")
+        request = urllib.request.Request(
+            self.endpoint, data=body, headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+    def _run(self) -> None:
+        while True:
+            record = self._queue.get()
+            try:
+                if record is None:
+                    return
+                self._post(record)
+            except Exception as e:
+                logger.warning(f"OTLP export to {self.endpoint} failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self) -> None:
+        self._queue.join()
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
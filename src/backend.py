@@ -1,124 +1,163 @@
 from dotenv import load_dotenv
+import hashlib
 import os
-import re
-from openai import OpenAI 
+import sys
+import uuid
+from datetime import datetime
+from pathlib import Path
 
 import streamlit as st
 
+from dedup import dedup_documents
+from entity_resolution import DEFAULT_ALIAS_DB, EntityResolver
+from relationship_vocab import group_by_type, relationship_query
 from graph_parse import openai_llm_parser
 from test_resume import chunk_resume_text, extract_graph_from_resume, relationships_to_cypher
 
+# Shared tracing from rag_eval, so ingestion spans land next to query traces
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "rag_eval"))
+from cost_ledger import BudgetExceeded, cost_scope, get_ledger
+from llm_gateway import get_gateway
+from tracing import TraceRecorder
+from trace_store import open_store
+
 # Load environment variables
 load_dotenv()
 
 openai_key = os.getenv("OPENAI_API_KEY")
 
-# Neo4j
-from neo4j import GraphDatabase
+# Clients are created on first use and cached as Streamlit resources (one per
+# server process, shared across reruns and sessions), so importing this module
+# neither connects to Neo4j/Qdrant nor imports their drivers
 
+# Neo4j
 neo4j_uri = os.getenv("NEO4J_URI")
 neo4j_user = os.getenv("NEO4J_USER")
 neo4j_password = os.getenv("NEO4J_PASSWORD")
 
+# Rows per UNWIND write
+NEO4J_BATCH_SIZE = 1000
+
 #initialize neo4j database
-driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
+@st.cache_resource(show_spinner=False)
+def get_neo4j_driver():
+    from neo4j import GraphDatabase
+
+    return GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
 
 def test_neo4j():
-    with driver.session() as session:
+    with get_neo4j_driver().session() as session:
         result = session.run("RETURN 'Hello Neo4j!' AS message")
         for record in result:
             print(record["message"])
 
-def safe_relationship_type(r: str) -> str:
+def embed_entity_names(names):
+    response = get_openai_client().embeddings.create(model="text-embedding-3-small", input=names)
+    return [item.embedding for item in response.data]
+
+# Alias table shared by all ingestions of this server process; set
+# ENTITY_RESOLUTION_EMBEDDINGS to also compare borderline names by embedding
+@st.cache_resource(show_spinner=False)
+def get_entity_resolver():
+    return EntityResolver(
+        os.getenv("ENTITY_ALIAS_DB", DEFAULT_ALIAS_DB),
+        embed_fn=embed_entity_names if os.getenv("ENTITY_RESOLUTION_EMBEDDINGS") else None,
+    )
+
+def load_relationships_to_neo4j(rels, resolver=None):
     """
-    Convert any string to a valid Neo4j relationship type:
-    - Only letters, numbers, and underscores
-    - Must start with a letter (prepend 'R_' if it starts with a number)
-    - Collapse multiple underscores
-    - Uppercase
+    MERGE relationships on canonical entity names; the spellings the LLM used
+    are collected in each node's aliases list. Relations are mapped onto the
+    bounded vocabulary in relationship_vocab and written with one UNWIND
+    query per type and batch, so the server only ever plans a fixed set of
+    query texts.
     """
-    r = re.sub(r"[^a-zA-Z0-9]", "_", r)  # replace invalid chars
-    r = re.sub(r"_+", "_", r)            # collapse multiple underscores
-
-    # prepend 'R_' if starts with number
-    if re.match(r"^\d", r):
-        r = f"R_{r}"
-
-    return r.upper()
-
-def load_relationships_to_neo4j(rels):
-    with driver.session() as session:
-        for rel in rels:
-            r_type = safe_relationship_type(rel['relationship'])
-            
-            query = f"""
-            MERGE (a:Entity {{name: $node_a}})
-            MERGE (b:Entity {{name: $node_b}})
-            MERGE (a)-[r:{r_type}]->(b)
-            SET r.chunk_id = $chunk_id, r.file_id = $file_id, r.section = $section
-            """
-            
-            session.run(query, {
-                "node_a": rel["node"],
-                "node_b": rel["target_node"],
-                "chunk_id": rel["chunk_id"],
-                "file_id": rel["file_id"],
-                "section": rel["section"]
-            })
+    rels = (resolver or get_entity_resolver()).resolve_relationships(rels)
+    with get_neo4j_driver().session() as session:
+        for rel_type, rows in group_by_type(rels).items():
+            query = relationship_query(rel_type)
+            for start in range(0, len(rows), NEO4J_BATCH_SIZE):
+                session.run(query, {"rows": rows[start:start + NEO4J_BATCH_SIZE]})
+    return rels
 
 # Qdrant
-from qdrant_client import QdrantClient
-from qdrant_client.http import models
-import uuid
+@st.cache_resource(show_spinner=False)
+def get_qdrant():
+    from qdrant_client import QdrantClient
 
+    return QdrantClient(host="localhost", port=6333)
 
-qdrant = QdrantClient(host="localhost", port=6333)
-client = OpenAI(api_key=openai_key)
+@st.cache_resource(show_spinner=False)
+def get_openai_client():
+    return get_gateway().client_for("embedding", "openai")
 
 COLLECTION_NAME = "resume_chunks"
 
 def create_qdrant_collection():
-    qdrant.recreate_collection(
+    from qdrant_client.http import models
+
+    get_qdrant().recreate_collection(
         collection_name=COLLECTION_NAME,
         vectors_config=models.VectorParams(size=1536, distance=models.Distance.COSINE)
     )
 
-def embed_text(text: str):
-    emb = client.embeddings.create(
+def embed_text(text: str, span=None):
+    """
+    Embed text; when a tracing span is given, its embedding_tokens attribute
+    accumulates the tokens billed for the call
+    """
+    emb = get_openai_client().embeddings.create(
         model="text-embedding-3-small",  # cheaper model, 1536 dims
         input=text
     )
+    if span is not None and emb.usage is not None:
+        span.set(embedding_tokens=span.data.get("embedding_tokens", 0) + emb.usage.total_tokens)
     return emb.data[0].embedding
 
-def send_chunks_to_qdrant(chunks, file_id):
+def send_chunks_to_qdrant(chunks, file_id, traces=None):
     """
     Each chunk gets embedded and inserted into Qdrant
     """
+    from qdrant_client.http import models
+
+    if traces is None:
+        traces = TraceRecorder()
+
     points = []
-    for chunk in chunks:
-        vector = embed_text(chunk["text"])
-        points.append(models.PointStruct(
-            id=str(uuid.uuid4()),  
-            vector=vector,
-            payload={
-                "file_id": file_id,
-                "chunk_id": chunk["id"],
-                "section": chunk["section"],
-                "text": chunk["text"]
-            }
-        ))
-
-    qdrant.upsert(collection_name=COLLECTION_NAME, points=points)
+    with traces.span(
+        "embedding",
+        "openai_api",
+        operation="embed_chunks",
+        model="text-embedding-3-small",
+        num_chunks=len(chunks),
+        input_chars=sum(len(chunk["text"]) for chunk in chunks),
+    ) as span:
+        for chunk in chunks:
+            vector = embed_text(chunk["text"], span)
+            points.append(models.PointStruct(
+                id=str(uuid.uuid4()),  
+                vector=vector,
+                payload={
+                    "file_id": file_id,
+                    "chunk_id": chunk["id"],
+                    "section": chunk["section"],
+                    "text": chunk["text"]
+                }
+            ))
+
+    with traces.span("vector_upsert", "qdrant", operation="upsert", num_points=len(points)):
+        get_qdrant().upsert(collection_name=COLLECTION_NAME, points=points)
 
 def test_qdrant():
     # Check if Qdrant is alive
-    info = qdrant.get_collections()
+    info = get_qdrant().get_collections()
     print("Qdrant collections:", info)
 
 # LangChain placeholder
-from langchain.schema import HumanMessage, SystemMessage
-
 def test_langchain():
+    from langchain.schema import HumanMessage, SystemMessage
+
     messages = [
         SystemMessage(content="You are a helpful assistant."),
         HumanMessage(content="Hello LangChain!")
@@ -129,7 +168,33 @@ def test_langchain():
 # from langchain_community.document_loaders import PyPDFLoader
 # from PyPDF2 import PdfReader
 
-from PyPDF2 import PdfReader
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+@st.cache_data(show_spinner=False)
+def extract_document_text(file_hash: str, _file_path: str) -> str:
+    """
+    Text of one .txt/.pdf file, cached on its content hash so unchanged files
+    are not re-read or re-parsed on reruns
+    """
+    # Handle .txt files
+    if _file_path.lower().endswith(".txt"):
+        with open(_file_path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    # Handle .pdf files
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(_file_path)
+    text = ""
+    for page in reader.pages:
+        text += page.extract_text() or ""  # Extract each page safely
+    return text
+
 #also need function to load documents from stored file path
 def load_documents(folder_path="documents"):
     docs = []
@@ -137,35 +202,81 @@ def load_documents(folder_path="documents"):
     for filename in os.listdir(folder_path):
         file_path = os.path.join(folder_path, filename)
 
-        # Handle .txt files
-        if filename.lower().endswith(".txt"):
-            with open(file_path, "r", encoding="utf-8") as f:
-                text = f.read()
-                docs.append({"filename": filename, "text": text})
-
-        # Handle .pdf files
-        elif filename.lower().endswith(".pdf"):
-            reader = PdfReader(file_path)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() or ""  # Extract each page safely
+        if filename.lower().endswith((".txt", ".pdf")):
+            text = extract_document_text(file_sha256(file_path), file_path)
             docs.append({"filename": filename, "text": text})
 
     return docs
 
-def process_and_store_resume(resume_text: str, file_id: str):
-    # Step 1: extract graph relationships
-    rels = extract_graph_from_resume(resume_text, file_id)
+@st.cache_resource(show_spinner=False)
+def get_ingest_trace_sink():
+    return open_store(os.getenv("RAG_LOGDIR", "logs"))
 
-    # Step 2: load relationships into Neo4j
-    load_relationships_to_neo4j(rels)
+# Module attributes kept for existing callers, built on first access
+_LAZY_ATTRIBUTES = {
+    "driver": get_neo4j_driver,
+    "qdrant": get_qdrant,
+    "client": get_openai_client,
+    "ingest_trace_sink": get_ingest_trace_sink,
+}
 
-    # Step 3: chunk resume for Qdrant storage
-    chunks = chunk_resume_text(resume_text, file_id)
-    create_qdrant_collection()
-    send_chunks_to_qdrant(chunks, file_id)
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-    return {"relationships": rels, "chunks": chunks}
+def process_and_store_resume(resume_text: str, file_id: str):
+    traces = TraceRecorder()
+
+    # cost tallies the LLM and embedding calls of this document (the caller's
+    # cost_scope names the run and document and holds any budget)
+    with cost_scope() as cost, traces.span(
+        "ingestion",
+        "backend",
+        operation="process_and_store_resume",
+        file_id=file_id,
+        input_chars=len(resume_text),
+    ) as ingestion_span:
+        # Step 1: extract graph relationships
+        with traces.span("graph_extraction", "openai_api", operation="extract_graph") as span:
+            rels = extract_graph_from_resume(
+                resume_text, file_id, mode=os.getenv("GRAPH_EXTRACTION_MODE", "packed")
+            )
+            span.set(num_relationships=len(rels))
+
+        # Step 2: load relationships into Neo4j
+        with traces.span(
+            "graph_load", "neo4j", operation="load_relationships", num_relationships=len(rels)
+        ) as span:
+            rels = load_relationships_to_neo4j(rels)
+            span.set(num_resolved_relationships=len(rels), **get_entity_resolver().stats())
+
+        # Step 3: chunk resume for Qdrant storage
+        with traces.span("chunking", "backend", operation="chunk_resume_text") as span:
+            chunks = chunk_resume_text(resume_text, file_id)
+            span.set(num_chunks=len(chunks), chunk_chars=sum(len(c["text"]) for c in chunks))
+
+        with traces.span("vector_store", "qdrant", operation="recreate_collection"):
+            create_qdrant_collection()
+        send_chunks_to_qdrant(chunks, file_id, traces)
+        ingestion_span.set(tokens=cost.tokens, cost_usd=round(cost.cost_usd, 6))
+
+    timestamp = datetime.now().isoformat()
+    trace_ref = get_ingest_trace_sink().emit({
+        "run_id": f"ingest_{file_id}_{timestamp}",
+        "timestamp": timestamp,
+        "origin_unix_ns": traces.origin_unix_ns,
+        "query": None,
+        "result": {
+            "file_id": file_id,
+            "num_relationships": len(rels),
+            "num_chunks": len(chunks),
+            "cost": cost.to_dict(),
+        },
+        "traces": traces.to_dicts(),
+    })
+
+    return {"relationships": rels, "chunks": chunks, "trace": trace_ref, "cost": cost.to_dict()}
 
 
 def main():
@@ -181,11 +292,15 @@ def main():
 
         if uploaded_file is not None:
             file_path = os.path.join("documents", uploaded_file.name)
-            with open(file_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
+            data = uploaded_file.getbuffer()
+            # The uploader hands the same file back on every rerun; only write
+            # it when its content changed
+            if not os.path.exists(file_path) or file_sha256(file_path) != hashlib.sha256(data).hexdigest():
+                with open(file_path, "wb") as f:
+                    f.write(data)
+
+            docs = load_documents("documents")
 
-                docs = load_documents("documents")
-                
             st.success(f"Saved {uploaded_file.name}!")
             st.write(docs)
 
@@ -199,21 +314,41 @@ def main():
             #     system_prompt=prompt
             # )
 
-                for doc in docs: 
-                    st.write(f"Processing: {doc['filename']}")
-
-                    result = process_and_store_resume(doc['text'], file_id='1')
-
-                    print("Extracted Relationships:")
-                    for r in result["relationships"]:
-                        print(r)
-
-                    print("\nStored Chunks in Qdrant:")
-                    for c in result["chunks"]:
-                        print(c)
-        
-                    # cypher = relationships_to_cypher(rels)
-                    # st.write("\n".join(cypher))
+                # Skip near-duplicate documents before paying to extract and embed them
+                docs, dedup_report = dedup_documents(docs)
+                if dedup_report.duplicates:
+                    st.info(dedup_report.summary())
+                    for dup in dedup_report.duplicates:
+                        st.write(f"Skipped {dup.key}: near-duplicate of {dup.duplicate_of}")
+
+                run = f"ingest_{datetime.now():%Y%m%d_%H%M%S_%f}"
+                with cost_scope(run=run):
+                    for doc in docs:
+                        st.write(f"Processing: {doc['filename']}")
+
+                        try:
+                            with cost_scope(document=doc['filename']):
+                                result = process_and_store_resume(doc['text'], file_id='1')
+                        except BudgetExceeded as e:
+                            st.error(f"Ingestion stopped by the token budget: {e}")
+                            break
+                        st.write(
+                            f"{result['cost']['tokens']:,} tokens, ${result['cost']['cost_usd']:.4f}"
+                        )
+
+                        print("Extracted Relationships:")
+                        for r in result["relationships"]:
+                            print(r)
+
+                        print("\nStored Chunks in Qdrant:")
+                        for c in result["chunks"]:
+                            print(c)
+
+                        # cypher = relationships_to_cypher(rels)
+                        # st.write("\n".join(cypher))
+
+                total = get_ledger().summary(run)["total"]
+                st.info(f"Ingestion used {total['tokens']:,} tokens (${total['cost_usd']:.4f})")
 
 
 
@@ -101,9 +101,12 @@ class SharePointCrawler:
             max_items: Maximum number of items to return
             
         Returns:
-            List of document metadata dictionaries
+            List of document metadata dictionaries. Files whose content hash
+            matches an earlier file get status "duplicate" and duplicate_of
+            (the earlier file's id), so they can be skipped before ingestion.
         """
         results = []
+        seen_hashes: Dict[str, str] = {}
         next_link = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives/{library_id}/items"
         
         while next_link and len(results) < max_items:
@@ -133,9 +136,20 @@ class SharePointCrawler:
                                       .get("user", {})
                                       .get("displayName")),
                         "file_type": item.get("file", {}).get("mimeType"),
+                        "content_hash": (item.get("file", {})
+                                         .get("hashes", {})
+                                         .get("quickXorHash")),
                         "status": "ok",
                         "type": "sharepoint"
                     }
+
+                    # Same bytes under another name/folder (copies, re-uploads)
+                    content_hash = doc_info["content_hash"]
+                    if content_hash and content_hash in seen_hashes:
+                        doc_info["status"] = "duplicate"
+                        doc_info["duplicate_of"] = seen_hashes[content_hash]
+                    elif content_hash:
+                        seen_hashes[content_hash] = doc_info["id"]
                     
                     results.append(doc_info)
                     
@@ -8,6 +8,8 @@ import requests
 from bs4 import BeautifulSoup
 import logging
 
+from dedup import NearDuplicateDetector
+
 logger = logging.getLogger(__name__)
 
 def _same_domain(a: str, b: str) -> bool:
@@ -59,11 +61,21 @@ def extract_wiki_info(html: str, url: str) -> Dict:
         "type": "wiki"
     }
 
+# Page chrome that repeats across a wiki and would hide near-duplicate bodies
+CHROME_TAGS = ["script", "style", "nav", "header", "footer", "aside", "noscript"]
+
+def main_text(soup: BeautifulSoup) -> str:
+    """Visible page text without navigation chrome (removes those tags from soup)."""
+    for tag in soup.find_all(CHROME_TAGS):
+        tag.decompose()
+    return soup.get_text(" ", strip=True)
+
 def crawl_wiki(root_url: str,
                session: Optional[requests.Session] = None,
                max_depth: int = 1,
                max_pages: int = 200,
-               timeout: int = 10) -> List[Dict]:
+               timeout: int = 10,
+               dedup: Optional[NearDuplicateDetector] = None) -> List[Dict]:
     """Crawl wiki pages starting from root_url.
     
     Args:
@@ -72,6 +84,9 @@ def crawl_wiki(root_url: str,
         max_depth: How many levels deep to crawl
         max_pages: Maximum number of pages to crawl
         timeout: Timeout for each request in seconds
+        dedup: Optional near-duplicate detector; pages whose main text
+            duplicates an earlier page get status "duplicate" and a
+            duplicate_of URL (their links are still followed)
     
     Returns:
         List of dictionaries containing page information
@@ -118,10 +133,10 @@ def crawl_wiki(root_url: str,
             info = extract_wiki_info(resp.text, url)
             info["status"] = "ok"
             results.append(info)
+            soup = BeautifulSoup(resp.text, "html.parser")
 
             # Find links to crawl if we haven't hit depth limit
             if depth < max_depth:
-                soup = BeautifulSoup(resp.text, "html.parser")
                 for a in soup.find_all("a", href=True):
                     href = a["href"]
                     child = urljoin(url, href)
@@ -133,6 +148,13 @@ def crawl_wiki(root_url: str,
                         child not in seen):
                         to_visit.append((child, depth + 1))
 
+            if dedup is not None:
+                match = dedup.check(url, main_text(soup))
+                if match is not None:
+                    info["status"] = "duplicate"
+                    info["duplicate_of"], info["similarity"] = match
+                    logger.info(f"{url} duplicates {match[0]} (similarity {match[1]:.2f})")
+
         except Exception as e:
             logger.exception(f"Error crawling {url}")
             results.append({
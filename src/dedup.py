@@ -0,0 +1,264 @@
+"""
+Near-duplicate detection for crawled and uploaded documents.
+
+Every document is reduced to the set of its word shingles (k consecutive
+normalized words) and summarized by a MinHash signature of num_perm values;
+the fraction of equal signature values estimates the Jaccard similarity of
+two shingle sets. Signatures are split into bands and an LSH index buckets
+documents by band, so a new document is only compared with the documents
+that share at least one band instead of with everything seen so far.
+
+Pages that differ only in navigation chrome, wiki copies ("Page+Copy") and
+re-uploads of the same file end up above the threshold and are skipped
+before they are embedded, graph-extracted and retrieved; DedupReport counts
+the tokens (and estimated spend) that skipping saved.
+"""
+
+import hashlib
+import re
+import sys
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# rag_eval modules are imported by their bare names, as they import each
+# other, so the process holds one instance of each (one gateway, one ledger)
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "rag_eval"))
+from context_budget import count_tokens
+
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_NUM_PERM = 128
+DEFAULT_BANDS = 32
+DEFAULT_SHINGLE_SIZE = 5
+# Shingles permuted at once: a block's (block x num_perm) uint64 matrix is ~4 MB
+SIGNATURE_BLOCK = 4096
+
+# USD per 1M input tokens, for the avoided-spend estimate
+EMBEDDING_PRICE_PER_1M = 0.02  # text-embedding-3-small
+EXTRACTION_PRICE_PER_1M = 2.50  # gpt-4o graph extraction
+
+_WORD = re.compile(r"\w+")
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def shingles(text: str, size: int = DEFAULT_SHINGLE_SIZE) -> np.ndarray:
+    """
+    Distinct 32-bit hashes of the text's word shingles (lowercased \\w+ words);
+    a text shorter than size words is a single shingle
+    """
+    words = [w.lower() for w in _WORD.findall(text)]
+    if not words:
+        return np.zeros(0, dtype=np.uint64)
+    grams = {" ".join(words[i : i + size]) for i in range(max(1, len(words) - size + 1))}
+    return np.fromiter(
+        (zlib.crc32(gram.encode("utf-8")) for gram in grams), dtype=np.uint64, count=len(grams)
+    )
+
+
+class MinHasher:
+    """MinHash signatures from num_perm universal hash functions (a * x + b) mod p"""
+
+    def __init__(self, num_perm: int = DEFAULT_NUM_PERM, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self._a = rng.integers(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def signature(self, hashes: np.ndarray) -> np.ndarray:
+        """uint64 [num_perm] minimum permuted hash per function (all max for an empty set)"""
+        signature = np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        # Blocks keep memory flat for documents with millions of shingles
+        for start in range(0, len(hashes), SIGNATURE_BLOCK):
+            block = hashes[start : start + SIGNATURE_BLOCK, None]
+            # uint64 products wrap; the mod and mask still give well-mixed 32-bit values
+            permuted = (block * self._a + self._b) % _MERSENNE_PRIME & _MAX_HASH
+            np.minimum(signature, permuted.min(axis=0), out=signature)
+        return signature
+
+
+def estimate_similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.mean(a == b))
+
+
+class LSHIndex:
+    """Buckets signatures by band so candidate pairs are found without a full scan"""
+
+    def __init__(self, num_perm: int = DEFAULT_NUM_PERM, bands: int = DEFAULT_BANDS):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._buckets: List[Dict[bytes, List[str]]] = [{} for _ in range(bands)]
+        self.signatures: Dict[str, np.ndarray] = {}
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows : (i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def candidates(self, signature: np.ndarray) -> List[str]:
+        """Keys sharing at least one band with signature, in insertion order"""
+        found: Dict[str, None] = {}
+        for band, key in zip(self._buckets, self._band_keys(signature)):
+            for doc_key in band.get(key, ()):
+                found[doc_key] = None
+        return list(found)
+
+    def add(self, key: str, signature: np.ndarray) -> None:
+        self.signatures[key] = signature
+        for band, band_key in zip(self._buckets, self._band_keys(signature)):
+            band.setdefault(band_key, []).append(key)
+
+    def __len__(self) -> int:
+        return len(self.signatures)
+
+
+@dataclass
+class Duplicate:
+    key: str
+    duplicate_of: str
+    similarity: float
+    tokens: int
+
+
+@dataclass
+class DedupReport:
+    """What a dedup pass kept and skipped, and the input tokens that saved"""
+
+    documents: int = 0
+    kept: int = 0
+    duplicates: List[Duplicate] = field(default_factory=list)
+    kept_tokens: int = 0
+
+    @property
+    def skipped_tokens(self) -> int:
+        return sum(d.tokens for d in self.duplicates)
+
+    def avoided_spend(
+        self,
+        embedding_price_per_1m: float = EMBEDDING_PRICE_PER_1M,
+        extraction_price_per_1m: float = EXTRACTION_PRICE_PER_1M,
+    ) -> Dict[str, float]:
+        """Estimated USD not spent on embedding and graph extraction of the skipped documents"""
+        tokens = self.skipped_tokens
+        return {
+            "embedding_usd": round(tokens * embedding_price_per_1m / 1e6, 6),
+            "extraction_usd": round(tokens * extraction_price_per_1m / 1e6, 6),
+        }
+
+    def to_dict(self) -> Dict:
+        return {
+            "documents": self.documents,
+            "kept": self.kept,
+            "duplicates": len(self.duplicates),
+            "kept_tokens": self.kept_tokens,
+            "skipped_tokens": self.skipped_tokens,
+            **self.avoided_spend(),
+            "pairs": [
+                {"key": d.key, "duplicate_of": d.duplicate_of, "similarity": round(d.similarity, 3)}
+                for d in self.duplicates
+            ],
+        }
+
+    def summary(self) -> str:
+        spend = self.avoided_spend()
+        return (
+            f"{len(self.duplicates)} of {self.documents} documents were near-duplicates; "
+            f"skipped {self.skipped_tokens} tokens "
+            f"(~${spend['embedding_usd']:.4f} embedding, ~${spend['extraction_usd']:.4f} extraction)"
+        )
+
+
+class NearDuplicateDetector:
+    """
+    Streaming near-duplicate filter: check() each document once, in arrival
+    order; the first of a group of near-duplicates is kept.
+    """
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_THRESHOLD,
+        num_perm: int = DEFAULT_NUM_PERM,
+        bands: int = DEFAULT_BANDS,
+        shingle_size: int = DEFAULT_SHINGLE_SIZE,
+        seed: int = 1,
+    ):
+        """
+        Args:
+            threshold: Estimated Jaccard similarity of shingle sets at or above
+                which a document counts as a duplicate
+            num_perm: MinHash signature length (more = more accurate estimates)
+            bands: LSH bands; with r = num_perm / bands rows per band, pairs of
+                similarity s become candidates with probability 1 - (1 - s^r)^bands
+            shingle_size: Words per shingle
+            seed: Seed of the hash functions (signatures are only comparable
+                under the same seed)
+        """
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.hasher = MinHasher(num_perm, seed)
+        self.index = LSHIndex(num_perm, bands)
+        self._exact: Dict[str, str] = {}
+        self.report = DedupReport()
+
+    def check(self, key: str, text: str) -> Optional[Tuple[str, float]]:
+        """
+        Record a document, or report it as a duplicate of one already seen
+
+        Returns:
+            (key of the kept document, estimated similarity), or None if the
+            document is new (it is then added to the index)
+        """
+        self.report.documents += 1
+        tokens = count_tokens(text)
+        digest = hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+        match: Optional[Tuple[str, float]] = None
+        if digest in self._exact:
+            match = (self._exact[digest], 1.0)
+        else:
+            signature = self.hasher.signature(shingles(text, self.shingle_size))
+            for candidate in self.index.candidates(signature):
+                similarity = estimate_similarity(signature, self.index.signatures[candidate])
+                if similarity >= self.threshold and (match is None or similarity > match[1]):
+                    match = (candidate, similarity)
+
+        if match is not None:
+            self.report.duplicates.append(Duplicate(key, match[0], match[1], tokens))
+            return match
+        self._exact[digest] = key
+        self.index.add(key, signature)
+        self.report.kept += 1
+        self.report.kept_tokens += tokens
+        return None
+
+
+def dedup_documents(
+    documents: Sequence[Dict],
+    text_key: str = "text",
+    id_key: str = "filename",
+    detector: Optional[NearDuplicateDetector] = None,
+) -> Tuple[List[Dict], DedupReport]:
+    """
+    Drop near-duplicate documents, keeping the first of each group
+
+    Args:
+        documents: Dicts holding each document's text and identifier
+        text_key: Key of the text
+        id_key: Key of the identifier (falls back to the position)
+        detector: Reuse a detector to dedup against earlier batches too
+
+    Returns:
+        (kept documents in their original order, report)
+    """
+    detector = detector or NearDuplicateDetector()
+    kept = [
+        doc
+        for i, doc in enumerate(documents)
+        if detector.check(str(doc.get(id_key, i)), doc.get(text_key) or "") is None
+    ]
+    return kept, detector.report
+
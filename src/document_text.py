@@ -0,0 +1,29 @@
+"""
+Text extraction for uploaded documents.
+
+Kept free of streamlit so the Q/A upload page and the offline
+retrieval-quality benchmark read a file the same way. pdfplumber and
+python-docx are imported only when a file of that type is read.
+"""
+
+from typing import Tuple
+
+DOCUMENT_SUFFIXES: Tuple[str, ...] = (".txt", ".pdf", ".docx")
+
+
+def extract_text(file_path: str) -> str:
+    """Extract text from TXT, PDF, or DOCX files ("" for anything else)"""
+    if file_path.endswith(".txt"):
+        with open(file_path, "r", encoding="utf-8") as f:
+            return f.read()
+    elif file_path.endswith(".pdf"):
+        import pdfplumber
+
+        with pdfplumber.open(file_path) as pdf:
+            return "\n".join(page.extract_text() or "" for page in pdf.pages)
+    elif file_path.endswith(".docx"):
+        from docx import Document
+
+        doc = Document(file_path)
+        return "\n".join([p.text for p in doc.paragraphs])
+    return ""
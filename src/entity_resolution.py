@@ -0,0 +1,319 @@
+"""
+Entity resolution for extracted graph relationships.
+
+The LLM names the same entity in many ways ("Intel", "Intel Corporation",
+"intel corp."). Before relationships are written to Neo4j every name is
+mapped to one canonical entity:
+
+1. normalize: Unicode-fold, lowercase, strip punctuation (but keep the
+   symbols of names like "C++", "C#" and ".NET"), a leading "the" and legal
+   suffixes (corp, inc, ltd, ...); equal normal forms are the same entity
+2. block: a new normal form is only compared with known entities sharing
+   its first-token prefix, plus, for an all-caps name, multi-word names of
+   that acronym and, for a multi-word name, all-caps names equal to its
+   acronym
+3. match: within a block, token-set Jaccard or edit-similarity at or above
+   the threshold (or an all-caps acronym of a multi-word name, whichever was
+   seen first) merges the name into the existing entity; names with
+   different numbers ("Windows 10" / "Windows 11") or symbols ("C" / "C++" /
+   "C#") never merge
+4. optionally, names in the gray zone below the threshold are compared by
+   the cosine similarity of cached embeddings
+
+Resolved aliases live in a SQLite alias table, so later ingestions map the
+same spelling to the same node without re-matching.
+"""
+
+import difflib
+import re
+import sqlite3
+import threading
+import unicodedata
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+DEFAULT_ALIAS_DB = "entity_aliases.sqlite"
+DEFAULT_THRESHOLD = 0.9
+GRAY_ZONE = 0.6  # string similarity from which embeddings are consulted
+DEFAULT_EMBEDDING_THRESHOLD = 0.92
+BLOCK_PREFIX = 3
+
+LEGAL_SUFFIXES = {
+    "inc", "incorporated", "corp", "corporation", "co", "company", "ltd", "limited",
+    "llc", "plc", "gmbh", "ag", "sa", "bv", "pty", "lp", "llp",
+}
+
+# Punctuation, except + and # ("c++", "c#") and a dot before a word character
+# (".net", "node.js"); a dot ending a token ("corp.") is punctuation
+_NON_WORD = re.compile(r"[^\w\s+#.]|\.(?!\w)")
+_NUMBER = re.compile(r"\d+")
+_SYMBOL = re.compile(r"[+#]+|(?<!\w)\.")
+
+# names -> one vector per name
+EmbedFn = Callable[[List[str]], Sequence[Sequence[float]]]
+
+
+def normalize_name(name: str) -> str:
+    """Comparison form of an entity name ("The Intel Corp." -> "intel")"""
+    text = unicodedata.normalize("NFKD", name)
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold()
+    tokens = [
+        token
+        for token in _NON_WORD.sub(" ", text.replace("&", " and ")).split()
+        if any(c.isalnum() for c in token)
+    ]
+    if len(tokens) > 1 and tokens[0] == "the":
+        tokens = tokens[1:]
+    while len(tokens) > 1 and tokens[-1] in LEGAL_SUFFIXES:
+        tokens = tokens[:-1]
+    return " ".join(tokens)
+
+
+def _acronym(tokens: Sequence[str]) -> str:
+    return "".join(t[0] for t in tokens if t not in ("and", "of", "for", "the"))
+
+
+def _is_acronym(name: str, normalized: str) -> bool:
+    """True if a name written in capitals may abbreviate a multi-word name ("IBM")"""
+    return name.isupper() and len(normalized) >= 3 and " " not in normalized
+
+
+def blocking_keys(normalized: str, acronym: bool = False) -> Set[str]:
+    """
+    Keys a known entity is indexed under: first-token prefix, plus the
+    acronym of a multi-word name, or the name itself if it is an acronym
+    """
+    tokens = normalized.split()
+    if not tokens:
+        return set()
+    keys = {f"p:{tokens[0][:BLOCK_PREFIX]}"}
+    if len(tokens) > 1:
+        keys.add(f"a:{_acronym(tokens)}")
+    elif acronym:
+        keys.add(f"x:{normalized}")
+    return keys
+
+
+def name_similarity(a: str, b: str) -> float:
+    """Similarity of two normalized names in [0, 1]"""
+    if a == b:
+        return 1.0
+    if _NUMBER.findall(a) != _NUMBER.findall(b) or _SYMBOL.findall(a) != _SYMBOL.findall(b):
+        return 0.0
+    tokens_a, tokens_b = set(a.split()), set(b.split())
+    jaccard = len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+    return max(jaccard, difflib.SequenceMatcher(None, a, b).ratio())
+
+
+class EntityResolver:
+    """
+    Maps raw entity names to canonical names, learning aliases as it goes.
+
+    Thread-safe; one instance is meant to be shared by an ingestion process.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_ALIAS_DB,
+        threshold: float = DEFAULT_THRESHOLD,
+        embed_fn: Optional[EmbedFn] = None,
+        embedding_threshold: float = DEFAULT_EMBEDDING_THRESHOLD,
+    ):
+        """
+        Args:
+            path: SQLite alias table (":memory:" for a throwaway resolver)
+            threshold: String similarity at or above which names merge
+            embed_fn: Optional embedding function for gray-zone names;
+                vectors are cached in the same database
+            embedding_threshold: Cosine similarity at or above which
+                gray-zone names merge
+        """
+        self.path = path
+        self.threshold = threshold
+        self.embed_fn = embed_fn
+        self.embedding_threshold = embedding_threshold
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS aliases (alias TEXT PRIMARY KEY, canonical TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entities (normalized TEXT PRIMARY KEY, canonical TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (normalized TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+        # raw name -> canonical name, normalized form -> canonical name
+        self._aliases: Dict[str, str] = dict(self._conn.execute("SELECT alias, canonical FROM aliases"))
+        self._entities: Dict[str, str] = dict(
+            self._conn.execute("SELECT normalized, canonical FROM entities")
+        )
+        self._blocks: Dict[str, List[str]] = {}
+        for normalized in self._entities:
+            self._index(normalized)
+        self._vectors: Dict[str, np.ndarray] = {}
+
+    def _index(self, normalized: str) -> None:
+        acronym = _is_acronym(self._entities[normalized], normalized)
+        for key in blocking_keys(normalized, acronym):
+            self._blocks.setdefault(key, []).append(normalized)
+
+    def _candidates(self, keys: List[str]) -> List[str]:
+        found: Dict[str, None] = {}
+        for key in keys:
+            for candidate in self._blocks.get(key, ()):
+                found[candidate] = None
+        return list(found)
+
+    def _cached_embedding(self, normalized: str) -> Optional[np.ndarray]:
+        """Vector from memory or the embeddings table, None if never embedded"""
+        vector = self._vectors.get(normalized)
+        if vector is None:
+            row = self._conn.execute(
+                "SELECT vector FROM embeddings WHERE normalized = ?", (normalized,)
+            ).fetchone()
+            if row is not None:
+                vector = self._vectors[normalized] = np.frombuffer(row[0], dtype=np.float32)
+        return vector
+
+    def _store_embedding(self, normalized: str, vector: np.ndarray) -> None:
+        self._vectors[normalized] = vector
+        self._conn.execute(
+            "INSERT OR REPLACE INTO embeddings (normalized, vector) VALUES (?, ?)",
+            (normalized, vector.tobytes()),
+        )
+
+    def _embed(self, names: List[str]) -> Dict[str, np.ndarray]:
+        """Normalized vectors from one embed_fn call; runs without the lock held"""
+        vectors = {}
+        for normalized, values in zip(names, self.embed_fn(names)):
+            vector = np.asarray(values, dtype=np.float32)
+            vector /= np.linalg.norm(vector) or 1.0
+            vectors[normalized] = vector
+        return vectors
+
+    def _match(self, normalized: str, name: str) -> Tuple[Optional[str], List[str]]:
+        """
+        Normalized form of the known entity this one belongs to, if any, and
+        the gray-zone names that need embedding before that can be decided
+        """
+        best, best_score = None, 0.0
+        gray: List[Tuple[float, str]] = []
+        keys = [f"p:{normalized[:BLOCK_PREFIX]}"]
+        tokens = normalized.split()
+        # "IBM" may abbreviate a known "International Business Machines", and
+        # "International Business Machines" may expand a known "IBM"
+        acronym = _is_acronym(name, normalized)
+        expansion = _acronym(tokens) if len(tokens) > 1 else None
+        if acronym:
+            keys.append(f"a:{normalized}")
+        if expansion:
+            keys.append(f"x:{expansion}")
+        for candidate in self._candidates(keys):
+            score = name_similarity(normalized, candidate)
+            if acronym and " " in candidate and _acronym(candidate.split()) == normalized:
+                score = 1.0
+            elif candidate == expansion and candidate in self._blocks.get(f"x:{expansion}", ()):
+                score = 1.0
+            if score > best_score:
+                best, best_score = candidate, score
+            if GRAY_ZONE <= score < self.threshold:
+                gray.append((score, candidate))
+        if best_score >= self.threshold:
+            return best, []
+        if self.embed_fn is None or not gray:
+            return None, []
+        vectors = {n: self._cached_embedding(n) for n in [normalized] + [c for _, c in gray]}
+        missing = [n for n, vector in vectors.items() if vector is None]
+        if missing:
+            return None, missing
+        vector = vectors[normalized]
+        cosine, candidate = max((float(vector @ vectors[c]), c) for _, c in gray)
+        return (candidate if cosine >= self.embedding_threshold else None), []
+
+    def resolve(self, name: str) -> str:
+        """Canonical name of the entity a raw name refers to (registering it if new)"""
+        name = name.strip()
+        fetched: Dict[str, np.ndarray] = {}
+        while True:
+            with self._lock:
+                for normalized, vector in fetched.items():
+                    self._store_embedding(normalized, vector)
+                canonical = self._aliases.get(name)
+                if canonical is not None:
+                    return canonical
+
+                normalized = normalize_name(name)
+                if not normalized:
+                    return name
+                canonical = self._entities.get(normalized)
+                missing: List[str] = []
+                if canonical is None:
+                    match, missing = self._match(normalized, name)
+                    if not missing:
+                        # A new entity's first spelling becomes the canonical name
+                        canonical = self._entities[match] if match is not None else name
+                        self._entities[normalized] = canonical
+                        self._index(normalized)
+                if not missing:
+                    self._aliases[name] = canonical
+                    # Committed by flush(), so a batch of names costs one transaction
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO entities (normalized, canonical) VALUES (?, ?)",
+                        (normalized, canonical),
+                    )
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO aliases (alias, canonical) VALUES (?, ?)",
+                        (name, canonical),
+                    )
+                    return canonical
+            # embed_fn is a network call, so it runs outside the lock; the match
+            # is then redone under the lock, as other threads may have registered
+            # this name or new gray-zone candidates meanwhile
+            fetched = self._embed(missing)
+
+    def flush(self) -> None:
+        """Commit the aliases learned since the last flush"""
+        with self._lock:
+            self._conn.commit()
+
+    def resolve_relationships(self, rels: Iterable[Dict]) -> List[Dict]:
+        """
+        Copies of extracted relationships with node/target_node replaced by
+        canonical names; the original spellings are kept as node_alias and
+        target_node_alias. A relationship between two spellings of the same
+        entity ("Intel" -> "Intel Corporation") is dropped.
+        """
+        resolved = []
+        for rel in rels:
+            node, target = self.resolve(rel["node"]), self.resolve(rel["target_node"])
+            if node == target and rel["node"].strip() != rel["target_node"].strip():
+                continue
+            resolved.append({
+                **rel,
+                "node": node,
+                "target_node": target,
+                "node_alias": rel["node"],
+                "target_node_alias": rel["target_node"],
+            })
+        self.flush()
+        return resolved
+
+    def aliases_of(self, canonical: str) -> List[str]:
+        with self._lock:
+            return sorted(alias for alias, c in self._aliases.items() if c == canonical)
+
+    def stats(self) -> Dict[str, int]:
+        """Raw spellings seen vs distinct entities they resolved to"""
+        with self._lock:
+            return {
+                "aliases": len(self._aliases),
+                "entities": len(set(self._aliases.values())),
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
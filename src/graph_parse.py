@@ -1,13 +1,38 @@
-from pydantic import BaseModel
-from openai import OpenAI 
+from pydantic import BaseModel, ValidationError
 from dotenv import load_dotenv
-import os
+import json
+import logging
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# rag_eval modules are imported by their bare names, as they import each
+# other, so the process holds one instance of each (one gateway, one ledger)
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "rag_eval"))
+from context_budget import count_tokens
+from cost_ledger import BudgetExceeded
+from llm_gateway import get_gateway, model_for
 
 load_dotenv()
 
-openai_key = os.getenv("OPENAI_API_KEY")
+logger = logging.getLogger(__name__)
+
+EXTRACTION_MODEL = model_for("extraction", "gpt-4o-2024-08-06")
+# Prompt tokens of chunk text packed into one packed-mode call
+DEFAULT_PACK_TOKENS = 3000
+DEFAULT_MAX_ATTEMPTS = 3
+
+def get_client():
+    """OpenAI client routed through the shared LLM gateway"""
+    return get_gateway().client_for("graph_extraction", "openai")
+
 
-client = OpenAI(api_key=openai_key)
+def __getattr__(name):
+    # Backward compatible module attribute
+    if name == "client":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 #pydantic models 
 #output parser class structure to struture the LLM result into graph components
@@ -19,9 +44,47 @@ class single(BaseModel):
 class GraphComponents(BaseModel):
     graph: list[single]
 
+class ChunkGraph(BaseModel):
+    chunk_id: str
+    graph: list[single]
+
+class PackedGraphComponents(BaseModel):
+    chunks: list[ChunkGraph]
+
+def strict_json_schema(model: type) -> Dict[str, Any]:
+    """
+    JSON schema of a Pydantic model in the form strict structured outputs
+    accept: every object closed (additionalProperties false) with all of its
+    properties required
+    """
+    schema = model.model_json_schema()
+
+    def close(node: Dict[str, Any]) -> None:
+        if node.get("type") == "object":
+            node["additionalProperties"] = False
+            node["required"] = list(node.get("properties", {}))
+        node.pop("title", None)
+        for key, value in node.items():
+            # properties/$defs map names to schemas; other values are a schema or a list of them
+            if key in ("properties", "$defs"):
+                children = list(value.values())
+            elif isinstance(value, list):
+                children = value
+            else:
+                children = [value]
+            for child in children:
+                if isinstance(child, dict):
+                    close(child)
+
+    close(schema)
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": model.__name__, "strict": True, "schema": schema},
+    }
+
 def openai_llm_parser(prompt: str) -> GraphComponents:
-    completion = client.chat.completions.create(
-        model="gpt-4o-2024-08-06",
+    completion = get_client().chat.completions.create(
+        model=EXTRACTION_MODEL,
         response_format={"type": "json_object"},
         messages=[
             {
@@ -50,4 +113,108 @@ def openai_llm_parser(prompt: str) -> GraphComponents:
         ]
     )
     
-    return GraphComponents.model_validate_json(completion.choices[0].message.content)
\ No newline at end of file
+    return GraphComponents.model_validate_json(completion.choices[0].message.content)
+
+
+PACKED_SYSTEM_PROMPT = """ You are a precise graph relationship extractor. The user message
+    contains several chunks, each starting with a CHUNK_ID line. Extract all
+    relationships (node, target_node, relationship) from each chunk
+    separately, including implicit ones, and return exactly one entry per
+    CHUNK_ID (with an empty graph if a chunk has no relationships). Be
+    thorough and precise. """
+
+
+def _chunk_block(chunk: Dict) -> str:
+    return f"CHUNK_ID: {chunk['id']}\nSECTION: {chunk['section']}\nTEXT:\n{chunk['text']}"
+
+
+def pack_chunks(chunks: List[Dict], max_tokens: int = DEFAULT_PACK_TOKENS) -> List[List[Dict]]:
+    """
+    Group consecutive chunks into packs of at most max_tokens prompt tokens
+    (a chunk larger than the budget gets a pack of its own)
+    """
+    packs: List[List[Dict]] = []
+    current: List[Dict] = []
+    used = 0
+    for chunk in chunks:
+        tokens = count_tokens(_chunk_block(chunk))
+        if current and used + tokens > max_tokens:
+            packs.append(current)
+            current, used = [], 0
+        current.append(chunk)
+        used += tokens
+    if current:
+        packs.append(current)
+    return packs
+
+
+def openai_packed_parser(chunks: List[Dict], file_id: Optional[str] = None) -> Dict[str, List[single]]:
+    """
+    One structured-output call for several chunks
+
+    Returns:
+        Relationships per chunk id, for the chunks whose entry in the response
+        validated; missing, duplicated or malformed entries are left out so the
+        caller can retry just those chunks
+    """
+    header = f"FILE_ID: {file_id}\n\n" if file_id is not None else ""
+    completion = get_client().chat.completions.create(
+        model=EXTRACTION_MODEL,
+        response_format=strict_json_schema(PackedGraphComponents),
+        messages=[
+            {"role": "system", "content": PACKED_SYSTEM_PROMPT},
+            {"role": "user", "content": header + "\n\n".join(_chunk_block(c) for c in chunks)},
+        ],
+    )
+    expected = {chunk["id"] for chunk in chunks}
+    entries = json.loads(completion.choices[0].message.content).get("chunks", [])
+
+    parsed: Dict[str, List[single]] = {}
+    duplicated = set()
+    for entry in entries:
+        try:
+            chunk_graph = ChunkGraph.model_validate(entry)
+        except ValidationError as e:
+            logger.warning(f"Dropping malformed chunk entry ({e.error_count()} errors)")
+            continue
+        if chunk_graph.chunk_id not in expected:
+            continue
+        if chunk_graph.chunk_id in parsed:
+            duplicated.add(chunk_graph.chunk_id)
+        parsed[chunk_graph.chunk_id] = chunk_graph.graph
+    for chunk_id in duplicated:
+        del parsed[chunk_id]
+    return parsed
+
+
+def extract_graph_packed(
+    chunks: List[Dict],
+    file_id: Optional[str] = None,
+    max_tokens: int = DEFAULT_PACK_TOKENS,
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+) -> Dict[str, Any]:
+    """
+    Extract relationships for all chunks with as few calls as the token
+    budget allows, retrying only the chunks whose output failed
+
+    Returns:
+        {"graphs": {chunk_id: [single, ...]}, "calls": int, "failed": [chunk_id, ...]}
+    """
+    graphs: Dict[str, List[single]] = {}
+    pending = list(chunks)
+    calls = 0
+    for attempt in range(max_attempts):
+        if not pending:
+            break
+        for pack in pack_chunks(pending, max_tokens):
+            calls += 1
+            try:
+                graphs.update(openai_packed_parser(pack, file_id))
+            except BudgetExceeded:
+                raise
+            except Exception as e:  # API error or unparseable response: the whole pack failed
+                logger.warning(f"Packed extraction of {len(pack)} chunks failed (attempt {attempt + 1}): {e}")
+        pending = [chunk for chunk in pending if chunk["id"] not in graphs]
+    if pending:
+        logger.error(f"Graph extraction failed for chunks {[c['id'] for c in pending]}")
+    return {"graphs": graphs, "calls": calls, "failed": [chunk["id"] for chunk in pending]}
@@ -1,19 +1,23 @@
 import os
 import streamlit as st
 from dotenv import load_dotenv
-from docx import Document
-import pdfplumber
 import json
 import sys
 import asyncio
+import hashlib
+from datetime import datetime
 from pathlib import Path
-from openai import OpenAI, AzureOpenAI
-from ragas.llms import llm_factory
 
 
+# rag_eval modules are imported by their bare names, as they import each
+# other, so the process holds one instance of each (one gateway, one ledger)
 PROJECT_ROOT = Path(__file__).resolve().parent.parent 
-sys.path.insert(0, str(PROJECT_ROOT))
-from rag_eval.evals import run_evaluation_from_qa
+sys.path.insert(0, str(PROJECT_ROOT / "rag_eval"))
+from evals import build_rag_client, run_evaluation_from_qa
+from qa_engine import QAGenerationEngine
+from document_text import extract_text
+from cost_ledger import BudgetExceeded, cost_scope, get_ledger
+from llm_gateway import get_gateway, model_for
 
 #load environment variables and keys
 load_dotenv()
@@ -23,31 +27,16 @@ azure_endpoint = os.getenv("AZURE_ENDPOINT")
 azure_api_key = os.getenv("OPEN_AI_AZURE_KEY")
 deployment_name = "rag-pipeline-openai"
 
-client = AzureOpenAI(
-    api_version="2024-12-01-preview",
-    azure_endpoint=azure_endpoint,
-    api_key=azure_api_key,
-    azure_deployment="gpt-4o"
-)
-
-#open ai intialization for the llm to evaluate the q/a pairs
-# Add the current directory to the path so we can import rag module when run as a script
-sys.path.insert(0, str(Path(__file__).parent))
-from rag import default_rag_client
-
-openai_client = AzureOpenAI(
-    api_version="2024-12-01-preview",
-    azure_endpoint=azure_endpoint,
-    api_key=azure_api_key,
-    azure_deployment="gpt-4o"
-)
-
-rag_client = default_rag_client(llm_client=openai_client)
-llm = llm_factory("gpt-4o", client=openai_client)
+# Streamlit reruns this script on every interaction: clients and indexes are
+# cached resources (one per server process), extracted text and generated
+# Q/A pairs are cached data keyed by the file's content hash
+@st.cache_resource(show_spinner=False)
+def get_qa_client():
+    return get_gateway().client_for("qa_generation", "azure")
 
 #function that sends prompt to llm to create the q/a pairs 
 #prompt parameter can be used to customize the behavior of the llm and the returned q/a pairs
-def openai_qa_parser(text: str, prompt = '') -> dict:
+def openai_qa_parser(text: str, prompt = '', num_pairs: int = 10) -> dict:
     """
     Generate Q/A pairs from the input text using OpenAI.
     Returns a dict like:
@@ -58,14 +47,14 @@ def openai_qa_parser(text: str, prompt = '') -> dict:
         ]
     }
     """
-    completion = client.chat.completions.create(
-        model="gpt-4o-2024-08-06",
+    completion = get_qa_client().chat.completions.create(
+        model=model_for("qa", "gpt-4o-2024-08-06"),
         response_format={"type": "json_object"},
         messages=[
             {
                 "role": "system",
                 "content": 
-                    f"""You are an AI that generates 10 total clear question/answer pairs 
+                    f"""You are an AI that generates {num_pairs} total clear question/answer pairs 
                     based on the given text. 
                     {prompt}
                     For each meaningful piece of information 
@@ -87,19 +76,34 @@ def openai_qa_parser(text: str, prompt = '') -> dict:
     
     return completion.choices[0].message.content
 
-#function to extract text from different file types
-#this is to get the text information of the file passed and send this to the llm for q/a pair generation
-def extract_text(file_path):
-    """Extract text from TXT, PDF, or DOCX files."""
-    if file_path.endswith(".txt"):
-        return open(file_path, "r", encoding="utf-8").read()
-    elif file_path.endswith(".pdf"):
-        with pdfplumber.open(file_path) as pdf:
-            return "\n".join(page.extract_text() or "" for page in pdf.pages)
-    elif file_path.endswith(".docx"):
-        doc = Document(file_path)
-        return "\n".join([p.text for p in doc.paragraphs])
-    return ""
+#one engine per server process so its chunk cache survives reruns
+@st.cache_resource(show_spinner=False)
+def get_qa_engine():
+    return QAGenerationEngine(
+        lambda text, prompt, num_pairs: openai_qa_parser(text, prompt=prompt, num_pairs=num_pairs),
+        max_workers=int(os.getenv("QA_MAX_WORKERS", "8")),
+        # The LLM gateway already enforces the endpoint's rate limits
+        requests_per_minute=float(os.getenv("QA_REQUESTS_PER_MINUTE", "0")),
+    )
+
+@st.cache_resource(show_spinner="Loading document index...")
+def get_rag_index(corpus_key: str, _documents: tuple):
+    """RAG client over the uploaded documents; corpus_key is the hash of their contents"""
+    return build_rag_client(list(_documents))
+
+def content_hash(data) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def corpus_hash(texts) -> str:
+    digest = hashlib.sha256()
+    for text in texts:
+        digest.update(hashlib.sha256(text.encode("utf-8")).digest())
+    return digest.hexdigest()
+
+@st.cache_data(show_spinner=False)
+def extract_text_cached(file_hash: str, _file_path: str) -> str:
+    """extract_text, memoized on the file's content hash"""
+    return extract_text(_file_path)
 
 #function to save the uploaded document and update the document index
 DOC_INDEX_FILE = "./data/document_index.json"
@@ -138,6 +142,18 @@ def output_qa_pairs(qa_results):
         except Exception as e:
             st.warning(f"Failed to parse Q/A for document {doc['document_name']}: {e}")
 
+#function to show what a run's llm calls consumed, from the cost ledger summary
+def output_cost_summary(summary, title):
+    total = summary["total"]
+    st.markdown(f"**{title}:** {total['tokens']:,} tokens, ${total['cost_usd']:.4f} ({total['requests']} calls)")
+    with st.expander("Cost breakdown"):
+        for label, key in (("Operation", "by_operation"), ("Model", "by_model"), ("Document", "by_document")):
+            st.markdown(f"By {label.lower()}")
+            st.dataframe(
+                [{label: name, **totals} for name, totals in summary[key].items()],
+                use_container_width=True,
+            )
+
 def main():
     st.set_page_config(layout="wide")
     st.title("RAG Evaluation Script")
@@ -147,6 +163,8 @@ def main():
         st.session_state.qa_results = []
     if "eval_results" not in st.session_state:
         st.session_state.eval_results = None
+    if "qa_cost" not in st.session_state:
+        st.session_state.qa_cost = None
 
     # ---------------- Sidebar: Upload & Prompt ----------------
     st.sidebar.subheader("Upload Documents for Q/A Pairs")
@@ -188,29 +206,55 @@ def main():
             os.makedirs(upload_dir, exist_ok=True)
             st.session_state.qa_results = []
 
+            documents = []
             for file in uploaded_files:
                 file_path = save_uploaded_document(file)
-                with open(file_path, 'wb') as f:
-                    f.write(file.getbuffer())
+                file_hash = content_hash(file.getbuffer())
 
                 with st.spinner(f"Extracting text from {file.name}..."):
-                    text = extract_text(file_path)
+                    text = extract_text_cached(file_hash, file_path)
 
                 if not text.strip():
                     st.warning(f"No text found in {file.name}")
                     continue
 
-                with st.spinner(f"Generating Q/A pairs for {file.name}..."):
-                    qa_json = openai_qa_parser(text, prompt=qa_type_prompt_text)
-
+                documents.append({"document_name": file.name, "text": text})
                 st.session_state.qa_results.append({
                     "document_name": file.name,
                     "qa_type": qa_type_prompt,  # Store type for display
-                    "qa_pairs": qa_json,
+                    "qa_pairs": json.dumps({"qa_pairs": []}),
                     "text": text
                 })
 
-            st.success("Q/A generation completed!")
+            # all chunks of all files are generated concurrently; each result is
+            # merged into its document's entry as soon as it arrives. Entries are
+            # matched by upload position, as two uploads may share a file name
+            progress = st.sidebar.progress(0.0, text="Generating Q/A pairs...")
+            entries = st.session_state.qa_results
+            pairs = [[] for _ in entries]
+            failed = total = 0
+            budget_errors = []
+            run = f"qa_{datetime.now():%Y%m%d_%H%M%S_%f}"
+            with cost_scope(run=run):
+                for done, result in enumerate(get_qa_engine().generate(documents, qa_type_prompt_text), 1):
+                    total = result.total_chunks
+                    if result.error:
+                        failed += 1
+                        if result.budget_exceeded:
+                            budget_errors.append(result.error)
+                    pairs[result.document_index].extend(result.pairs)
+                    entries[result.document_index]["qa_pairs"] = json.dumps(
+                        {"qa_pairs": pairs[result.document_index]}
+                    )
+                    progress.progress(done / total, text=f"Generated {done}/{total} chunks")
+            st.session_state.qa_cost = get_ledger().summary(run)
+
+            if budget_errors:
+                st.error(f"Q/A generation stopped by the token budget: {budget_errors[0]}")
+            if failed:
+                st.warning(f"Q/A generation failed for {failed} of {total} chunks")
+            if not budget_errors:
+                st.success("Q/A generation completed!")
 
     # ---------------- Main Area: Display Q/A Pairs ----------------
     st.subheader("Q/A Pairs from Uploaded Documents")
@@ -220,6 +264,8 @@ def main():
             output_qa_pairs([doc])
     else:
         st.info("Upload documents to see Q/A pairs here.")
+    if st.session_state.qa_cost is not None:
+        output_cost_summary(st.session_state.qa_cost, "Q/A generation cost")
 
     # ---------------- Evaluation ----------------
     if st.button('Run Evaluation'):
@@ -228,16 +274,27 @@ def main():
         else:
             with st.spinner("Running Evaluation..."):
                 uploaded_texts = [doc["text"] for doc in st.session_state.qa_results if doc.get("text")]
-                rag_client.set_documents(uploaded_texts)
-
-                st.session_state.eval_results = asyncio.run(
-                    run_evaluation_from_qa(st.session_state.qa_results, documents=uploaded_texts)
+                rag_index = (
+                    get_rag_index(corpus_hash(uploaded_texts), tuple(uploaded_texts))
+                    if uploaded_texts
+                    else None
                 )
-            st.success("Evaluation completed!")
+
+                try:
+                    st.session_state.eval_results = asyncio.run(
+                        run_evaluation_from_qa(
+                            st.session_state.qa_results, documents=uploaded_texts, rag_client=rag_index
+                        )
+                    )
+                    st.success("Evaluation completed!")
+                except BudgetExceeded as e:
+                    st.error(f"Evaluation stopped by the token budget: {e}")
 
     # ---------------- Display Evaluation Table ----------------
     if st.session_state.eval_results is not None:
         st.subheader("Evaluation Results")
+        if "cost" in st.session_state.eval_results.attrs:
+            output_cost_summary(st.session_state.eval_results.attrs["cost"], "Evaluation cost")
         st.dataframe(st.session_state.eval_results, use_container_width=True)
 
 
@@ -0,0 +1,256 @@
+"""
+Bulk Q/A pair generation for uploaded documents.
+
+Each document is split into sentence-aligned chunks of at most chunk_tokens
+tokens, every chunk becomes one LLM request, and all requests of an upload
+run concurrently on a thread pool behind a shared rate limiter. Results are
+yielded as requests complete, so the caller can grow its dataset (and UI)
+incrementally; questions that are near-duplicates of one already kept for the
+same document are dropped. Requests run in the caller's cost_scope (see
+rag_eval/cost_ledger.py), each attributed to its document.
+"""
+
+import contextvars
+import hashlib
+import json
+import logging
+import math
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# rag_eval modules are imported by their bare names, as they import each
+# other, so the process holds one instance of each (one gateway, one ledger)
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT / "rag_eval"))
+from context_budget import count_tokens
+from cost_ledger import BudgetExceeded, cost_scope
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_TOKENS = 3000
+DEFAULT_PAIRS_PER_DOCUMENT = 10
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+_WORD = re.compile(r"\w+")
+
+# generate_fn(text, prompt, num_pairs) -> JSON string {"qa_pairs": [...]}
+GenerateFn = Callable[[str, str, int], str]
+
+
+def chunk_text(text: str, max_tokens: int = DEFAULT_CHUNK_TOKENS) -> List[Tuple[str, int]]:
+    """
+    Split text into sentence-aligned chunks of at most max_tokens tokens
+
+    Returns:
+        (chunk text, token count) pairs; a single sentence longer than
+        max_tokens becomes its own chunk
+    """
+    boundaries = [m.end() for m in _SENTENCE_END.finditer(text)]
+    boundaries.append(len(text))
+
+    chunks = []
+    start = 0
+    sentence_start = 0
+    tokens = 0
+    for end in boundaries:
+        sentence_tokens = count_tokens(text[sentence_start:end])
+        if tokens and tokens + sentence_tokens > max_tokens:
+            chunks.append((text[start:sentence_start], tokens))
+            start = sentence_start
+            tokens = 0
+        tokens += sentence_tokens
+        sentence_start = end
+    if start < len(text):
+        chunks.append((text[start:], tokens))
+
+    return [(chunk, tokens) for chunk, tokens in chunks if chunk.strip()]
+
+
+class RateLimiter:
+    """Spaces calls at least 60 / requests_per_minute seconds apart, across threads"""
+
+    def __init__(self, requests_per_minute: float):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def _question_words(question: str) -> frozenset:
+    return frozenset(w.lower() for w in _WORD.findall(question))
+
+
+def is_near_duplicate(words: frozenset, seen: List[frozenset], threshold: float) -> bool:
+    """True if the word set's Jaccard similarity with any seen question reaches threshold"""
+    for other in seen:
+        union = len(words | other)
+        if union and len(words & other) / union >= threshold:
+            return True
+    return False
+
+
+@dataclass
+class ChunkResult:
+    """Outcome of one chunk request, as yielded by QAGenerationEngine.generate"""
+
+    document_name: str
+    document_index: int
+    chunk_index: int
+    num_chunks: int
+    total_chunks: int
+    pairs: List[Dict[str, str]] = field(default_factory=list)
+    duplicates_dropped: int = 0
+    cached: bool = False
+    error: Optional[str] = None
+    budget_exceeded: bool = False
+
+
+class QAGenerationEngine:
+    """
+    Generates Q/A pairs for many documents concurrently.
+
+    Chunk responses are cached in memory on (chunk hash, prompt, num_pairs), so
+    regenerating after an unrelated change only pays for new content.
+    """
+
+    def __init__(
+        self,
+        generate_fn: GenerateFn,
+        max_workers: int = 8,
+        requests_per_minute: float = 300,
+        chunk_tokens: int = DEFAULT_CHUNK_TOKENS,
+        pairs_per_document: int = DEFAULT_PAIRS_PER_DOCUMENT,
+        dedup_threshold: float = 0.8,
+    ):
+        """
+        Args:
+            generate_fn: Called as generate_fn(text, prompt, num_pairs); returns
+                the LLM's JSON output ({"qa_pairs": [{"question", "answer"}]})
+            max_workers: Concurrent LLM requests
+            requests_per_minute: Request rate limit shared by all workers (0 disables)
+            chunk_tokens: Maximum tokens of document text per request
+            pairs_per_document: Pairs requested for a document, spread over its chunks
+            dedup_threshold: Question word-set Jaccard similarity above which a
+                pair is dropped as a near-duplicate
+        """
+        self.generate_fn = generate_fn
+        self.max_workers = max_workers
+        self.rate_limiter = RateLimiter(requests_per_minute)
+        self.chunk_tokens = chunk_tokens
+        self.pairs_per_document = pairs_per_document
+        self.dedup_threshold = dedup_threshold
+        self._cache: Dict[str, List[Dict[str, str]]] = {}
+        self._cache_lock = threading.Lock()
+
+    def plan(self, text: str) -> List[Tuple[str, int]]:
+        """
+        (chunk text, num_pairs) requests for one document
+
+        pairs_per_document is split over the chunks in proportion to their
+        tokens (largest remainder first, so leftover pairs go to the largest
+        chunks); chunks that get no pairs are not requested at all.
+        """
+        chunks = chunk_text(text, self.chunk_tokens)
+        total_tokens = sum(tokens for _, tokens in chunks) or 1
+        quotas = [self.pairs_per_document * tokens / total_tokens for _, tokens in chunks]
+        counts = [math.floor(quota) for quota in quotas]
+        by_remainder = sorted(
+            range(len(chunks)), key=lambda i: (-(quotas[i] - counts[i]), -chunks[i][1], i)
+        )
+        for i in by_remainder[: self.pairs_per_document - sum(counts)]:
+            counts[i] += 1
+        return [(chunk, count) for (chunk, _), count in zip(chunks, counts) if count > 0]
+
+    @staticmethod
+    def _cache_key(chunk: str, prompt: str, num_pairs: int) -> str:
+        payload = json.dumps([chunk, prompt, num_pairs])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _run_chunk(
+        self, document_name: str, chunk: str, prompt: str, num_pairs: int
+    ) -> Tuple[List[Dict[str, str]], bool]:
+        key = self._cache_key(chunk, prompt, num_pairs)
+        with self._cache_lock:
+            if key in self._cache:
+                return self._cache[key], True
+
+        self.rate_limiter.acquire()
+        with cost_scope(document=document_name):
+            output = self.generate_fn(chunk, prompt, num_pairs)
+        pairs = [
+            {"question": str(pair["question"]), "answer": str(pair["answer"])}
+            for pair in json.loads(output).get("qa_pairs", [])
+            if isinstance(pair, dict) and pair.get("question") and "answer" in pair
+        ]
+        with self._cache_lock:
+            self._cache[key] = pairs
+        return pairs, False
+
+    def generate(self, documents: List[Dict[str, str]], prompt: str = "") -> Iterator[ChunkResult]:
+        """
+        Generate Q/A pairs for all documents, yielding chunk results as they complete
+
+        Args:
+            documents: Dicts with "document_name" and "text"
+            prompt: Q/A type instructions passed to every request
+
+        Yields:
+            ChunkResult per chunk, in completion order; pairs are already
+            deduplicated against earlier results for the same document.
+            Results carry the document's position in documents, since two
+            uploads may share a name.
+        """
+        seen: List[List[frozenset]] = [[] for _ in documents]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {}
+            for doc_index, doc in enumerate(documents):
+                name = doc["document_name"]
+                requests = self.plan(doc["text"])
+                for index, (chunk, num_pairs) in enumerate(requests):
+                    # Worker threads do not inherit context variables (the cost scope)
+                    future = executor.submit(
+                        contextvars.copy_context().run, self._run_chunk, name, chunk, prompt, num_pairs
+                    )
+                    futures[future] = (name, doc_index, index, len(requests))
+
+            for future in as_completed(futures):
+                name, doc_index, index, num_chunks = futures[future]
+                result = ChunkResult(
+                    document_name=name,
+                    document_index=doc_index,
+                    chunk_index=index,
+                    num_chunks=num_chunks,
+                    total_chunks=len(futures),
+                )
+                try:
+                    pairs, result.cached = future.result()
+                except Exception as e:
+                    logger.warning(f"Q/A generation failed for {name} chunk {index}: {e}")
+                    result.error = str(e)
+                    result.budget_exceeded = isinstance(e, BudgetExceeded)
+                    yield result
+                    continue
+
+                for pair in pairs:
+                    words = _question_words(pair["question"])
+                    if is_near_duplicate(words, seen[doc_index], self.dedup_threshold):
+                        result.duplicates_dropped += 1
+                        continue
+                    seen[doc_index].append(words)
+                    result.pairs.append(pair)
+                yield result
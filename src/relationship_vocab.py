@@ -0,0 +1,171 @@
+"""
+Bounded vocabulary of Neo4j relationship types.
+
+The extraction LLM describes relationships in free text ("worked at",
+"Employed By", "is employed at"). Turning each phrase into its own
+relationship type grows the schema without bound, and because a type can
+only be written into the query text (not passed as a parameter), every new
+type is also a new query for the server to plan.
+
+map_relationship() maps a phrase onto RELATIONSHIP_VOCAB: words are
+lowercased and crudely stemmed, and the longest trigger phrase found in the
+relation as whole words picks the type ("ledger" does not contain "led"). Anything unmatched becomes OTHER; the original
+phrase is always kept in the relationship's label property. The set of
+query texts is therefore fixed (one per type, see relationship_query), so
+Neo4j plans each once and reuses the cached plan.
+"""
+
+import re
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+OTHER = "OTHER"
+
+# type -> trigger phrases, matched as whole stemmed words (longest trigger
+# wins); word forms the stemmer does not fold together are listed separately
+RELATIONSHIP_VOCAB: Dict[str, Tuple[str, ...]] = {
+    "WORKS_FOR": (
+        "work for", "work at", "employ", "employee", "employer", "employment", "hire", "join",
+        "intern at", "contract for", "contractor",
+    ),
+    "HAS_ROLE": ("role", "position", "title", "serve as", "act as", "work as", "job"),
+    "STUDIED_AT": (
+        "study", "study at", "student", "attend", "graduate", "graduate from", "enroll",
+        "alumnus", "alumni", "educated at",
+    ),
+    "HAS_DEGREE": ("degree", "major", "bachelor", "master", "phd", "diploma", "earn"),
+    "HAS_SKILL": (
+        "skill", "proficient", "proficiency", "expert", "expertise", "know", "knowledge",
+        "experience", "familiar", "fluent", "speak",
+    ),
+    "USES": (
+        "use", "used", "using", "utilize", "leverage", "program in", "build with", "built with",
+        "develop with", "tool", "technology",
+    ),
+    "WORKED_ON": (
+        "work on", "contribute", "contributor", "develop", "build", "built", "implement", "design",
+        "create", "project",
+    ),
+    "MANAGES": (
+        "manage", "manager", "lead", "led", "supervise", "supervisor", "oversee", "oversaw", "overseen",
+        "direct", "director", "head",
+    ),
+    # "<MANAGES verb> by" ("managed by", "headed by") is added below as the passive form
+    "REPORTS_TO": ("report to",),
+    "LOCATED_IN": ("located", "based in", "live in", "headquartered", "office in", "reside"),
+    "PART_OF": ("part of", "member of", "belong", "division of", "subsidiary", "team"),
+    "CERTIFIED_IN": (
+        "certified", "certification", "certificate", "license", "licensed", "accredited", "accreditation",
+    ),
+    "ACHIEVED": (
+        "award", "win", "winning", "won", "receive", "achieve", "achievement", "honor", "recognize",
+        "recognition",
+    ),
+    "PUBLISHED": ("publish", "author", "write", "wrote", "written", "present", "presentation"),
+    "COLLABORATES_WITH": (
+        "collaborate", "collaborator", "collaboration", "partner", "work with", "coauthor", "co author",
+    ),
+}
+
+# A single-word trigger of the key type followed by "by" is the value type:
+# "X directed by Y" means X reports to Y. Passive triggers are two words long,
+# so they are tried before the active verb.
+PASSIVE_VOCAB: Dict[str, str] = {"MANAGES": "REPORTS_TO"}
+
+RELATIONSHIP_TYPES = tuple(RELATIONSHIP_VOCAB) + (OTHER,)
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def _stem(word: str) -> str:
+    """Strip common English suffixes so "worked"/"works"/"working" compare equal"""
+    if len(word) > 4 and word.endswith(("ied", "ies")):
+        return word[:-3] + "y"
+    for suffix in ("ing", "ed", "es", "s"):
+        if len(word) > len(suffix) + 2 and word.endswith(suffix):
+            word = word[: -len(suffix)]
+            break
+    # "graduate" / "graduated" -> "graduat"
+    if len(word) > 3 and word.endswith("e"):
+        word = word[:-1]
+    return word
+
+
+def _words(text: str) -> Tuple[str, ...]:
+    # "WORKS_AT" and "worksAt" -> "works at"
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text).lower()
+    return tuple(_stem(w) for w in _WORD.findall(text))
+
+
+def _trigger_words() -> List[Tuple[Tuple[str, ...], str]]:
+    triggers = {}
+    for rel_type, phrases in RELATIONSHIP_VOCAB.items():
+        for phrase in phrases:
+            words = _words(phrase)
+            triggers.setdefault(words, rel_type)
+            if len(words) == 1 and rel_type in PASSIVE_VOCAB:
+                triggers.setdefault(words + ("by",), PASSIVE_VOCAB[rel_type])
+    return list(triggers.items())
+
+
+# (trigger words, type), longest trigger first
+_TRIGGERS: List[Tuple[Tuple[str, ...], str]] = sorted(
+    _trigger_words(), key=lambda item: (-len(item[0]), -len("".join(item[0])))
+)
+
+
+def _contains(words: Tuple[str, ...], trigger: Tuple[str, ...]) -> bool:
+    """trigger occurs as consecutive whole words"""
+    n = len(trigger)
+    return any(words[i : i + n] == trigger for i in range(len(words) - n + 1))
+
+
+@lru_cache(maxsize=4096)
+def map_relationship(relation: str) -> str:
+    """Vocabulary type of a free-text relationship, or OTHER"""
+    words = _words(relation)
+    for trigger, rel_type in _TRIGGERS:
+        if _contains(words, trigger):
+            return rel_type
+    return OTHER
+
+
+@lru_cache(maxsize=None)
+def relationship_query(rel_type: str) -> str:
+    """
+    Batched MERGE for one relationship type: $rows is a list of
+    {node, target_node, node_alias, target_node_alias, label, chunk_id,
+    file_id, section}. OTHER relationships are also keyed by label, so
+    unrelated free-text relations between the same nodes stay separate.
+    """
+    if rel_type not in RELATIONSHIP_TYPES:
+        raise ValueError(f"Unknown relationship type: {rel_type}")
+    key = " {label: row.label}" if rel_type == OTHER else ""
+    return f"""
+    UNWIND $rows AS row
+    MERGE (a:Entity {{name: row.node}})
+    SET a.aliases = CASE WHEN row.node_alias IN coalesce(a.aliases, []) THEN a.aliases
+                         ELSE coalesce(a.aliases, []) + row.node_alias END
+    MERGE (b:Entity {{name: row.target_node}})
+    SET b.aliases = CASE WHEN row.target_node_alias IN coalesce(b.aliases, []) THEN b.aliases
+                         ELSE coalesce(b.aliases, []) + row.target_node_alias END
+    MERGE (a)-[r:{rel_type}{key}]->(b)
+    SET r.label = row.label, r.chunk_id = row.chunk_id, r.file_id = row.file_id, r.section = row.section
+    """
+
+
+def group_by_type(rels: List[Dict]) -> Dict[str, List[Dict]]:
+    """Query rows per vocabulary type, in first-seen type order"""
+    groups: Dict[str, List[Dict]] = {}
+    for rel in rels:
+        groups.setdefault(map_relationship(rel["relationship"]), []).append({
+            "node": rel["node"],
+            "target_node": rel["target_node"],
+            "node_alias": rel.get("node_alias", rel["node"]),
+            "target_node_alias": rel.get("target_node_alias", rel["target_node"]),
+            "label": rel["relationship"],
+            "chunk_id": rel["chunk_id"],
+            "file_id": rel["file_id"],
+            "section": rel["section"],
+        })
+    return groups
@@ -4,6 +4,7 @@ from typing import Dict, List, Optional
 import os
 from crawlers.wiki_crawler import crawl_wiki
 from crawlers.sharepoint_crawler import SharePointCrawler
+from dedup import NearDuplicateDetector
 import requests
 from datetime import datetime
 
@@ -51,6 +52,7 @@ with tab1:
     wiki_url = st.text_input("Wiki Root URL", "https://wiki.example.com/page")
     wiki_depth = st.number_input("Max Depth", min_value=0, max_value=5, value=1)
     wiki_max = st.number_input("Max Pages", min_value=1, max_value=1000, value=100)
+    wiki_dedup = st.checkbox("Flag near-duplicate pages", value=True)
     
     if st.button("Crawl Wiki"):
         with st.spinner("Crawling wiki pages..."):
@@ -59,15 +61,19 @@ with tab1:
                 if wiki_cookie:
                     session.headers.update({"Cookie": wiki_cookie})
                     
+                dedup = NearDuplicateDetector() if wiki_dedup else None
                 results = crawl_wiki(
                     wiki_url,
                     session=session,
                     max_depth=wiki_depth,
-                    max_pages=wiki_max
+                    max_pages=wiki_max,
+                    dedup=dedup
                 )
                 
                 st.session_state["wiki_results"] = results
                 st.success(f"Found {len(results)} pages")
+                if dedup is not None and dedup.report.duplicates:
+                    st.info(dedup.report.summary())
                 
             except Exception as e:
                 st.error(f"Error: {str(e)}")
@@ -99,6 +105,8 @@ with tab1:
                                     st.error(f"Failed to load: HTTP {resp.status_code}")
                             except Exception as e:
                                 st.error(f"Error loading content: {str(e)}")
+                elif doc["status"] == "duplicate":
+                    st.info(f"Near-duplicate of {doc['duplicate_of']} (similarity {doc['similarity']:.2f})")
                 else:
                     st.warning(doc["snippet"])
 
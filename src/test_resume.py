@@ -1,7 +1,7 @@
 import re
 from typing import List, Dict
 
-from graph_parse import openai_llm_parser
+from graph_parse import extract_graph_packed, openai_llm_parser
 
 def chunk_resume_text(text: str, file_id: str) -> List[Dict]:
     """
@@ -28,24 +28,38 @@ def chunk_resume_text(text: str, file_id: str) -> List[Dict]:
     
     return chunks
 
-def extract_graph_from_resume(text: str, file_id: str):
+def extract_graph_from_resume(text: str, file_id: str, mode: str = "packed"):
+    """
+    Extract relationships from every section of a resume.
+
+    mode "packed" sends several sections per structured-output call (up to a
+    token budget) and retries only sections whose output failed; "per_chunk"
+    makes one free-form JSON call per section.
+    """
     chunks = chunk_resume_text(text, file_id)
     all_relationships = []
 
-    for chunk in chunks:
-        prompt = f"""
-        FILE_ID: {file_id}
-        CHUNK_ID: {chunk['id']}
-        SECTION: {chunk['section']}
+    if mode == "packed":
+        graphs = extract_graph_packed(chunks, file_id)["graphs"]
+    elif mode == "per_chunk":
+        graphs = {}
+        for chunk in chunks:
+            prompt = f"""
+            FILE_ID: {file_id}
+            CHUNK_ID: {chunk['id']}
+            SECTION: {chunk['section']}
 
-        TEXT:
-        {chunk['text']}
-        """
+            TEXT:
+            {chunk['text']}
+            """
 
-        parsed = openai_llm_parser(prompt)
+            graphs[chunk["id"]] = openai_llm_parser(prompt).graph
+    else:
+        raise ValueError(f"Unknown extraction mode: {mode}")
 
-        # Attach provenance client-side
-        for rel in parsed.graph:
+    # Attach provenance client-side
+    for chunk in chunks:
+        for rel in graphs.get(chunk["id"], []):
             all_relationships.append({
                 "node": rel.node,
                 "target_node": rel.target_node,
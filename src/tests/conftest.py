@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# src modules import each other (and rag_eval's) by bare name
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,47 @@
+import numpy as np
+
+import dedup
+from dedup import MinHasher, NearDuplicateDetector, dedup_documents, shingles
+
+
+def article(seed, words=300):
+    rng = np.random.default_rng(seed)
+    vocabulary = [f"w{i}" for i in range(5000)]
+    return " ".join(rng.choice(vocabulary, size=words))
+
+
+def test_signature_in_blocks_equals_dense_minimum(monkeypatch):
+    hasher = MinHasher()
+    hashes = shingles(article(1, words=3000))
+    monkeypatch.setattr(dedup, "SIGNATURE_BLOCK", len(hashes) + 1)
+    dense = hasher.signature(hashes)
+    monkeypatch.setattr(dedup, "SIGNATURE_BLOCK", 7)
+    assert np.array_equal(hasher.signature(hashes), dense)
+
+
+def test_empty_text_signature():
+    hasher = MinHasher(num_perm=16)
+    assert (hasher.signature(shingles("")) == np.uint64((1 << 32) - 1)).all()
+
+
+def test_exact_and_near_duplicates_are_detected():
+    detector = NearDuplicateDetector()
+    base = article(2)
+    assert detector.check("a", base) is None
+    assert detector.check("b", "  " + base.replace(" ", "\n")) == ("a", 1.0)
+    near = detector.check("c", base + " footer links home about")
+    assert near is not None and near[0] == "a"
+    assert detector.check("d", article(3)) is None
+
+
+def test_dedup_documents_keeps_first_and_reports_tokens():
+    base = article(4)
+    docs = [
+        {"filename": "one.txt", "text": base},
+        {"filename": "two.txt", "text": article(5)},
+        {"filename": "copy.txt", "text": base},
+    ]
+    kept, report = dedup_documents(docs)
+    assert [d["filename"] for d in kept] == ["one.txt", "two.txt"]
+    assert report.to_dict()["pairs"] == [{"key": "copy.txt", "duplicate_of": "one.txt", "similarity": 1.0}]
+    assert report.skipped_tokens > 0
@@ -0,0 +1,127 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from entity_resolution import EntityResolver, normalize_name
+
+
+@pytest.fixture
+def resolver():
+    resolver = EntityResolver(":memory:")
+    yield resolver
+    resolver.close()
+
+
+@pytest.mark.parametrize(
+    "name, normalized",
+    [
+        ("The Intel Corp.", "intel"),
+        ("Café Ltd", "cafe"),
+        ("AT&T Inc.", "at and t"),
+        ("C++", "c++"),
+        ("C#", "c#"),
+        (".NET", ".net"),
+        ("Node.js", "node.js"),
+    ],
+)
+def test_normalize_name(name, normalized):
+    assert normalize_name(name) == normalized
+
+
+def test_spellings_of_one_entity_merge(resolver):
+    assert resolver.resolve("Intel") == "Intel"
+    assert resolver.resolve("Intel Corporation") == "Intel"
+    assert resolver.resolve("the intel corp.") == "Intel"
+
+
+def test_names_differing_in_symbols_or_numbers_stay_apart(resolver):
+    names = ["C", "C++", "C#", ".NET", "NET", "Windows 10", "Windows 11"]
+    assert [resolver.resolve(name) for name in names] == names
+
+
+@pytest.mark.parametrize(
+    "names",
+    [
+        ["International Business Machines", "IBM"],
+        ["IBM", "International Business Machines"],
+    ],
+)
+def test_acronym_resolves_in_either_order(resolver, names):
+    first, second = names
+    assert resolver.resolve(first) == first
+    assert resolver.resolve(second) == first
+    assert resolver.stats() == {"aliases": 2, "entities": 1}
+
+
+def test_lowercase_short_name_is_not_an_acronym(resolver):
+    resolver.resolve("ibm")
+    assert resolver.resolve("International Business Machines") == "International Business Machines"
+
+
+def test_relationships_between_aliases_are_dropped(resolver):
+    rels = [
+        {"node": "Intel", "target_node": "Intel Corporation", "relationship": "OWNS"},
+        {"node": "Intel Corp", "target_node": "AMD", "relationship": "COMPETES_WITH"},
+    ]
+    resolved = resolver.resolve_relationships(rels)
+    assert resolved == [{
+        "node": "Intel",
+        "target_node": "AMD",
+        "relationship": "COMPETES_WITH",
+        "node_alias": "Intel Corp",
+        "target_node_alias": "AMD",
+    }]
+
+
+def test_aliases_survive_reopening(tmp_path):
+    path = str(tmp_path / "aliases.sqlite")
+    resolver = EntityResolver(path)
+    resolver.resolve("IBM")
+    resolver.flush()
+    resolver.close()
+
+    reopened = EntityResolver(path)
+    assert reopened.resolve("International Business Machines") == "IBM"
+    reopened.close()
+
+
+def test_gray_zone_names_are_embedded_outside_the_lock_and_cached(tmp_path):
+    path = str(tmp_path / "aliases.sqlite")
+    calls = []
+
+    def embed(names):
+        calls.append((list(names), resolver._lock.locked()))
+        return [[1.0, 0.0] for _ in names]
+
+    resolver = EntityResolver(path, embed_fn=embed)
+    assert resolver.resolve("Microsoft Azure") == "Microsoft Azure"
+    assert resolver.resolve("Microsoft Azure Cloud") == "Microsoft Azure"
+    assert calls == [(["microsoft azure cloud", "microsoft azure"], False)]
+    resolver.close()
+
+    calls.clear()
+    resolver = EntityResolver(path, embed_fn=embed)
+    assert resolver.resolve("Microsoft Azure Cloud Services") == "Microsoft Azure"
+    assert calls == [(["microsoft azure cloud services"], False)]
+    resolver.close()
+
+
+def test_names_resolve_while_another_is_embedded():
+    started, release = threading.Event(), threading.Event()
+
+    def embed(names):
+        started.set()
+        release.wait(5)
+        return [[1.0, 0.0] for _ in names]
+
+    resolver = EntityResolver(":memory:", embed_fn=embed)
+    resolver.resolve("Microsoft Azure")
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(resolver.resolve, "Microsoft Azure Cloud")
+        assert started.wait(5)
+        assert resolver.resolve("Intel") == "Intel"
+        assert not future.done()
+        release.set()
+        assert future.result() == "Microsoft Azure"
+    resolver.close()
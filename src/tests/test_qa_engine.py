@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from qa_engine import QAGenerationEngine, chunk_text
+
+
+def sentences(n, words=20):
+    return " ".join(f"Sentence {i} " + "filler " * words + "end." for i in range(n))
+
+
+def engine(**kwargs):
+    return QAGenerationEngine(lambda text, prompt, n: "{}", requests_per_minute=0, **kwargs)
+
+
+@pytest.mark.parametrize("num_sentences", [1, 5, 40, 200])
+def test_plan_never_requests_more_than_pairs_per_document(num_sentences):
+    qa = engine(chunk_tokens=60, pairs_per_document=10)
+    plan = qa.plan(sentences(num_sentences))
+    assert sum(n for _, n in plan) == 10
+    assert all(n > 0 for _, n in plan)
+
+
+def test_plan_gives_pairs_to_largest_chunks_when_chunks_outnumber_pairs():
+    qa = engine(chunk_tokens=60, pairs_per_document=3)
+    text = sentences(30)
+    chunks = chunk_text(text, 60)
+    plan = qa.plan(text)
+    assert len(chunks) > 3
+    assert len(plan) == 3
+    tokens = dict(chunks)
+    planned = dict(plan)
+    smallest_kept = min(tokens[chunk] for chunk in planned)
+    assert all(n <= smallest_kept for chunk, n in chunks if chunk not in planned)
+
+
+def test_plan_is_proportional_to_chunk_size():
+    qa = engine(chunk_tokens=10_000, pairs_per_document=10)
+    assert qa.plan(sentences(5)) == [(sentences(5), 10)]
+
+
+def test_generate_yields_pairs_and_caches_chunks():
+    calls = []
+
+    def generate(text, prompt, n):
+        calls.append(n)
+        return json.dumps({"qa_pairs": [{"question": f"What is {text[:12]} {i}?", "answer": "x"} for i in range(n)]})
+
+    qa = QAGenerationEngine(generate, requests_per_minute=0, chunk_tokens=60, pairs_per_document=4)
+    documents = [{"document_name": "a", "text": sentences(10)}]
+    first = list(qa.generate(documents))
+    assert sum(calls) == 4
+    assert all(r.error is None for r in first)
+    second = list(qa.generate(documents))
+    assert all(r.cached for r in second)
+    assert sum(calls) == 4
+
+
+def test_documents_sharing_a_name_are_kept_apart():
+    def generate(text, prompt, n):
+        return json.dumps({"qa_pairs": [{"question": "What does the resume list?", "answer": text[:10]}]})
+
+    qa = QAGenerationEngine(generate, requests_per_minute=0, pairs_per_document=1)
+    documents = [{"document_name": "resume.pdf", "text": t} for t in ("First upload.", "Second upload.")]
+    results = sorted(qa.generate(documents), key=lambda r: r.document_index)
+    assert [r.document_index for r in results] == [0, 1]
+    assert [r.pairs[0]["answer"] for r in results] == ["First uplo", "Second upl"]
+    assert sum(r.duplicates_dropped for r in results) == 0
@@ -0,0 +1,54 @@
+import pytest
+
+from relationship_vocab import OTHER, RELATIONSHIP_TYPES, group_by_type, map_relationship, relationship_query
+
+
+@pytest.mark.parametrize(
+    "relation, rel_type",
+    [
+        # inflections and casing styles of one trigger
+        ("worked at", "WORKS_FOR"),
+        ("Employed By", "WORKS_FOR"),
+        ("WORKS_AT", "WORKS_FOR"),
+        ("worksAt", "WORKS_FOR"),
+        ("utilizing", "USES"),
+        ("leveraged", "USES"),
+        ("contributed to", "WORKED_ON"),
+        ("certified in", "CERTIFIED_IN"),
+        ("graduated from", "STUDIED_AT"),
+        ("STUDIED", "STUDIED_AT"),
+        ("HAS_EXPERIENCE_IN", "HAS_SKILL"),
+        ("manages", "MANAGES"),
+        ("leads", "MANAGES"),
+        # passive forms are the inverse relation
+        ("managed by", "REPORTS_TO"),
+        ("is supervised by", "REPORTS_TO"),
+        ("led by", "REPORTS_TO"),
+        ("directed by", "REPORTS_TO"),
+        ("headed by", "REPORTS_TO"),
+        ("reports to", "REPORTS_TO"),
+        # triggers only match whole words
+        ("ledger", OTHER),
+        ("user of", OTHER),
+        ("is a subsidiary of", "PART_OF"),
+        ("is a", OTHER),
+        ("", OTHER),
+    ],
+)
+def test_map_relationship(relation, rel_type):
+    assert map_relationship(relation) == rel_type
+
+
+def test_group_by_type_keeps_the_original_phrase():
+    rel = {"node": "Ann", "target_node": "Bob", "relationship": "headed by", "chunk_id": 1, "file_id": 2, "section": "s"}
+    groups = group_by_type([rel])
+    assert list(groups) == ["REPORTS_TO"]
+    assert groups["REPORTS_TO"][0]["label"] == "headed by"
+    assert groups["REPORTS_TO"][0]["node_alias"] == "Ann"
+
+
+def test_relationship_query_is_fixed_per_type():
+    assert all(f":{rel_type}" in relationship_query(rel_type) for rel_type in RELATIONSHIP_TYPES)
+    assert "{label: row.label}" in relationship_query(OTHER)
+    with pytest.raises(ValueError):
+        relationship_query("LIKES")